@@ -0,0 +1,278 @@
+# Libraries
+import pandas as pd
+
+import asyncio
+import aiohttp
+
+import json
+import os
+
+import yaml
+
+from UrlDefinition import UrlDefinition
+
+from RateLimiter import HostRateLimiter
+
+from RetryPolicy import RetryPolicy
+
+from StationLocator import StationLocator
+
+from TimeSeriesStore import TimeSeriesStore
+
+from Utils import Utils
+
+from WeatherData import WeatherAPI
+
+
+class AemetError(RuntimeError):
+    """
+    Error reported by AEMET in the 'estado' field of a response, with its status so the retry policy can classify it.
+    """
+
+    def __init__(self, status, description):
+        super().__init__(f"Error de AEMET {status}: {description}")
+        self.status = status
+        self.headers = None
+
+
+class AemetHarvester:
+    """
+    Concurrent downloader of AEMET daily climatological values for many stations and long periods.
+
+    Every station and period is split into windows accepted by the API. The two-step requests
+    (metadata and 'datos' URL) of all the windows run concurrently under a rate limit and the
+    results are written to the store of each station.
+    """
+
+    def __init__(self, store = None, window_days = None, max_concurrency = None, rate_per_second = None):
+        """
+        Initializes the harvester and loads configuration parameters.
+
+        Args:
+            store (TimeSeriesStore, optional): Store where the data is written. Defaults to the configured store.
+            window_days (int, optional): Days of each request. Defaults to the config value.
+            max_concurrency (int, optional): Maximum number of simultaneous requests. Defaults to the config value.
+            rate_per_second (float, optional): Maximum requests per second to the API. Defaults to the config value.
+        """
+        self.load_config()
+        self.obj_url = UrlDefinition()
+        self.func = Utils()
+        self.store = store or TimeSeriesStore()
+
+        aemet_config = self.config["AEMET"]
+        self.window_days = window_days or aemet_config["window_days"]
+        self.max_concurrency = max_concurrency or aemet_config["max_concurrency"]
+        self.rate_per_second = rate_per_second or aemet_config["rate_per_second"]
+        self.retry_policy = RetryPolicy.from_config(self.config["Retry"])
+
+        # The key is read once and shared by all the requests
+        self.api_key = self.func.read_api_key(self.config["DirResources"]["api_AEMET"])
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_windows(self, start_date, end_date):
+        """
+        Splits a period into the windows requested to the API.
+
+        Args:
+            start_date (str): First day of the period (format: 'YYYY-MM-DD').
+            end_date (str): Last day of the period (format: 'YYYY-MM-DD').
+
+        Returns:
+            list: Tuples with the first and last day of every window.
+        """
+        starts = pd.date_range(start = start_date, end = end_date, freq = f"{self.window_days}D")
+        ends = [min(start + pd.Timedelta(days = self.window_days - 1), pd.Timestamp(end_date)) for start in starts]
+
+        return [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in zip(starts, ends)]
+
+
+    def get_stations_near_plants(self, radius_km = 25, plants = None):
+        """
+        Returns the AEMET stations within a radius of the power plants.
+
+        Args:
+            radius_km (float, optional): Search radius in kilometres. Defaults to 25.
+            plants (pandas.DataFrame, optional): Plants with 'titulo', 'X' (latitude) and 'Y' (longitude). Defaults to the centrales catalog.
+
+        Returns:
+            list: Identifiers of the stations.
+        """
+        matches = StationLocator().nearest_to_plants(catalog = 'estaciones', radius_km = radius_km, plants = plants)
+
+        return matches['id'].drop_duplicates().tolist()
+
+
+    async def _get_json(self, session, semaphore, limiter, url, headers = None):
+        """
+        Downloads and decodes a JSON document under the concurrency and rate limits.
+
+        Args:
+            session (aiohttp.ClientSession): Shared session.
+            semaphore (asyncio.Semaphore): Limit of simultaneous requests.
+            limiter (HostRateLimiter): Rate limiter per host.
+            url (str): URL of the document.
+            headers (dict, optional): Headers of the request. Defaults to None.
+
+        Returns:
+            Any: Decoded document.
+        """
+        async with semaphore:
+            await limiter.acquire_async(url)
+
+            async with session.get(url, headers = headers) as response:
+                response.raise_for_status()
+
+                # The data files are served as ISO-8859-15 text
+                text = await response.text(encoding = 'ISO-8859-15')
+
+        return json.loads(text)
+
+
+    async def _fetch_window(self, session, semaphore, limiter, station, start_date, end_date):
+        """
+        Downloads the records of one station and window with the two-step AEMET flow.
+
+        Args:
+            session (aiohttp.ClientSession): Shared session.
+            semaphore (asyncio.Semaphore): Limit of simultaneous requests.
+            limiter (HostRateLimiter): Rate limiter per host.
+            station (str): Station identifier.
+            start_date (str): First day of the window.
+            end_date (str): Last day of the window.
+
+        Returns:
+            list: Records of the window, empty if the station has no data in it.
+        """
+        url = self.obj_url.get_url_AEMET_history_daily(start_date, end_date, station)
+        metadata = await self._get_json(session, semaphore, limiter, url, headers = {"api_key": self.api_key})
+
+        # AEMET reports the status inside the document, 404 when there is no data in the window
+        estado = metadata.get('estado')
+
+        if estado == 404:
+            return []
+
+        if estado != 200 or 'datos' not in metadata:
+            # Server failures (5xx) and quota errors (429) are retried, other statuses are not
+            status = int(estado) if str(estado).isdigit() else None
+            raise AemetError(status, metadata.get('descripcion'))
+
+        return await self._get_json(session, semaphore, limiter, metadata['datos'])
+
+
+    async def _harvest_window(self, session, semaphore, limiter, station, start_date, end_date):
+        """
+        Downloads one window, retrying it according to the retry policy.
+
+        Args:
+            session (aiohttp.ClientSession): Shared session.
+            semaphore (asyncio.Semaphore): Limit of simultaneous requests.
+            limiter (HostRateLimiter): Rate limiter per host.
+            station (str): Station identifier.
+            start_date (str): First day of the window.
+            end_date (str): Last day of the window.
+
+        Returns:
+            tuple: Station, window and records, or None as records if the download failed.
+        """
+        try:
+            records = await self.retry_policy.call_async(self._fetch_window, session, semaphore, limiter, station, start_date, end_date)
+        except Exception as e:
+            print(f"Error descargando la estación {station} ({start_date} - {end_date}): {e}")
+            records = None
+
+        return station, (start_date, end_date), records
+
+
+    async def _harvest(self, tasks):
+        """
+        Downloads a list of windows concurrently.
+
+        Args:
+            tasks (list): Tuples with the station and the first and last day of every window.
+
+        Returns:
+            list: Results of every window.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = HostRateLimiter(self.rate_per_second)
+        connector = aiohttp.TCPConnector(limit = self.max_concurrency)
+
+        async with aiohttp.ClientSession(connector = connector) as session:
+            return await asyncio.gather(*[self._harvest_window(session, semaphore, limiter, station, start_date, end_date)
+                                          for station, start_date, end_date in tasks])
+
+
+    def harvest(self, stations, start_date, end_date, resume = True):
+        """
+        Downloads the daily values of many stations and writes them to the store.
+
+        Args:
+            stations (list): Station identifiers.
+            start_date (str): First day of the period (format: 'YYYY-MM-DD').
+            end_date (str): Last day of the period (format: 'YYYY-MM-DD').
+            resume (bool, optional): Whether to start every station after its last harvested day. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: Summary per station with the downloaded rows, the stored period and the failed windows.
+        """
+        tasks = []
+
+        for station in stations:
+            station_start = pd.Timestamp(start_date)
+
+            watermark = self.store.get_watermark(station, 'aemet') if resume == True else None
+            if watermark is not None:
+                station_start = max(station_start, watermark.normalize() + pd.Timedelta(days = 1))
+
+            if station_start <= pd.Timestamp(end_date):
+                tasks += [(station, start, end) for start, end in self.get_windows(station_start, end_date)]
+
+        results = self.func.run_coroutine(self._harvest(tasks))
+
+        # Group the records and the failed windows of every station
+        records = {station: [] for station in stations}
+        failed = {station: [] for station in stations}
+
+        for station, window, window_records in results:
+            if window_records is None:
+                failed[station].append(window)
+            else:
+                records[station] += window_records
+
+        summary = []
+
+        for station in stations:
+            rows = 0
+
+            if records[station]:
+                data = WeatherAPI.process_aemet(pd.DataFrame(records[station]))
+                data = self.func.basic_clean(data, 'D')
+                self.store.write(data, station, 'aemet')
+                rows = len(data)
+
+            first, last = self.store.get_date_range(station, 'aemet')
+
+            # Only move the watermark when all the windows of the station were downloaded, and only up to the
+            # last stored day, AEMET publishes the values with some days of delay and the missing days are requested again
+            if not failed[station] and any(task[0] == station for task in tasks) and last is not None:
+                self.store.set_watermark(station, 'aemet', last)
+            summary.append({'station': station, 'rows': rows, 'first': first, 'last': last, 'failed_windows': failed[station]})
+
+        return pd.DataFrame(summary)
@@ -0,0 +1,232 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import os
+
+import yaml
+
+from FlowModels import FlowModels
+
+
+# Data shared by the folds of a worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(shm_name, shape, dates, columns, params_dir, level):
+    """
+    Attaches a worker process to the shared matrix of flow and exogenous variables.
+
+    Args:
+        shm_name (str): Name of the shared memory block.
+        shape (tuple): Shape of the matrix (dates, 1 + exogenous variables).
+        dates (numpy.ndarray): Dates of the rows.
+        columns (list): Names of the exogenous variables.
+        params_dir (str): Directory with the params_*.csv files.
+        level (float): Coverage of the prediction intervals.
+    """
+    shm = shared_memory.SharedMemory(name = shm_name)
+
+    # Keep a reference to the block so the view stays valid
+    _WORKER['shm'] = shm
+    _WORKER['data'] = np.ndarray(shape, dtype = 'float64', buffer = shm.buf)
+    _WORKER['dates'] = pd.DatetimeIndex(dates)
+    _WORKER['columns'] = columns
+    _WORKER['models'] = FlowModels(params_dir = params_dir, level = level)
+
+
+def _run_fold(model, params, train_end, steps):
+    """
+    Fits a model with the data before a fold and forecasts the fold.
+
+    Args:
+        model (str): Name of the model.
+        params (dict): Hyperparameters of the model.
+        train_end (int): Position of the first day of the fold.
+        steps (int): Days of the fold.
+
+    Returns:
+        tuple: Name of the model and forecast of the fold.
+    """
+    data = _WORKER['data']
+    dates = _WORKER['dates']
+    columns = _WORKER['columns']
+    models = _WORKER['models']
+
+    # Views of the shared matrix, the training data is not copied between processes
+    y = pd.Series(data[:train_end, 0], index = dates[:train_end], name = 'flow')
+    exog = pd.DataFrame(data[:train_end, 1:], index = dates[:train_end], columns = columns) if columns else None
+    exog_future = pd.DataFrame(data[train_end:train_end + steps, 1:], index = dates[train_end:train_end + steps], columns = columns) if columns else None
+
+    fitted = models.fit(model, y, exog, params)
+
+    return model, models.forecast(fitted, y, exog_future, steps = steps)
+
+
+class Backtester:
+    """
+    Walk-forward backtesting of the flow models, running the folds of all the models in a process pool.
+
+    The last n_folds * steps days are split into consecutive folds. Every fold is forecast by a model
+    fitted with all the data before it.
+    """
+
+    # Columns and index label of the backtest_*.csv files of every model
+    SCHEMAS = {'baseline': (None, ['pred']),
+               'lgbm': (None, ['pred', 'lower_bound', 'upper_bound']),
+               'xgb': (None, ['pred', 'lower_bound', 'upper_bound']),
+               'sarimax': (None, ['pred', 'lower_bound', 'upper_bound']),
+               'prophet': ('date', ['pred', 'upper_bound', 'lower_bound'])}
+
+    # Index of every metric in error_df.csv
+    METRICS = {'MSE': 1, 'RMSE': 2, 'MAPE': 3, 'MAE Peaks': 4}
+
+    def __init__(self, n_folds = None, steps = None, workers = None):
+        """
+        Initializes the backtester and loads configuration parameters.
+
+        Args:
+            n_folds (int, optional): Number of folds. Defaults to the config value.
+            steps (int, optional): Days of every fold. Defaults to the config value.
+            workers (int, optional): Number of processes. Defaults to the config value.
+        """
+        self.load_config()
+        self.models = FlowModels()
+
+        backtest_config = self.config["Backtest"]
+        self.n_folds = n_folds or backtest_config["n_folds"]
+        self.steps = steps or backtest_config["steps"]
+        self.workers = workers or backtest_config["workers"]
+        self.peak_quantile = backtest_config["peak_quantile"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_metrics(self, actual, pred):
+        """
+        Computes the error metrics of a forecast.
+
+        Args:
+            actual (pandas.Series): Observed flow.
+            pred (pandas.Series): Forecast flow with the same index.
+
+        Returns:
+            dict: Value of every metric.
+        """
+        error = pred.to_numpy(dtype = 'float64') - actual.to_numpy(dtype = 'float64')
+        actual = actual.to_numpy(dtype = 'float64')
+
+        # Peaks are the days above the configured quantile of the observed flow
+        peaks = actual >= np.quantile(actual, self.peak_quantile)
+
+        mse = np.mean(error ** 2)
+
+        return {'MSE': mse,
+                'RMSE': np.sqrt(mse),
+                'MAPE': np.mean(np.abs(error) / np.abs(actual)),
+                'MAE Peaks': np.mean(np.abs(error[peaks]))}
+
+
+    def format_backtest(self, model, forecast):
+        """
+        Formats a backtest in the schema of its backtest_*.csv file.
+
+        Args:
+            model (str): Name of the model.
+            forecast (pandas.DataFrame): Forecast of all the folds indexed by date.
+
+        Returns:
+            pandas.DataFrame: Backtest ready to be written.
+        """
+        index_label, columns = self.SCHEMAS[model]
+        result = forecast[columns].copy()
+        result.index = result.index.strftime('%Y-%m-%d')
+
+        if index_label is not None:
+            result = result.rename_axis(index_label).reset_index()
+
+        return result
+
+
+    def run(self, y, exog = None, models = None, params = None, output_dir = None, error_path = None):
+        """
+        Runs the walk-forward backtest of several models.
+
+        Args:
+            y (pandas.Series): Daily flow indexed by date.
+            exog (pandas.DataFrame, optional): Exogenous variables indexed by the same dates. Defaults to None.
+            models (list, optional): Models to evaluate. Defaults to all of them.
+            params (dict, optional): Hyperparameters of each model. Defaults to the best ones of the params_*.csv files.
+            output_dir (str, optional): Directory where the backtest_*.csv files are written. Defaults to None (not written).
+            error_path (str, optional): Path where the metrics are written as error_df.csv. Defaults to None (not written).
+
+        Returns:
+            tuple: Forecasts of every model and metrics frame with the columns 'Metric', 'Value' and 'Model'.
+        """
+        models = models or list(self.SCHEMAS)
+        params = params or {}
+        params = {model: params.get(model, self.models.get_best_params(model)) for model in models}
+
+        # Flow and exogenous variables in a single matrix shared by all the processes
+        columns = list(exog.columns) if exog is not None else []
+        matrix = y.to_frame().to_numpy(dtype = 'float64') if exog is None else np.column_stack([y.to_numpy(dtype = 'float64'), exog.reindex(y.index).to_numpy(dtype = 'float64')])
+
+        shm = shared_memory.SharedMemory(create = True, size = matrix.nbytes)
+
+        try:
+            shared = np.ndarray(matrix.shape, dtype = 'float64', buffer = shm.buf)
+            shared[:] = matrix
+
+            first_fold = len(y) - self.n_folds * self.steps
+            folds = [first_fold + fold * self.steps for fold in range(self.n_folds)]
+            results = {model: [] for model in models}
+
+            initargs = (shm.name, matrix.shape, y.index.to_numpy(), columns, self.models.params_dir, self.models.level)
+
+            with ProcessPoolExecutor(max_workers = self.workers, initializer = _init_worker, initargs = initargs) as executor:
+                # The folds of all the models are submitted together so the slow models do not leave processes idle
+                futures = [executor.submit(_run_fold, model, params[model], train_end, self.steps) for model in models for train_end in folds]
+
+                for future in as_completed(futures):
+                    model, forecast = future.result()
+                    results[model].append(forecast)
+
+        finally:
+            shm.close()
+            shm.unlink()
+
+        forecasts = {model: pd.concat(parts).sort_index() for model, parts in results.items()}
+
+        # Metrics over the whole backtest period
+        metrics = []
+        for model, forecast in forecasts.items():
+            for metric, value in self.get_metrics(y.reindex(forecast.index), forecast['pred']).items():
+                metrics.append({'index': self.METRICS[metric], 'Metric': metric, 'Value': value, 'Model': self.models.MODEL_NAMES[model]})
+
+        metrics = pd.DataFrame(metrics).sort_values(by = ['Metric', 'Value']).set_index('index').rename_axis(None)
+
+        if output_dir is not None:
+            for model, forecast in forecasts.items():
+                self.format_backtest(model, forecast).to_csv(os.path.join(output_dir, f"backtest_{model}.csv"), index = self.SCHEMAS[model][0] is None)
+
+        if error_path is not None:
+            metrics.to_csv(error_path)
+
+        return forecasts, metrics
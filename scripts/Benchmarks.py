@@ -0,0 +1,621 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import time
+import threading
+import multiprocessing
+from queue import Empty
+import resource
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import warnings
+
+from pyproj import Proj, transform
+
+from UrlDefinition import UrlDefinition
+
+from FlowRiver import FlowData
+
+from WeatherData import WeatherAPI
+
+from OrderSelector import OrderSelector
+
+from Utils import Utils
+
+
+class LocalUrlDefinition(UrlDefinition):
+    """
+    URL definition pointing the flow data sources to a local HTTP stand-in.
+    """
+
+    def __init__(self, base_url):
+        """
+        Initializes the URL definition with the address of the local server.
+
+        Args:
+            base_url (str): Base URL of the local server (e.g. 'http://127.0.0.1:8000').
+        """
+        super().__init__()
+        self.base_url = base_url
+
+    def get_url_csv(self, station_code, year_csv):
+        """
+        Generates the local URL for CSV files based on station code and year.
+
+        Args:
+            station_code (str): Code of the station.
+            year_csv (int): Year of the CSV file.
+
+        Returns:
+            str: Local URL for the CSV file.
+        """
+        self._url_csv = f"{self.base_url}/historico-risr-csv?f={station_code}_AH{year_csv}_HQ.csv"
+        return self._url_csv
+
+    def get_url_realtime(self, station_code):
+        """
+        Generates the local URL for real-time data based on station code.
+
+        Args:
+            station_code (str): Code of the station.
+
+        Returns:
+            str: Local URL for real-time data.
+        """
+        self._url_realtime = f"{self.base_url}/ficha-risr?r=EA{str(station_code)[-3:]}"
+        return self._url_realtime
+
+
+class LocalServer:
+    """
+    Threaded local HTTP server that serves in-memory files with a configurable latency per file.
+    """
+
+    def __init__(self, files, delays = None):
+        """
+        Initializes the server with the files to serve.
+
+        Args:
+            files (dict): Mapping between file names (query parameter 'f' or URL path) and their content.
+            delays (dict, optional): Seconds to wait before answering each file. Defaults to None.
+        """
+        self.files = files
+        self.delays = delays or {}
+        self.server = None
+        self.thread = None
+
+    def __enter__(self):
+        files = self.files
+        delays = self.delays
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                name = parse_qs(parsed.query).get('f', [parsed.path.lstrip('/')])[0]
+
+                if name not in files:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                time.sleep(delays.get(name, 0))
+
+                body = files[name].encode('utf-8')
+                content_type = 'text/html' if files[name].lstrip().startswith('<') else 'text/plain'
+                self.send_response(200)
+                self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+
+def _run_realtime_mode(mode, station, base_url, queue):
+    """
+    Runs one real-time download mode in a child process and reports its time and peak memory.
+
+    Args:
+        mode (str): Mode passed to FlowData.real_time_data.
+        station (str): Station code.
+        base_url (str): Base URL of the local server.
+        queue (multiprocessing.Queue): Queue where the results are put.
+    """
+    flow = FlowData(station)
+    flow.obj_url = LocalUrlDefinition(base_url)
+
+    start = time.perf_counter()
+    df = flow.real_time_data(mode = mode)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is given in kilobytes on Linux, the browser processes are children of this process
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    queue.put({'mode': mode,
+               'seconds': seconds if df is not None else np.nan,
+               'peak_rss_mb': peak_rss / 1024,
+               'rows': len(df) if df is not None else 0})
+
+
+class FakeOpenMeteoVariable:
+    """
+    Stand-in for one variable of an Open-Meteo SDK response.
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+    def ValuesAsNumpy(self):
+        return self.values
+
+
+class FakeOpenMeteoResponse:
+    """
+    Stand-in for an Open-Meteo SDK response with hourly float32 variables.
+    """
+
+    def __init__(self, start, n_hours, n_vars, seed = 0):
+        """
+        Builds the arrays of the response.
+
+        Args:
+            start (str): First date (UTC).
+            n_hours (int): Number of hourly values.
+            n_vars (int): Number of variables.
+            seed (int, optional): Seed of the random generator. Defaults to 0.
+        """
+        rng = np.random.default_rng(seed)
+
+        self.time = int(pd.Timestamp(start, tz = 'UTC').timestamp())
+        self.n_hours = n_hours
+        self.variables = [FakeOpenMeteoVariable(rng.normal(size = n_hours).astype('float32')) for _ in range(n_vars)]
+
+    def Hourly(self):
+        return self
+
+    def Time(self):
+        return self.time
+
+    def TimeEnd(self):
+        return self.time + 3600 * self.n_hours
+
+    def Interval(self):
+        return 3600
+
+    def Variables(self, idx):
+        return self.variables[idx]
+
+
+class Benchmarks:
+    """
+    Benchmarks for the data extraction and processing pipeline.
+    """
+
+    def __init__(self):
+        self.func = Utils()
+
+    def _build_flow_csv(self, year):
+        """
+        Builds a synthetic SAIH hourly flow CSV file for a whole year.
+
+        Args:
+            year (int): Year of the file.
+
+        Returns:
+            str: Content of the CSV file.
+        """
+        dates = pd.date_range(start = f"{year}-01-01 00:00", end = f"{year}-12-31 23:00", freq = 'H')
+        flow = np.random.default_rng(year).gamma(2.0, 50.0, len(dates)).round(2)
+
+        lines = ["Fecha\tHora\tCaudal"]
+        lines += [f"{d}\t0\t{q}" for d, q in zip(dates.strftime('%Y-%m-%d %H:%M'), flow)]
+
+        return "\n".join(lines)
+
+    def csv_ingestion(self, station = '2089', delays = None, repeat = 3):
+        """
+        Compares the sequential and the concurrent multi-year CSV ingestion of FlowData.
+
+        Each year is served with its own latency, so the sequential mode is expected to take about
+        the sum of the latencies while the concurrent mode takes about the slowest one.
+
+        Args:
+            station (str, optional): Station code used to name the files. Defaults to '2089'.
+            delays (dict, optional): Latency in seconds per year. Defaults to 0.2 to 1.0 seconds for 2020-2024.
+            repeat (int, optional): Number of repetitions of each mode. Defaults to 3.
+
+        Returns:
+            pandas.DataFrame: Best wall-clock time per mode together with the expected bounds.
+        """
+        if delays is None:
+            delays = {2020: 0.2, 2021: 0.4, 2022: 0.6, 2023: 0.8, 2024: 1.0}
+
+        years = list(delays.keys())
+        files = {f"{station}_AH{year}_HQ.csv": self._build_flow_csv(year) for year in years}
+        file_delays = {f"{station}_AH{year}_HQ.csv": delay for year, delay in delays.items()}
+
+        results = []
+
+        with LocalServer(files, file_delays) as server:
+            flow = FlowData(station)
+            flow.obj_url = LocalUrlDefinition(server.base_url)
+
+            for mode, concurrent in [('sequential', False), ('concurrent', True)]:
+                timings = []
+
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    df_list = flow.read_csv_years(years, concurrent = concurrent)
+                    df = flow.func.basic_clean(pd.concat(df_list).reset_index(drop = True))
+                    timings.append(time.perf_counter() - start)
+
+                results.append({'mode': mode, 'seconds': min(timings), 'rows': len(df)})
+
+        results = pd.DataFrame(results)
+        results['sum_latency'] = sum(delays.values())
+        results['max_latency'] = max(delays.values())
+
+        return results
+
+    def coordinate_transform(self, n_points = 100000, legacy_sample = 2000):
+        """
+        Compares the per-row UTM to latitude-longitude transformation with the batch transformation.
+
+        The per-row version (a new pair of Proj objects per call through DataFrame.apply) is timed
+        over a sample of the points and extrapolated to the full size.
+
+        Args:
+            n_points (int, optional): Number of points to transform. Defaults to 100000.
+            legacy_sample (int, optional): Number of points used to time the per-row version. Defaults to 2000.
+
+        Returns:
+            pandas.DataFrame: Time per method for all the points and maximum difference between results.
+        """
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({'X': rng.uniform(200000, 800000, n_points),
+                             'Y': rng.uniform(4400000, 4800000, n_points)})
+
+        def legacy_transform(x, y):
+            utm_origen = Proj(proj = 'utm', zone = 30, ellps = 'WGS84')
+            wgs84 = Proj(proj = 'latlong', datum = 'WGS84')
+            lon, lat = transform(utm_origen, wgs84, x, y)
+            return pd.Series([lat, lon], index = ['latitud', 'longitud'])
+
+        warnings.filterwarnings("ignore")
+
+        sample = data.iloc[:legacy_sample]
+        start = time.perf_counter()
+        legacy = sample.apply(lambda row: legacy_transform(row['X'], row['Y']), axis = 1)
+        legacy_seconds = (time.perf_counter() - start) * n_points / legacy_sample
+
+        self.func.get_utm_transformer()
+        start = time.perf_counter()
+        lat, lon = self.func.transform_coordinates_batch(data['X'].to_numpy(), data['Y'].to_numpy())
+        batch_seconds = time.perf_counter() - start
+
+        max_diff = max(np.abs(legacy['latitud'].to_numpy() - lat[:legacy_sample]).max(),
+                       np.abs(legacy['longitud'].to_numpy() - lon[:legacy_sample]).max())
+
+        return pd.DataFrame({'method': ['per_row (extrapolated)', 'batch'],
+                             'seconds': [legacy_seconds, batch_seconds],
+                             'points': n_points,
+                             'max_abs_diff_deg': max_diff})
+
+    def _legacy_basic_clean(self, data, freq = 'H'):
+        """
+        Previous implementation of Utils.basic_clean, kept as reference for the benchmarks.
+
+        Args:
+            data (pandas.DataFrame): Input DataFrame.
+            freq (str): Frequency, 'H' for hour data and 'D' for daily data
+
+        Returns:
+            pandas.DataFrame: Cleaned DataFrame.
+        """
+        data = data.sort_values(by = 'date', ascending = True).reset_index(drop = True)
+
+        threshold = 0.7
+        min_non_nulls = int(data.shape[1] * (1 - threshold))
+        data = data.dropna(thresh = min_non_nulls)
+
+        data = data.drop_duplicates(subset = 'date', keep = 'first').reset_index(drop = True)
+
+        start_date = data.loc[0, 'date']
+        end_date = data.loc[len(data) - 1, 'date']
+
+        data_range = pd.DataFrame({'date': pd.date_range(start = start_date, end = end_date, freq = freq)})
+
+        data['date'] = pd.to_datetime(data['date'])
+        data = pd.merge(data_range, data, on = 'date', how = 'left')
+
+        missing_data = data.isnull().sum()
+        missing_percentage = (missing_data / len(data)) * 100
+        columns_with_missing_data = missing_percentage[missing_percentage > 1]
+
+        data = data.ffill()
+        data = data.reset_index(drop = True)
+
+        return data
+
+    def _build_raw_frame(self, start, end, n_vars, seed = 0, missing = 0.02):
+        """
+        Builds an unordered hourly frame with gaps, duplicated dates and missing values.
+
+        Args:
+            start (str): First date.
+            end (str): Last date.
+            n_vars (int): Number of numeric variables.
+            seed (int, optional): Seed of the random generator. Defaults to 0.
+            missing (float, optional): Fraction of rows removed and of values set to NaN. Defaults to 0.02.
+
+        Returns:
+            pandas.DataFrame: Raw frame with a 'date' column and the variables.
+        """
+        rng = np.random.default_rng(seed)
+        dates = pd.date_range(start = start, end = end, freq = 'H')
+
+        values = rng.normal(size = (len(dates), n_vars))
+        values[rng.random(values.shape) < missing] = np.nan
+
+        columns = ['flow'] if n_vars == 1 else [f"var_{i}" for i in range(n_vars)]
+        data = pd.DataFrame(values, columns = columns)
+        data.insert(0, 'date', dates)
+
+        # Remove some rows, duplicate others and shuffle
+        data = data[rng.random(len(data)) > missing]
+        data = pd.concat([data, data.sample(frac = missing, random_state = seed)])
+
+        return data.sample(frac = 1, random_state = seed).reset_index(drop = True)
+
+    def basic_clean(self, repeat = 3):
+        """
+        Compares the previous and the current Utils.basic_clean on a multi-year hourly flow frame
+        and on a 33-variable hourly Open-Meteo frame, including a second call over the clean output.
+
+        Args:
+            repeat (int, optional): Number of repetitions of each measure. Defaults to 3.
+
+        Returns:
+            pandas.DataFrame: Best time per frame and implementation.
+        """
+        frames = {'flow 5 years': self._build_raw_frame('2020-01-01', '2024-12-31 23:00', 1),
+                  'open-meteo 10 years x 33': self._build_raw_frame('2014-01-01', '2023-12-31 23:00', 33)}
+
+        results = []
+
+        for name, raw in frames.items():
+            clean = self.func.basic_clean(raw)
+
+            methods = {'legacy': lambda: self._legacy_basic_clean(raw),
+                       'current': lambda: self.func.basic_clean(raw),
+                       'legacy (already clean)': lambda: self._legacy_basic_clean(clean),
+                       'current (already clean)': lambda: self.func.basic_clean(clean)}
+
+            for method, func in methods.items():
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    func()
+                    timings.append(time.perf_counter() - start)
+
+                results.append({'frame': name, 'method': method, 'rows': len(raw), 'seconds': min(timings)})
+
+        return pd.DataFrame(results)
+
+    def _legacy_process_response(self, response, variables):
+        """
+        Previous implementation of WeatherAPI.process_response, kept as reference for the benchmarks.
+
+        Args:
+            response (FakeOpenMeteoResponse): Response of the SDK.
+            variables (list): Variables of the response.
+
+        Returns:
+            pandas.DataFrame: Processed data with a string 'date' column.
+        """
+        hourly_data = {var: response.Hourly().Variables(idx).ValuesAsNumpy() for idx, var in enumerate(variables)}
+
+        start_time = pd.to_datetime(response.Hourly().Time(), unit = "s", utc = True)
+        end_time = pd.to_datetime(response.Hourly().TimeEnd(), unit = "s", utc = True)
+        interval = pd.Timedelta(seconds = response.Hourly().Interval())
+
+        hourly_data["date"] = pd.date_range(start = start_time, end = end_time, freq = interval, inclusive = 'left')
+
+        df = pd.DataFrame(hourly_data)
+        df["date"] = pd.to_datetime(df['date']).dt.tz_convert('Europe/Madrid').dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        columnas = df.columns.tolist()
+        columnas = ['date'] + [col for col in columnas if col != 'date']
+        df = df[columnas]
+
+        return self.func.basic_clean(df, freq = 'H')
+
+    def process_response(self, years = 10, n_vars = 33, repeat = 3):
+        """
+        Compares the previous and the current WeatherAPI.process_response on a multi-year hourly
+        Open-Meteo response.
+
+        Args:
+            years (int, optional): Years of hourly data of the response. Defaults to 10.
+            n_vars (int, optional): Number of variables of the response. Defaults to 33.
+            repeat (int, optional): Number of repetitions of each measure. Defaults to 3.
+
+        Returns:
+            pandas.DataFrame: Best time, peak traced memory and size of the result per implementation.
+        """
+        n_hours = int(pd.Timedelta(days = 365.25 * years) / pd.Timedelta(hours = 1))
+        response = FakeOpenMeteoResponse('2014-01-01', n_hours, n_vars)
+        variables = [f"var_{i}" for i in range(n_vars)]
+
+        # process_response only needs the cleaning helpers, so the API keys are not loaded
+        weather = WeatherAPI.__new__(WeatherAPI)
+        weather.func = self.func
+
+        methods = {'legacy': lambda: self._legacy_process_response(response, variables),
+                   'current': lambda: weather.process_response(response, variables)}
+
+        results = []
+
+        for method, func in methods.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            df = func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results.append({'method': method,
+                            'rows': len(df),
+                            'seconds': min(timings),
+                            'peak_mb': peak / 1024 ** 2,
+                            'result_mb': df.memory_usage(deep = True).sum() / 1024 ** 2})
+
+        return pd.DataFrame(results)
+
+    def _build_realtime_fixture(self, n_rows, station):
+        """
+        Builds the station page and the values page of the real-time data.
+
+        Args:
+            n_rows (int): Number of hourly values of the table.
+            station (str): Station code.
+
+        Returns:
+            dict: Pages keyed by the path the local server serves them on.
+        """
+        dates = pd.date_range(end = pd.Timestamp.now().floor('H'), periods = n_rows, freq = 'H')
+        flow = np.random.default_rng(0).gamma(2.0, 50.0, n_rows)
+
+        table_rows = "".join(f"<tr><td>{d}</td><td>{q:.2f}".replace('.', ',') + "</td></tr>"
+                             for d, q in zip(dates.strftime('%d/%m/%Y %H:%M'), flow))
+
+        ficha = ('<html><body><h3>Estación</h3>'
+                 f'<a class="mdi mdi-chart-histogram" href="/grafica-risr?r=EA{station[-3:]}xATVRFUR">Caudal</a>'
+                 '</body></html>')
+
+        valores = ('<html><body><a href="#">Valores</a>'
+                   '<select name="DataTables_Table_0_length"><option value="10">10</option><option value="-1">Todos</option></select>'
+                   '<table id="DataTables_Table_0"><thead><tr><th>Fecha</th><th>Caudal (m3/s)</th></tr></thead>'
+                   f'<tbody>{table_rows}</tbody></table></body></html>')
+
+        return {'ficha-risr': ficha, 'grafica-risr': valores}
+
+    def realtime_fetch(self, station = '2089', n_rows = 720, fixture_path = None, timeout = 300):
+        """
+        Compares latency and peak memory of the HTTP and the Selenium real-time downloads.
+
+        Every mode runs in its own process against a local server. The Selenium mode needs a local
+        Chrome installation, otherwise its time is reported as NaN. A mode that does not finish within
+        the timeout is stopped and also reported as NaN.
+
+        Args:
+            station (str, optional): Station code. Defaults to '2089'.
+            n_rows (int, optional): Number of hourly values of the synthetic table. Defaults to 720 (30 days).
+            fixture_path (str, optional): Saved HTML of the values page to use instead of the synthetic one. Defaults to None.
+            timeout (float, optional): Seconds to wait for every mode. Defaults to 300.
+
+        Returns:
+            pandas.DataFrame: Time, peak RSS and number of rows per mode.
+        """
+        files = self._build_realtime_fixture(n_rows, station)
+
+        if fixture_path is not None:
+            with open(fixture_path, 'r', encoding = 'utf-8') as file:
+                files['grafica-risr'] = file.read()
+
+        results = []
+
+        with LocalServer(files) as server:
+            for mode in ['http', 'selenium']:
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target = _run_realtime_mode, args = (mode, station, server.base_url, queue))
+                process.start()
+
+                try:
+                    results.append(queue.get(timeout = timeout))
+                except Empty:
+                    # The child hung or died without reporting, stop it so the benchmark can go on
+                    print(f"El modo {mode} no terminó en {timeout} segundos")
+                    process.terminate()
+                    results.append({'mode': mode, 'seconds': np.nan, 'peak_rss_mb': np.nan, 'rows': 0})
+
+                process.join()
+
+        return pd.DataFrame(results)
+
+    def sarimax_orders(self, flow_path = '../models/demo/hist_caudal.csv', workers = None):
+        """
+        Compares fitting every SARIMAX order from scratch with the OrderSelector on the demo flow.
+
+        The selector ranks the orders on the differenced series, so its best order may differ from the legacy one.
+
+        Args:
+            flow_path (str, optional): Path to the daily flow. Defaults to the demo flow.
+            workers (int, optional): Processes of the selector. Defaults to the config value.
+
+        Returns:
+            pandas.DataFrame: Time, best order and discarded orders per implementation.
+        """
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+        y = pd.read_csv(flow_path, parse_dates = ['date']).set_index('date')['flow'].asfreq('D')
+        selector = OrderSelector(workers = workers)
+
+        results = []
+
+        # One independent fit per order, differencing inside every model
+        start = time.perf_counter()
+        rows = []
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for p, q, P, Q in selector.get_candidates():
+                result = SARIMAX(y.to_numpy(dtype = 'float64'), order = (p, selector.d, q), seasonal_order = (P, selector.D, Q, selector.s)).fit(disp = False)
+                rows.append((str((p, q, P, Q)), result.aic, result.mle_retvals.get('converged', True)))
+        legacy = pd.DataFrame(rows, columns = ['(p,q,P,Q)', 'AIC', 'converged']).sort_values(by = 'AIC')
+
+        results.append({'method': 'legacy',
+                        'seconds': time.perf_counter() - start,
+                        'best': legacy['(p,q,P,Q)'].iloc[0],
+                        'discarded': int((legacy['converged'] == False).sum())})
+
+        start = time.perf_counter()
+        table = selector.select(y)
+
+        results.append({'method': 'current',
+                        'seconds': time.perf_counter() - start,
+                        'best': table['(p,q,P,Q)'].iloc[0],
+                        'discarded': len(selector.get_candidates()) - len(table)})
+
+        return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    bench = Benchmarks()
+    print(bench.csv_ingestion())
+    print(bench.coordinate_transform())
+    print(bench.basic_clean())
+    print(bench.process_response())
+    print(bench.realtime_fetch())
+    print(bench.sarimax_orders())
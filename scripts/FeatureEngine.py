@@ -0,0 +1,183 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import os
+
+import yaml
+
+from Resampler import Resampler
+
+
+class FeatureEngine:
+    """
+    Daily model features from the weather data: rolling means, lags and cyclical calendar encodings.
+
+    The names follow the model inputs: '{var}_roll_mean_{window}_day', '{var}_lag_{lag}' and
+    '{calendar}_sine' / '{calendar}_cosine' (e.g. 'rain_roll_mean_7_day', 'week_of_year_sine').
+    """
+
+    # Period of every calendar variable
+    CALENDAR_PERIODS = {'week_of_year': 52, 'month': 12, 'day_of_week': 7, 'day_of_year': 365}
+
+    def __init__(self, windows = None, lags = None, calendar = None, min_periods = None):
+        """
+        Initializes the engine and loads configuration parameters.
+
+        Args:
+            windows (list, optional): Days of the rolling means. Defaults to the config value.
+            lags (list, optional): Lags in days of the variables. Defaults to the config value.
+            calendar (list, optional): Calendar variables encoded as sine and cosine. Defaults to the config value.
+            min_periods (int, optional): Minimum observations of a rolling mean, None for the whole window. Defaults to the config value.
+        """
+        self.load_config()
+        self.resampler = Resampler()
+
+        features_config = self.config["Features"]
+        self.windows = windows if windows is not None else features_config["windows"]
+        self.lags = lags if lags is not None else features_config["lags"]
+        self.calendar = calendar if calendar is not None else features_config["calendar"]
+        self.min_periods = min_periods if min_periods is not None else features_config.get("min_periods")
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_history_days(self):
+        """
+        Returns the number of past days needed to compute the features of a day.
+
+        Returns:
+            int: Longest window or lag.
+        """
+        return max([1] + [window - 1 for window in self.windows] + list(self.lags))
+
+
+    def _to_daily(self, data, date_col = 'date'):
+        """
+        Sets the dates as the index, resampling to daily values if the data is more frequent.
+
+        Args:
+            data (pandas.DataFrame): Weather data with a date column.
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+
+        Returns:
+            pandas.DataFrame: Daily data indexed by date.
+        """
+        dates = pd.to_datetime(data[date_col])
+
+        if len(dates) > 1 and dates.diff().median() < pd.Timedelta(days = 1):
+            data = self.resampler.resample(data, freq = 'D', date_col = date_col)
+            dates = data[date_col]
+
+        return data.set_index(pd.DatetimeIndex(dates, name = date_col)).drop(columns = date_col)
+
+
+    def _build(self, daily, variables):
+        """
+        Computes all the features of a daily frame.
+
+        Args:
+            daily (pandas.DataFrame): Daily data indexed by date.
+            variables (list): Variables used for the rolling means and lags.
+
+        Returns:
+            pandas.DataFrame: Original variables followed by all the features.
+        """
+        values = daily[variables].astype('float64')
+        blocks = [daily]
+
+        # Every window and lag is computed over all the variables at once
+        for window in self.windows:
+            rolled = values.rolling(window, min_periods = self.min_periods).mean()
+            blocks.append(rolled.set_axis([f"{var}_roll_mean_{window}_day" for var in variables], axis = 1))
+
+        for lag in self.lags:
+            blocks.append(values.shift(lag).set_axis([f"{var}_lag_{lag}" for var in variables], axis = 1))
+
+        # Cyclical encodings of the calendar
+        calendar_values = {'week_of_year': daily.index.isocalendar().week.to_numpy(dtype = 'float64'),
+                           'month': daily.index.month.to_numpy(dtype = 'float64'),
+                           'day_of_week': daily.index.dayofweek.to_numpy(dtype = 'float64'),
+                           'day_of_year': daily.index.dayofyear.to_numpy(dtype = 'float64')}
+
+        encodings = {}
+        for name in self.calendar:
+            angle = 2 * np.pi * calendar_values[name] / self.CALENDAR_PERIODS[name]
+            encodings[f"{name}_sine"] = np.sin(angle)
+            encodings[f"{name}_cosine"] = np.cos(angle)
+
+        if encodings:
+            blocks.append(pd.DataFrame(encodings, index = daily.index))
+
+        return pd.concat(blocks, axis = 1)
+
+
+    def transform(self, data, variables = None, date_col = 'date'):
+        """
+        Computes the features of the weather data.
+
+        Args:
+            data (pandas.DataFrame): Weather data with a date column, hourly data is resampled to daily.
+            variables (list, optional): Variables used for the rolling means and lags. Defaults to all the numeric variables.
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+
+        Returns:
+            pandas.DataFrame: Daily data with the date column, the original variables and the features.
+        """
+        daily = self._to_daily(data, date_col)
+
+        if variables is None:
+            variables = [col for col in daily.columns if pd.api.types.is_numeric_dtype(daily[col])]
+
+        return self._build(daily, variables).reset_index()
+
+
+    def update(self, features, new_data, variables = None, date_col = 'date'):
+        """
+        Adds new days to a features frame, recomputing only the days affected by them.
+
+        New days replace the stored days with the same date (e.g. a refreshed forecast).
+
+        Args:
+            features (pandas.DataFrame): Output of transform or of a previous update.
+            new_data (pandas.DataFrame): New weather data with a date column and the original variables.
+            variables (list, optional): Variables used for the rolling means and lags. Defaults to all the numeric variables.
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+
+        Returns:
+            pandas.DataFrame: Features frame with the new days.
+        """
+        new_daily = self._to_daily(new_data, date_col)
+
+        if len(new_daily) == 0:
+            return features
+
+        if variables is None:
+            variables = [col for col in new_daily.columns if pd.api.types.is_numeric_dtype(new_daily[col])]
+
+        first_new = new_daily.index[0]
+        dates = pd.to_datetime(features[date_col])
+
+        # Only the last days of the history take part in the windows of the new days
+        keep = features[(dates < first_new).to_numpy()]
+        tail = keep.iloc[-self.get_history_days():] if len(keep) > 0 else keep
+        tail = tail.set_index(pd.DatetimeIndex(pd.to_datetime(tail[date_col]), name = date_col))[list(new_daily.columns)]
+
+        updated = self._build(pd.concat([tail, new_daily]), variables)
+        updated = updated[updated.index >= first_new].reset_index()
+
+        return pd.concat([keep, updated], ignore_index = True)
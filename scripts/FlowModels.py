@@ -0,0 +1,216 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import ast
+import os
+
+import yaml
+
+from LagMatrixBuilder import LagMatrixBuilder
+
+
+class FlowModels:
+    """
+    Fitting and forecasting of the flow models: baseline, LightGBM, XGBoost, SARIMAX and Prophet.
+
+    Every fitted model is a dictionary with the name of the model, the fitted 'estimator' and the
+    information needed to forecast with it. Forecasts are frames indexed by date with the columns
+    'pred', 'lower_bound' and 'upper_bound' (only 'pred' for the baseline).
+    """
+
+    # Names of the models in the reports
+    MODEL_NAMES = {'baseline': 'Baseline', 'lgbm': 'LightGBM', 'xgb': 'XGBoost', 'sarimax': 'SARIMAX', 'prophet': 'Prophet'}
+
+    def __init__(self, params_dir = None, level = None):
+        """
+        Initializes the models and loads configuration parameters.
+
+        Args:
+            params_dir (str, optional): Directory with the params_*.csv files of the tuned models. Defaults to the config value.
+            level (float, optional): Coverage of the prediction intervals. Defaults to the config value.
+        """
+        self.load_config()
+
+        models_config = self.config["Models"]
+        self.params_dir = params_dir or models_config["params_dir"]
+        self.level = level or models_config["level"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_best_params(self, model):
+        """
+        Reads the best hyperparameters of a model from its params_*.csv file.
+
+        Args:
+            model (str): Name of the model ('baseline', 'lgbm', 'xgb', 'sarimax' or 'prophet').
+
+        Returns:
+            dict: Hyperparameters of the model.
+        """
+        if model == 'baseline':
+            return {}
+
+        params = pd.read_csv(os.path.join(self.params_dir, f"params_{model}.csv"), index_col = 0)
+
+        if model in ('lgbm', 'xgb'):
+            best = params.loc[params['custom_metric'].idxmin()]
+            return {'lags': [int(lag) for lag in str(best['lags']).strip('[]').split()],
+                    **ast.literal_eval(best['params'])}
+
+        if model == 'sarimax':
+            best = params.loc[params['AIC'].idxmin()]
+            p, q, P, Q = ast.literal_eval(best['(p,q,P,Q)'])
+            sarimax_config = self.config["Models"]["sarimax"]
+            return {'order': (p, sarimax_config["d"], q),
+                    'seasonal_order': (P, sarimax_config["D"], Q, sarimax_config["s"])}
+
+        if model == 'prophet':
+            best = params.loc[params['rmse'].idxmin()]
+            return {'changepoint_prior_scale': float(best['changepoint_prior_scale']),
+                    'seasonality_prior_scale': float(best['seasonality_prior_scale'])}
+
+        raise ValueError(f"Modelo no válido: {model}")
+
+
+    def fit(self, model, y, exog = None, params = None):
+        """
+        Fits a model.
+
+        Args:
+            model (str): Name of the model.
+            y (pandas.Series or pandas.DataFrame): Daily flow indexed by date. The trees also take a frame with a column
+                per station, fitting one model shared by all of them.
+            exog (pandas.DataFrame or dict, optional): Exogenous variables indexed by date, or one frame per station for
+                a shared tree model. Defaults to None.
+            params (dict, optional): Hyperparameters. Defaults to the best ones of the params_*.csv file.
+
+        Returns:
+            dict: Fitted model.
+        """
+        params = dict(params if params is not None else self.get_best_params(model))
+
+        if isinstance(exog, dict):
+            exog_names = list(next(iter(exog.values())).columns)
+        else:
+            exog_names = list(exog.columns) if exog is not None else []
+        fitted = {'model': model, 'params': params, 'exog_names': exog_names}
+
+        if model == 'baseline':
+            fitted['estimator'] = None
+
+        elif model in ('lgbm', 'xgb'):
+            # The regressors are imported only by the processes that use them
+            if model == 'lgbm':
+                from lightgbm import LGBMRegressor
+                estimator = LGBMRegressor(**{key: value for key, value in params.items() if key != 'lags'}, verbose = -1)
+            else:
+                from xgboost import XGBRegressor
+                estimator = XGBRegressor(**{key: value for key, value in params.items() if key != 'lags'})
+
+            builder = LagMatrixBuilder(lags = params.get('lags'))
+            X, target, _ = builder.build(y, exog)
+            estimator.fit(X, target)
+
+            # In-sample residuals give the width of the prediction intervals
+            residuals = target - estimator.predict(X)
+
+            fitted['estimator'] = estimator
+            fitted['lags'] = [int(lag) for lag in builder.lags]
+            fitted['residual_bounds'] = [float(bound) for bound in np.quantile(residuals, [(1 - self.level) / 2, (1 + self.level) / 2])]
+
+        elif model == 'sarimax':
+            from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+            estimator = SARIMAX(y.to_numpy(dtype = 'float64'), exog = exog.to_numpy(dtype = 'float64') if exog is not None else None,
+                                order = tuple(params['order']), seasonal_order = tuple(params['seasonal_order']))
+            fitted['estimator'] = estimator.fit(disp = False)
+
+        elif model == 'prophet':
+            from prophet import Prophet
+
+            estimator = Prophet(interval_width = self.level, **params)
+            for col in exog_names:
+                estimator.add_regressor(col)
+
+            data = pd.DataFrame({'ds': y.index.tz_localize(None) if y.index.tz is not None else y.index, 'y': y.to_numpy()})
+            if exog is not None:
+                data[exog_names] = exog.to_numpy()
+
+            fitted['estimator'] = estimator.fit(data)
+
+        else:
+            raise ValueError(f"Modelo no válido: {model}")
+
+        return fitted
+
+
+    def forecast(self, fitted, y, exog = None, steps = 7):
+        """
+        Forecasts the next days after the end of the training data.
+
+        Args:
+            fitted (dict): Fitted model.
+            y (pandas.Series): Daily flow of one station indexed by date, at least the last days used as lags.
+            exog (pandas.DataFrame, optional): Exogenous variables of the forecast days. Defaults to None.
+            steps (int, optional): Number of days. Defaults to 7.
+
+        Returns:
+            pandas.DataFrame: Forecast indexed by date.
+        """
+        if isinstance(y, pd.DataFrame):
+            raise ValueError("El pronóstico se calcula para una sola estación, indique su serie de caudal")
+
+        model = fitted['model']
+        dates = pd.date_range(start = y.index[-1], periods = steps + 1, freq = 'D')[1:]
+
+        if exog is not None:
+            exog = exog.reindex(dates)[fitted['exog_names']]
+
+            if exog.isna().any().any():
+                missing = exog.index[exog.isna().any(axis = 1)].strftime('%Y-%m-%d').tolist()
+                raise ValueError(f"Faltan variables exógenas para las fechas {missing}")
+
+        if model == 'baseline':
+            # Repeat the last observed flow
+            return pd.DataFrame({'pred': np.repeat(float(y.iloc[-1]), steps)}, index = dates)
+
+        if model in ('lgbm', 'xgb'):
+            builder = LagMatrixBuilder(lags = fitted['lags'])
+            pred = builder.predict_recursive(fitted['estimator'], y.to_frame(), steps = steps, exog = exog).iloc[:, 0].to_numpy(dtype = 'float64')
+            lower, upper = fitted['residual_bounds']
+
+            return pd.DataFrame({'pred': pred, 'lower_bound': pred + lower, 'upper_bound': pred + upper}, index = dates)
+
+        if model == 'sarimax':
+            result = fitted['estimator'].get_forecast(steps, exog = exog.to_numpy(dtype = 'float64') if exog is not None else None)
+            bounds = np.asarray(result.conf_int(alpha = 1 - self.level))
+
+            return pd.DataFrame({'pred': np.asarray(result.predicted_mean), 'lower_bound': bounds[:, 0], 'upper_bound': bounds[:, 1]}, index = dates)
+
+        if model == 'prophet':
+            future = pd.DataFrame({'ds': dates.tz_localize(None) if dates.tz is not None else dates})
+            if exog is not None:
+                future[fitted['exog_names']] = exog.to_numpy()
+
+            result = fitted['estimator'].predict(future)
+
+            return pd.DataFrame({'pred': result['yhat'].to_numpy(), 'lower_bound': result['yhat_lower'].to_numpy(),
+                                 'upper_bound': result['yhat_upper'].to_numpy()}, index = dates)
+
+        raise ValueError(f"Modelo no válido: {model}")
@@ -10,6 +10,7 @@ from UrlDefinition import UrlDefinition
 import yaml
 
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Web scraping modules
 from selenium import webdriver
@@ -24,6 +25,11 @@ from selenium.webdriver.support import expected_conditions as EC
 import chromedriver_autoinstaller
 
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+
+import re
+from urllib.parse import urljoin
 
 from Utils import Utils
 
@@ -35,14 +41,16 @@ class FlowData:
     Class responsible for managing flow data for a specific station.
     """
 
-    def __init__(self, station):
+    def __init__(self, station, store = None):
         """
         Initializes FlowData object with a station name.
 
         Args:
             station (str): Name of the station.
+            store (TimeSeriesStore, optional): Local store where the unified data is saved. Defaults to None.
         """
         self.station = station
+        self.store = store
         self.func = Utils()
         self.load_config() 
         self.obj_url = UrlDefinition()
@@ -64,12 +72,14 @@ class FlowData:
         self.config = config
         
 
-    def read_csv_data(self, year):
+    def read_csv_data(self, year, session = None, clean = True):
         """
         Reads CSV data for a specified year, performs data cleaning, and returns a DataFrame.
 
         Args:
             year (int): Year for which CSV data is to be retrieved.
+            session (requests.Session, optional): Session used to download the file. Defaults to None (no pooling).
+            clean (bool, optional): Whether to run the basic cleaning over the year. Defaults to True.
 
         Returns:
             pandas.DataFrame: DataFrame containing cleaned CSV data.
@@ -78,7 +88,11 @@ class FlowData:
         warnings.filterwarnings('ignore')
         
         url = self.obj_url.get_url_csv(self.station, year_csv = year)
-        response = requests.get(url, verify = False)
+
+        if session is None:
+            response = requests.get(url, verify = False)
+        else:
+            response = session.get(url)
 
         # Checks if request was successful
         if response.status_code != 200:
@@ -112,28 +126,76 @@ class FlowData:
         df = df[['date', 'flow']].copy()
 
         # Basic data cleaning
-        df = self.func.basic_clean(df)
+        if clean == True:
+            df = self.func.basic_clean(df)
         return df
-     
-            
-    def complete_csv_data(self):
+
+
+    def read_csv_years(self, years, concurrent = False):
+        """
+        Reads the CSV data of several years, either one after another or concurrently.
+
+        In concurrent mode the files are downloaded over a pooled session with a bounded number
+        of workers, each year is parsed as soon as its download finishes and the per-year
+        cleaning is skipped, so it can be done once over the merged frame.
+
+        Args:
+            years (list): Years for which CSV data is to be retrieved.
+            concurrent (bool, optional): Whether to download the years concurrently. Defaults to False.
+
+        Returns:
+            list: List of DataFrames, one per year with available data.
+        """
+        df_list = []
+
+        if concurrent == False:
+            try:
+                for year in years:
+                    df = self.read_csv_data(year)
+                    if df is not None:
+                        df_list.append(df)
+            except:
+                pass
+
+            return df_list
+
+        max_workers = max(1, min(self.config["CSVyears"].get("max_workers", 5), len(years)))
+        session = self.func.get_http_session(pool_size = max_workers, verify = False)
+
+        try:
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                futures = {executor.submit(self.read_csv_data, year, session, False): year for year in years}
+
+                # Collect each year as soon as it has been downloaded and parsed
+                for future in as_completed(futures):
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        print("Error leyendo los datos del año", futures[future], ":", e)
+                        continue
+
+                    if df is not None:
+                        df_list.append(df)
+        finally:
+            session.close()
+
+        return df_list
+
+
+    def complete_csv_data(self, concurrent = False):
         """
         Retrieves and concatenates CSV data for multiple years, performs data cleaning, and returns a DataFrame.
 
+        Args:
+            concurrent (bool, optional): Whether to download the years concurrently and clean only the merged frame. Defaults to False.
+
         Returns:
             pandas.DataFrame: DataFrame containing concatenated and cleaned CSV data.
         """
         data_years = self.config["CSVyears"]["years"]
-        df_list = []
 
         # Reads CSV data for each year
-        try:
-            for year in data_years:
-                df = self.read_csv_data(year)
-                if df is not None:
-                    df_list.append(df)
-        except:
-            pass
+        df_list = self.read_csv_years(data_years, concurrent = concurrent)
 
         if not df_list:
             print("No hay datos disponibles para el año especificado.")
@@ -153,12 +215,12 @@ class FlowData:
             
             # Splits 'data' column into 'date', 'Hora', 'flow'
             aux_data[['date', 'Hora', 'flow']] = aux_data['data'].str.split('\t', expand = True)
-            aux_data['date'] = pd.to_datetime(aux_data['date'] + ' ' + aux_data['Hora'], format = "%d/%m/%Y %H:%M:%S")
-            aux_data = aux_data[['date', 'flow']].copy()
-            aux_data['flow'] = aux_data['flow'].astype('string').str.replace(',', '.').astype('float64')
+            aux_data['date'] = aux_data['date'] + ' ' + aux_data['Hora']
+            aux_data = self.func.parse_dates_values(aux_data, "%d/%m/%Y %H:%M:%S")
 
             # Basic data cleaning
-            aux_data = self.func.basic_clean(aux_data)
+            if concurrent == False:
+                aux_data = self.func.basic_clean(aux_data)
             df_concat = pd.concat([df_concat, aux_data], axis = 0)
         except Exception as e:
             print("Error leyendo la tabla de datos auxiliar:", e)
@@ -170,10 +232,130 @@ class FlowData:
         return df_concat
 
 
-    def real_time_data(self):
+    def real_time_data(self, mode = 'http'):
         """
         Retrieves real-time data, performs scraping, and returns a DataFrame.
 
+        Args:
+            mode (str, optional): 'http' to download the page directly, falling back to the browser if it fails,
+                or 'selenium' to always use the browser. Defaults to 'http'.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing real-time data.
+        """
+        if mode == 'http':
+            try:
+                return self._real_time_http()
+            except Exception as e:
+                print("Error en la descarga directa, se utiliza el navegador:", e)
+
+        return self._real_time_selenium()
+
+
+    def _rows_to_frame(self, rows):
+        """
+        Converts the scraped rows of the real-time table into a DataFrame.
+
+        Args:
+            rows (list): Rows of the table as [date, flow] strings, without header.
+
+        Returns:
+            pandas.DataFrame: DataFrame with 'date' and 'flow' columns.
+        """
+        df = pd.DataFrame(rows, columns = ['date', 'flow'])
+
+        # Date and decimal handling
+        df = self.func.parse_dates_values(df, "%d/%m/%Y %H:%M")
+
+        return df
+
+
+    def _parse_realtime_table(self, chunks):
+        """
+        Parses the flow values table of the real-time page while it is being downloaded.
+
+        Args:
+            chunks (iterable): Byte chunks of the HTML page.
+
+        Returns:
+            list: Rows of the table as [date, flow] strings, with decimal points instead of commas.
+        """
+        parser = etree.HTMLPullParser(events = ('end',), tag = ('td', 'th', 'tr'))
+        date_pattern = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}")
+
+        rows = []
+        cols = []
+
+        def read_events():
+            for event, element in parser.read_events():
+                if element.tag == 'tr':
+                    if len(cols) == 2 and date_pattern.match(cols[0]):
+                        rows.append([cols[0], cols[1].replace(',', '.')])
+                    cols.clear()
+
+                    # Free the rows already processed
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+                else:
+                    cols.append(''.join(element.itertext()).strip())
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            read_events()
+
+        parser.close()
+        read_events()
+
+        return rows
+
+
+    def _real_time_http(self):
+        """
+        Retrieves real-time data with plain HTTP requests, without a browser.
+
+        The station page is downloaded to find the link of the flow chart, whose values table is
+        parsed while it is streamed.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing real-time data.
+        """
+        url = self.obj_url.get_url_realtime(self.station)
+        session = self.func.get_http_session(pool_size = 2, verify = False)
+
+        try:
+            response = session.get(url)
+            response.raise_for_status()
+
+            # Link of the flow values, the same one the browser clicks
+            tree = lxml.html.fromstring(response.content)
+            links = tree.xpath('//a[contains(@class, "mdi-chart-histogram") and contains(@href, "xATVRFUR")]/@href')
+
+            if links:
+                with session.get(urljoin(url, links[0]), stream = True) as values_response:
+                    values_response.raise_for_status()
+                    rows = self._parse_realtime_table(values_response.iter_content(chunk_size = 65536))
+            else:
+                rows = self._parse_realtime_table([response.content])
+
+        finally:
+            session.close()
+
+        if not rows:
+            raise ValueError("No se encontró la tabla de caudales en la página")
+
+        df = self._rows_to_frame(rows)
+
+        # Basic cleaning
+        df = self.func.basic_clean(df)
+
+        return df
+
+
+    def _real_time_selenium(self):
+        """
+        Retrieves real-time data with a headless browser.
+
         Returns:
             pandas.DataFrame: DataFrame containing real-time data.
         """
@@ -229,18 +411,7 @@ class FlowData:
                 rows.append(cols)
 
             # Creates DataFrame from scraped data
-            df = pd.DataFrame(rows[1:], columns = rows[0])
-            df.columns = ['date', 'flow']
-
-            # Date handling
-            for i in range(len(df)):
-                try:
-                    df.loc[i, 'date'] = datetime.strptime(df.loc[i, 'date'], "%d/%m/%Y %H:%M")
-                except Exception as e:
-                    print("Ocurrió un error:", e)
-
-            df['date'] = pd.to_datetime(df['date'])
-            df['flow'] = df['flow'].astype('float64')
+            df = self._rows_to_frame(rows[1:])
 
             # Basic cleaning
             df = self.func.basic_clean(df)
@@ -253,6 +424,63 @@ class FlowData:
             print("Ocurrió un error:", e)
             
 
+    def merge_sources(self, hist_data, rtime_data, replace_missings = True):
+        """
+        Merges the historical and the real-time data on an hourly range and fills the gap between them.
+
+        Args:
+            hist_data (pandas.DataFrame): Cleaned historical data sorted by date.
+            rtime_data (pandas.DataFrame): Real-time data, or None if it could not be downloaded.
+            replace_missings (bool, optional): Whether to replace a gap of more than one day with the values of the previous year. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing merged and cleaned data.
+        """
+        if not isinstance(rtime_data, pd.DataFrame) or rtime_data.empty:
+            return self.func.basic_clean(hist_data)
+
+        # Concat the information
+        df_u = pd.concat([hist_data, rtime_data])
+        
+        df_u = df_u.drop_duplicates(keep = 'first').reset_index(drop = True)
+        
+        # Define a range of dates for the entire dataframe
+        df = pd.DataFrame({'date': pd.date_range(start = df_u.loc[0, 'date'], 
+                                                  end = df_u.loc[len(df_u) - 1, 'date'], 
+                                                  freq = 'H')}
+                          )
+        
+        
+        df = pd.merge(df, df_u, on = 'date', how = 'left')
+        df = df.reset_index(drop = True)
+        
+        # Mising data            
+        missing_start = hist_data.loc[len(hist_data) - 1, 'date']
+        missing_end = rtime_data.loc[0, 'date']
+        
+        if replace_missings == True:
+            
+            if (missing_end - missing_start).days > 1:
+            
+                # Year to take the values for the replacement, take the values from the last year
+                days_year_values = 365
+                        
+                # Replace the data with with the last year information
+                year_index = (df['date'] > (missing_start - timedelta(days = days_year_values))) & (df['date'] < (missing_end - timedelta(days = days_year_values)))
+                df.loc[df['flow'].isnull(), 'flow'] = df.loc[year_index, 'flow'].values
+                df = df.sort_values(by = 'date', ascending = True).reset_index(drop = True)
+                df = self.func.basic_clean(df)
+                
+            else:
+                df = self.func.basic_clean(df)
+            
+        else:
+            # If the missing data is not more than one day, replace it with the previous data
+            df = df.sort_values(by = 'date', ascending = True).reset_index(drop = True)
+
+        return df
+
+
     def unified_data(self, replace_missings = True):
         """
         Combines historical and real-time data, performs data cleaning, and returns a unified DataFrame.
@@ -270,44 +498,12 @@ class FlowData:
             if isinstance(hist_data, pd.DataFrame) and hist_data.shape[0] > 1:
                 rtime_data = self.real_time_data()
                 
-                # Concat the information
-                df_u = pd.concat([hist_data, rtime_data])
-                
-                df_u = df_u.drop_duplicates(keep = 'first').reset_index(drop = True)
-                
-                # Define a range of dates for the entire dataframe
-                df = pd.DataFrame({'date': pd.date_range(start = df_u.loc[0, 'date'], 
-                                                          end = df_u.loc[len(df_u) - 1, 'date'], 
-                                                          freq = 'H')}
-                                  )
-                
-                
-                df = pd.merge(df, df_u, on = 'date', how = 'left')
-                df = df.reset_index(drop = True)
-                
-                # Mising data            
-                missing_start = hist_data.loc[len(hist_data) - 1, 'date']
-                missing_end = rtime_data.loc[0, 'date']
-                
-                if replace_missings == True:
-                    
-                    if (missing_end - missing_start).days > 1:
-                    
-                        # Year to take the values for the replacement, take the values from the last year
-                        days_year_values = 365
-                                
-                        # Replace the data with with the last year information
-                        year_index = (df['date'] > (missing_start - timedelta(days = days_year_values))) & (df['date'] < (missing_end - timedelta(days = days_year_values)))
-                        df.loc[df['flow'].isnull(), 'flow'] = df.loc[year_index, 'flow'].values
-                        df = df.sort_values(by = 'date', ascending = True).reset_index(drop = True)
-                        df = self.func.basic_clean(df)
-                        
-                    else:
-                        df = self.func.basic_clean(df)
-                    
-                else:
-                    # If the missing data is not more than one day, replace it with the previous data
-                    df = df.sort_values(by = 'date', ascending = True).reset_index(drop = True)
+                df = self.merge_sources(hist_data, rtime_data, replace_missings)
+
+                # Save the data in the local store
+                if self.store is not None:
+                    self.store.write(df, self.station, 'flow')
+                    self.store.set_watermark(self.station, 'flow', df['date'].max())
         
                 return(df)            
             
@@ -315,4 +511,81 @@ class FlowData:
                 print("No hay información histórica para unificar con los datos en tiempo real")
                 
         except Exception as e:
-            print("Ocurrió un error:", e)
\ No newline at end of file
+            print("Ocurrió un error:", e)
+
+
+    def load_data(self, start = None, end = None, refresh = False):
+        """
+        Loads the flow data from the local store, downloading it only if nothing is stored.
+
+        Args:
+            start (str, optional): First date to load. Defaults to None (all the history).
+            end (str, optional): Last date to load. Defaults to None (all the history).
+            refresh (bool, optional): Whether to download the data again before reading it. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing the flow data.
+        """
+        if self.store is None:
+            raise ValueError("No se ha definido un almacenamiento local para los datos")
+
+        stored_start, stored_end = self.store.get_date_range(self.station, 'flow')
+
+        if refresh == True or stored_end is None:
+            self.unified_data()
+
+        return self.store.read(self.station, 'flow', start = start, end = end)
+
+
+    def incremental_data(self):
+        """
+        Refreshes the stored flow data downloading only the observations after the high-water mark.
+
+        Only the CSV files from the year of the tail window to the current year and the real-time table
+        are downloaded. The window that starts 'tail_days' before the high-water mark is merged again
+        with the same gap filling as unified_data, the stored history of the previous year being the
+        source of the replaced values, and new observations replace the stored values.
+
+        Returns:
+            pandas.DataFrame: Refreshed tail of the flow data, empty if there are no new observations.
+        """
+        if self.store is None:
+            raise ValueError("No se ha definido un almacenamiento local para los datos")
+
+        watermark = self.store.get_watermark(self.station, 'flow')
+
+        if watermark is None:
+            print("No hay información histórica almacenada, se descargan todos los datos")
+            return self.unified_data()
+
+        tail_start = watermark - timedelta(days = self.config["Incremental"]["tail_days"])
+
+        # Download only the years that may hold observations of the tail window and the real-time data
+        years = list(range(tail_start.year, datetime.now().year + 1))
+        df_list = self.read_csv_years(years, concurrent = True)
+
+        csv_data = pd.concat(df_list) if df_list else pd.DataFrame(columns = ['date', 'flow'])
+        csv_data = csv_data.loc[csv_data['date'] >= tail_start, ['date', 'flow']]
+
+        rtime_data = self.real_time_data()
+
+        last_date = max([data['date'].max() for data in [csv_data, rtime_data] if isinstance(data, pd.DataFrame) and not data.empty], default = None)
+
+        if last_date is None or last_date <= watermark:
+            print("No hay datos nuevos desde", watermark)
+            return pd.DataFrame()
+
+        # The stored year before the tail window is the source of the gap filling, new CSV rows replace the stored ones
+        stored_data = self.store.read(self.station, 'flow', start = tail_start - timedelta(days = 365), columns = ['flow'])
+
+        hist_data = pd.concat([csv_data, stored_data], ignore_index = True)
+        hist_data = hist_data.drop_duplicates(subset = 'date', keep = 'first').sort_values(by = 'date').reset_index(drop = True)
+        hist_data = self.func.basic_clean(hist_data)
+
+        df = self.merge_sources(hist_data, rtime_data)
+        tail = df.loc[df['date'] >= tail_start].reset_index(drop = True)
+
+        self.store.write(tail, self.station, 'flow')
+        self.store.set_watermark(self.station, 'flow', tail['date'].max())
+
+        return tail
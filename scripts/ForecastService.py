@@ -0,0 +1,471 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+import threading
+import os
+
+import yaml
+
+from ModelRegistry import ModelRegistry
+from LagMatrixBuilder import LagMatrixBuilder
+from StationLocator import StationLocator
+from TimeSeriesStore import TimeSeriesStore
+
+
+# Registry of a worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(root):
+    """
+    Opens the model registry in a worker process, so its loaded models are reused by all the tasks.
+
+    Args:
+        root (str): Folder of the registry.
+    """
+    _WORKER['registry'] = ModelRegistry(root = root)
+
+
+def _forecast_station(station, key, model, horizon, exog, registry = None):
+    """
+    Forecasts one station with a stored SARIMAX or Prophet model.
+
+    Args:
+        station (str): Station code.
+        key (str): Key of the model in the registry.
+        model (str): Name of the model.
+        horizon (int): Number of days.
+        exog (pandas.DataFrame): Exogenous variables of the forecast days, or None.
+        registry (ModelRegistry, optional): Registry with the model. Defaults to the one of the worker process.
+
+    Returns:
+        tuple: Station, model and forecast indexed by date.
+    """
+    registry = registry or _WORKER['registry']
+    column = station if key != station else None
+
+    return station, model, registry.predict(key, horizon, model = model, exog = exog, column = column)
+
+
+class ForecastService:
+    """
+    Flow forecasts of many stations and power plants from the models of the registry.
+
+    The tree models and the baseline are predicted for all the stations that share a stored model with a
+    single recursive call of LagMatrixBuilder, while SARIMAX and Prophet run one task per station in a
+    process pool. Plants are mapped to their gauging station by the config or, if not configured, by the
+    nearest station of the aforos catalog. The trees and the baseline start from the last days of flow of
+    the local store, or from the flow given by the caller.
+    """
+
+    # Models predicted in a single vectorized call for all the stations
+    VECTORIZED = ('baseline', 'lgbm', 'xgb')
+
+    def __init__(self, registry = None, workers = None, store = None):
+        """
+        Initializes the service and loads configuration parameters.
+
+        Args:
+            registry (ModelRegistry, optional): Registry with the fitted models. Defaults to the configured one.
+            workers (int, optional): Number of processes for SARIMAX and Prophet. Defaults to the config value.
+            store (TimeSeriesStore, optional): Store with the observed flow. Defaults to the configured one.
+        """
+        self.load_config()
+        self.registry = registry or ModelRegistry()
+        self.store = store or TimeSeriesStore()
+        self.locator = StationLocator()
+
+        service_config = self.config["Service"]
+        self.workers = workers or service_config["workers"]
+        self.horizon = service_config["horizon"]
+        self.default_models = service_config["models"]
+        self.plants = service_config["plants"] or {}
+        self.model_keys = service_config["model_keys"] or {}
+        self.flow_days = service_config["flow_days"]
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def _get_executor(self):
+        """
+        Returns the process pool of the service, creating it the first time.
+
+        Returns:
+            concurrent.futures.ProcessPoolExecutor: Pool with the registry open in every process.
+        """
+        # The HTTP endpoints run in several threads, only one of them creates the pool
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers = self.workers, initializer = _init_worker, initargs = (self.registry.root,))
+
+            return self._executor
+
+
+    def close(self):
+        """
+        Stops the process pool of the service.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+    def get_model_key(self, station, model):
+        """
+        Returns the registry key of the model of a station, which is the station itself unless it uses a shared model.
+
+        Args:
+            station (str): Station code.
+            model (str): Name of the model.
+
+        Returns:
+            str: Key of the model in the registry.
+        """
+        return str(self.model_keys.get(model, {}).get(str(station), station))
+
+
+    def get_plant_stations(self, plants):
+        """
+        Maps power plants to the gauging station of their forecast.
+
+        Args:
+            plants (list): Names of the plants, as in the centrales catalog.
+
+        Returns:
+            dict: Station code of every plant.
+        """
+        stations = {plant: str(self.plants[plant]) for plant in plants if plant in self.plants}
+        missing = [plant for plant in plants if plant not in self.plants]
+
+        if missing:
+            # Plants without configured station use the nearest gauging station
+            catalog = self.locator.load_catalog('centrales')
+            located = catalog[catalog['titulo'].isin(missing)]
+
+            unknown = set(missing) - set(located['titulo'])
+            if unknown:
+                raise ValueError(f"Centrales desconocidas: {sorted(unknown)}")
+
+            nearest = self.locator.nearest_to_plants(catalog = 'aforos', k = 1, plants = located)
+            stations.update({plant: str(code) for plant, code in zip(nearest['central'], nearest['id'])})
+
+        return stations
+
+
+    def get_recent_flows(self, stations):
+        """
+        Reads the last days of observed flow of some stations from the store as daily means.
+
+        Args:
+            stations (list): Station codes.
+
+        Returns:
+            dict: Daily flow of every station with stored data, indexed by date.
+        """
+        flows = {}
+
+        for station in stations:
+            last = self.store.get_date_range(station, 'flow')[1]
+
+            if last is None:
+                continue
+
+            data = self.store.read(station, 'flow', start = last.normalize() - pd.Timedelta(days = self.flow_days), columns = ['flow'])
+            flow = data.set_index(pd.DatetimeIndex(pd.to_datetime(data['date'])))['flow'].astype('float64')
+
+            # The store keeps the sub-daily real-time readings, the models use daily means
+            if flow.index.tz is not None:
+                flow = flow.tz_localize(None)
+            flows[station] = flow.resample('D').mean().dropna()
+
+        return flows
+
+
+    def _select_exog(self, exog, stations, names):
+        """
+        Selects the exogenous variables of a model for some stations.
+
+        Args:
+            exog (pandas.DataFrame or dict): Variables shared by all the stations or one frame per station, or None.
+            stations (list): Station codes.
+            names (list): Variables used by the model.
+
+        Returns:
+            pandas.DataFrame or dict: Variables of the model, or None if it uses none.
+        """
+        if not names:
+            return None
+
+        if exog is None:
+            raise ValueError(f"El modelo necesita las variables exógenas {names}")
+
+        if isinstance(exog, dict):
+            return {station: exog[station][names] for station in stations}
+
+        return exog[names]
+
+
+    def _forecast_vectorized(self, model, key, stations, horizon, exog, flows):
+        """
+        Forecasts all the stations of a stored tree model or baseline with a single recursive prediction.
+
+        Args:
+            model (str): Name of the model.
+            key (str): Key of the model in the registry.
+            stations (list): Station codes that use the model.
+            horizon (int): Number of days.
+            exog (pandas.DataFrame or dict): Exogenous variables of the forecast days, or None.
+            flows (dict): Recent daily flow of some stations, the others use the flow stored with the model.
+
+        Returns:
+            list: Long forecast frames, one per station.
+        """
+        fitted, last_window = self.registry.load(key, model)
+
+        # A model of a single station is applied to all the stations mapped to its key
+        if isinstance(last_window, pd.Series):
+            last_window = pd.DataFrame({station: last_window for station in stations})
+
+        # Recent flow given by the caller replaces the stored days
+        window = pd.DataFrame({station: flows[station] if station in flows else last_window[station] for station in stations})
+        window = window.dropna(how = 'all').ffill()
+
+        if model == 'baseline':
+            dates = pd.date_range(start = window.index[-1], periods = horizon + 1, freq = 'D')[1:]
+            pred = pd.DataFrame(np.repeat(window.to_numpy(dtype = 'float64')[-1:], horizon, axis = 0), index = dates, columns = stations)
+            lower, upper = None, None
+        else:
+            builder = LagMatrixBuilder(lags = fitted['lags'], dtype = 'float64')
+            model_exog = self._select_exog(exog, stations, fitted['exog_names'])
+
+            if model_exog is not None:
+                dates = pd.date_range(start = window.index[-1], periods = horizon + 1, freq = 'D')[1:]
+                for station_exog in (model_exog.values() if isinstance(model_exog, dict) else [model_exog]):
+                    if station_exog.reindex(dates).isna().any().any():
+                        raise ValueError(f"Faltan variables exógenas entre {dates[0].date()} y {dates[-1].date()}")
+
+            pred = builder.predict_recursive(fitted['estimator'], window, steps = horizon, exog = model_exog)
+            lower, upper = fitted['residual_bounds']
+
+        frames = []
+        for station in stations:
+            frame = pd.DataFrame({'pred': pred[station].to_numpy()}, index = pred.index)
+            if lower is not None:
+                frame['lower_bound'] = frame['pred'] + lower
+                frame['upper_bound'] = frame['pred'] + upper
+
+            frames.append(frame.assign(station = station, model = model))
+
+        return frames
+
+
+    def forecast(self, stations, models = None, horizon = None, exog = None, flows = None):
+        """
+        Forecasts the flow of many stations with several models.
+
+        Args:
+            stations (list): Station codes.
+            models (list, optional): Names of the models. Defaults to the config value.
+            horizon (int, optional): Number of days. Defaults to the config value.
+            exog (pandas.DataFrame or dict, optional): Exogenous variables of the forecast days, shared by all the stations
+                or one frame per station. Defaults to None.
+            flows (dict, optional): Recent daily flow of the stations for the tree models and the baseline. Defaults to the flow of the
+                local store, or the flow stored with the models for the stations without stored data.
+
+        Returns:
+            pandas.DataFrame: Forecasts with the columns 'station', 'model', 'date', 'pred', 'lower_bound' and 'upper_bound'.
+        """
+        stations = [str(station) for station in stations]
+        models = models or self.default_models
+        horizon = horizon or self.horizon
+        flows = {str(station): flow for station, flow in (flows or {}).items()}
+
+        # Stations without flow from the caller start from the last observations of the store
+        if any(model in self.VECTORIZED for model in models):
+            flows = {**self.get_recent_flows([station for station in stations if station not in flows]), **flows}
+
+        frames = []
+        skipped = []
+
+        for model in models:
+            available = [station for station in stations if self.registry.get_versions(self.get_model_key(station, model), model)]
+            skipped += [(station, model) for station in stations if station not in available]
+
+            if model in self.VECTORIZED:
+                groups = {}
+                for station in available:
+                    groups.setdefault(self.get_model_key(station, model), []).append(station)
+
+                for key, group in groups.items():
+                    frames += self._forecast_vectorized(model, key, group, horizon, exog, flows)
+
+                continue
+
+            tasks = [(station, self.get_model_key(station, model), model, horizon, exog.get(station) if isinstance(exog, dict) else exog)
+                     for station in available]
+
+            if self.workers > 1 and len(tasks) > 1:
+                executor = self._get_executor()
+                results = [future.result() for future in [executor.submit(_forecast_station, *task) for task in tasks]]
+            else:
+                # A single task is run in this process, without the start-up of the pool
+                results = [_forecast_station(*task, registry = self.registry) for task in tasks]
+
+            frames += [forecast.assign(station = station, model = model) for station, model, forecast in results]
+
+        if skipped:
+            print(f"Modelos no registrados (estación, modelo): {skipped}")
+
+        if not frames:
+            return pd.DataFrame(columns = ['station', 'model', 'date', 'pred', 'lower_bound', 'upper_bound'])
+
+        result = pd.concat(frames).rename_axis('date').reset_index()
+
+        return result.reindex(columns = ['station', 'model', 'date', 'pred', 'lower_bound', 'upper_bound'])
+
+
+    def forecast_plants(self, plants, models = None, horizon = None, exog = None, flows = None):
+        """
+        Forecasts the flow at many power plants.
+
+        Args:
+            plants (list): Names of the plants.
+            models (list, optional): Names of the models. Defaults to the config value.
+            horizon (int, optional): Number of days. Defaults to the config value.
+            exog (pandas.DataFrame or dict, optional): Exogenous variables of the forecast days, by station if a dict. Defaults to None.
+            flows (dict, optional): Recent daily flow of the stations. Defaults to the flow stored with the models.
+
+        Returns:
+            pandas.DataFrame: Forecasts of the stations with the 'central' column first.
+        """
+        plant_stations = self.get_plant_stations(plants)
+        result = self.forecast(sorted(set(plant_stations.values())), models, horizon, exog, flows)
+
+        plant_map = pd.DataFrame({'central': list(plant_stations), 'station': list(plant_stations.values())})
+
+        return plant_map.merge(result, on = 'station', how = 'inner')
+
+
+def create_app(service = None):
+    """
+    Creates the HTTP application of the forecast service.
+
+    Endpoints:
+        GET /health: Status of the service.
+        GET /forecast?station=2121&station=...&model=lgbm&horizon=7: Forecasts of stations.
+        GET /forecast/plants?plant=...&model=lgbm&horizon=7: Forecasts of power plants.
+        POST /forecast, POST /forecast/plants: Same forecasts with the recent flow and the exogenous variables in the body:
+            {"stations": [...], "plants": [...], "models": [...], "horizon": 7,
+             "flows": {station: {date: flow}}, "exog": {variable: {date: value}},
+             "station_exog": {station: {variable: {date: value}}}}
+
+    The GET endpoints start from the flow of the local store and only serve models without exogenous variables.
+
+    Args:
+        service (ForecastService, optional): Service used by the endpoints. Defaults to a new one.
+
+    Returns:
+        fastapi.FastAPI: Application ready to be served with uvicorn.
+    """
+    from typing import Dict, List, Optional
+
+    from fastapi import FastAPI, HTTPException, Query
+    from pydantic import BaseModel
+
+    class ForecastRequest(BaseModel):
+        stations: List[str] = []
+        plants: List[str] = []
+        models: Optional[List[str]] = None
+        horizon: Optional[int] = None
+        flows: Dict[str, Dict[str, float]] = {}
+        exog: Optional[Dict[str, Dict[str, float]]] = None
+        station_exog: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None
+
+    service = service or ForecastService()
+    app = FastAPI(title = "Previsión de caudal")
+
+    def to_frame(values):
+        data = pd.DataFrame(values)
+        return data.set_index(pd.DatetimeIndex(pd.to_datetime(data.index))).sort_index()
+
+    def from_request(request):
+        flows = {station: to_frame({'flow': values})['flow'] for station, values in request.flows.items()}
+
+        if request.station_exog:
+            exog = {station: to_frame(values) for station, values in request.station_exog.items()}
+        else:
+            exog = to_frame(request.exog) if request.exog else None
+
+        return {'models': request.models, 'horizon': request.horizon, 'exog': exog, 'flows': flows}
+
+    def to_records(result):
+        result = result.assign(date = result['date'].dt.strftime('%Y-%m-%d'))
+        # Missing bounds are returned as null
+        return result.astype(object).where(result.notna(), None).to_dict(orient = 'records')
+
+    @app.get("/health")
+    def health():
+        return {'status': 'ok', 'models': service.default_models, 'horizon': service.horizon}
+
+    @app.get("/forecast")
+    def forecast(station: List[str] = Query(...), model: Optional[List[str]] = Query(None), horizon: Optional[int] = None):
+        try:
+            return to_records(service.forecast(station, model, horizon))
+        except (ValueError, FileNotFoundError) as e:
+            raise HTTPException(status_code = 400, detail = str(e))
+
+    @app.get("/forecast/plants")
+    def forecast_plants(plant: List[str] = Query(...), model: Optional[List[str]] = Query(None), horizon: Optional[int] = None):
+        try:
+            return to_records(service.forecast_plants(plant, model, horizon))
+        except (ValueError, FileNotFoundError) as e:
+            raise HTTPException(status_code = 400, detail = str(e))
+
+    @app.post("/forecast")
+    def forecast_data(request: ForecastRequest):
+        try:
+            return to_records(service.forecast(request.stations, **from_request(request)))
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            raise HTTPException(status_code = 400, detail = str(e))
+
+    @app.post("/forecast/plants")
+    def forecast_plants_data(request: ForecastRequest):
+        try:
+            return to_records(service.forecast_plants(request.plants, **from_request(request)))
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            raise HTTPException(status_code = 400, detail = str(e))
+
+    @app.on_event("shutdown")
+    def shutdown():
+        service.close()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    service = ForecastService()
+    service_config = service.config["Service"]
+    uvicorn.run(create_app(service), host = service_config["host"], port = service_config["port"])
@@ -0,0 +1,178 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+import os
+
+import yaml
+
+
+class LagMatrixBuilder:
+    """
+    Design matrices of autoregressive models for many stations at once.
+
+    Every row holds the lags of the flow of one station and day followed by the exogenous
+    variables of that day, as the skforecast forecasters ('lag_1', ..., exogenous columns).
+    The lags are read from a strided view of the series, so no shifted copies are created.
+    """
+
+    def __init__(self, lags = None, dtype = 'float32'):
+        """
+        Initializes the builder and loads configuration parameters.
+
+        Args:
+            lags (int or list, optional): Number of lags (1 to lags) or list of lags. Defaults to the config value.
+            dtype (str, optional): Data type of the matrices. Defaults to 'float32'.
+        """
+        self.load_config()
+
+        lags = lags if lags is not None else self.config["LagMatrix"]["lags"]
+        self.lags = np.arange(1, lags + 1) if np.isscalar(lags) else np.sort(np.asarray(lags, dtype = int))
+        self.max_lag = int(self.lags.max())
+        self.dtype = dtype
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_feature_names(self, exog_names = None):
+        """
+        Returns the names of the columns of the design matrix.
+
+        Args:
+            exog_names (list, optional): Names of the exogenous variables. Defaults to None.
+
+        Returns:
+            list: Names of the lags followed by the exogenous variables.
+        """
+        return [f"lag_{lag}" for lag in self.lags] + list(exog_names or [])
+
+
+    def _exog_array(self, exog, index, stations):
+        """
+        Aligns the exogenous variables with the dates and stations of the series.
+
+        Args:
+            exog (pandas.DataFrame or dict): Variables shared by all the stations, or a frame per station.
+            index (pandas.Index): Dates of the series.
+            stations (list): Stations of the series.
+
+        Returns:
+            tuple: Array of shape (dates, stations, variables) or (dates, 1, variables) if shared, and names of the variables.
+        """
+        if isinstance(exog, dict):
+            names = list(exog[stations[0]].columns)
+            values = np.stack([exog[station].reindex(index)[names].to_numpy(dtype = self.dtype) for station in stations], axis = 1)
+        else:
+            names = list(exog.columns)
+            values = exog.reindex(index).to_numpy(dtype = self.dtype)[:, None, :]
+
+        return values, names
+
+
+    def build(self, series, exog = None, dropna = True):
+        """
+        Builds the design matrix and the target of many stations.
+
+        Args:
+            series (pandas.DataFrame or pandas.Series): Daily flow with a column per station (or a single series).
+            exog (pandas.DataFrame or dict, optional): Exogenous variables indexed by date, shared by all the stations
+                or one frame per station. Defaults to None.
+            dropna (bool, optional): Whether to drop the rows with missing values. Defaults to True.
+
+        Returns:
+            tuple: C-contiguous matrix of shape (rows, features), target of shape (rows,) and a frame with the 'station' and 'date' of every row.
+        """
+        if isinstance(series, pd.Series):
+            series = series.to_frame(series.name if series.name is not None else 0)
+
+        stations = list(series.columns)
+        values = series.to_numpy(dtype = self.dtype)
+        n_dates, n_stations = values.shape
+        n_rows = n_dates - self.max_lag
+
+        if n_rows <= 0:
+            raise ValueError(f"Se necesitan más de {self.max_lag} fechas para construir la matriz de retardos")
+
+        # Strided view of shape (rows, stations, max_lag + 1), the last position is the target
+        windows = sliding_window_view(values, self.max_lag + 1, axis = 0)
+
+        exog_values, exog_names = (None, []) if exog is None else self._exog_array(exog, series.index, stations)
+        n_features = len(self.lags) + len(exog_names)
+
+        # Rows are ordered by station and then by date, the view is read only once per block
+        X = np.empty((n_stations, n_rows, n_features), dtype = self.dtype)
+        X[:, :, :len(self.lags)] = windows[:, :, self.max_lag - self.lags].transpose(1, 0, 2)
+
+        if exog_values is not None:
+            X[:, :, len(self.lags):] = exog_values[self.max_lag:].transpose(1, 0, 2)
+
+        X = X.reshape(n_stations * n_rows, n_features)
+        y = np.ascontiguousarray(windows[:, :, self.max_lag].T).reshape(-1)
+
+        keys = pd.DataFrame({'station': np.repeat(stations, n_rows),
+                             'date': np.tile(series.index[self.max_lag:], n_stations)})
+
+        if dropna == True:
+            mask = ~(np.isnan(X).any(axis = 1) | np.isnan(y))
+            if not mask.all():
+                X, y, keys = X[mask], y[mask], keys[mask].reset_index(drop = True)
+
+        return X, y, keys
+
+
+    def predict_recursive(self, model, last_window, steps = 7, exog = None, freq = 'D'):
+        """
+        Predicts the next steps of many stations, feeding every prediction back as a lag.
+
+        The model is called once per step with the rows of all the stations.
+
+        Args:
+            model: Fitted regressor with a predict method (e.g. LightGBM or XGBoost).
+            last_window (pandas.DataFrame): Last dates of the flow with a column per station, at least the largest lag.
+            steps (int, optional): Number of steps to predict. Defaults to 7.
+            exog (pandas.DataFrame or dict, optional): Exogenous variables of the predicted dates, shared or per station. Defaults to None.
+            freq (str, optional): Frequency of the series. Defaults to 'D'.
+
+        Returns:
+            pandas.DataFrame: Predictions with the predicted dates as index and a column per station.
+        """
+        if len(last_window) < self.max_lag:
+            raise ValueError(f"Se necesitan al menos {self.max_lag} fechas en la ventana")
+
+        stations = list(last_window.columns)
+        dates = pd.date_range(start = last_window.index[-1], periods = steps + 1, freq = freq)[1:]
+
+        # Buffer with the known values followed by the predictions, one row per station
+        history = np.empty((len(stations), self.max_lag + steps), dtype = self.dtype)
+        history[:, :self.max_lag] = last_window.to_numpy(dtype = self.dtype)[-self.max_lag:].T
+
+        exog_values, exog_names = (None, []) if exog is None else self._exog_array(exog, dates, stations)
+
+        X = np.empty((len(stations), len(self.lags) + len(exog_names)), dtype = self.dtype)
+
+        for step in range(steps):
+            position = self.max_lag + step
+            X[:, :len(self.lags)] = history[:, position - self.lags]
+
+            if exog_values is not None:
+                X[:, len(self.lags):] = exog_values[step]
+
+            history[:, position] = model.predict(X)
+
+        return pd.DataFrame(history[:, self.max_lag:].T, index = dates, columns = stations)
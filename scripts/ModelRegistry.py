@@ -0,0 +1,305 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import hashlib
+import json
+import os
+
+import yaml
+
+from FlowModels import FlowModels
+
+
+class ModelRegistry:
+    """
+    Versioned store of the fitted flow models and forecasts from the stored models.
+
+    Every version is a folder '{root}/{station}/{model}/v{version}' with the artifact in the native format
+    of its library (LightGBM text model, XGBoost UBJSON, SARIMAX results pickle, Prophet JSON) and a
+    metadata.json file with the parameters, the params_*.csv file they come from and the last days of
+    flow needed to forecast. Artifacts are loaded the first time they are used and then kept in memory.
+    """
+
+    # File of the artifact of every model
+    ARTIFACTS = {'baseline': None, 'lgbm': 'model.txt', 'xgb': 'model.ubj', 'sarimax': 'model.pkl', 'prophet': 'model.json'}
+
+    def __init__(self, root = None):
+        """
+        Initializes the registry and loads configuration parameters.
+
+        Args:
+            root (str, optional): Folder of the registry. Defaults to the config value.
+        """
+        self.load_config()
+        self.models = FlowModels()
+
+        registry_config = self.config["Registry"]
+        self.root = root or registry_config["root"]
+        self.default_model = registry_config["default_model"]
+
+        # Loaded models by (station, model, version)
+        self._cache = {}
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_path(self, station, model, version = None):
+        """
+        Returns the folder of a model or of one of its versions.
+
+        Args:
+            station (str): Station code.
+            model (str): Name of the model.
+            version (int, optional): Version. Defaults to None (folder of all the versions).
+
+        Returns:
+            str: Path of the folder.
+        """
+        path = os.path.join(self.root, str(station), model)
+
+        return path if version is None else os.path.join(path, f"v{version}")
+
+
+    def get_versions(self, station, model):
+        """
+        Lists the stored versions of a model.
+
+        Args:
+            station (str): Station code.
+            model (str): Name of the model.
+
+        Returns:
+            list: Versions in increasing order.
+        """
+        path = self.get_path(station, model)
+
+        if not os.path.exists(path):
+            return []
+
+        return sorted(int(name[1:]) for name in os.listdir(path) if name.startswith('v') and name[1:].isdigit())
+
+
+    def get_metadata(self, station, model = None, version = None):
+        """
+        Reads the metadata of a stored model.
+
+        Args:
+            station (str): Station code.
+            model (str, optional): Name of the model. Defaults to the config value.
+            version (int, optional): Version. Defaults to the latest one.
+
+        Returns:
+            dict: Metadata of the model.
+        """
+        model = model or self.default_model
+        versions = self.get_versions(station, model)
+
+        if not versions:
+            raise FileNotFoundError(f"No hay modelos {model} registrados para la estación {station}")
+
+        version = version or versions[-1]
+
+        with open(os.path.join(self.get_path(station, model, version), 'metadata.json'), 'r') as file:
+            return json.load(file)
+
+
+    def _get_params_source(self, model):
+        """
+        Identifies the params_*.csv file of a model by its path and content hash.
+
+        Args:
+            model (str): Name of the model.
+
+        Returns:
+            dict: Path and SHA-256 of the file, or None if the model has no file.
+        """
+        path = os.path.join(self.models.params_dir, f"params_{model}.csv")
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as file:
+            return {'path': path, 'sha256': hashlib.sha256(file.read()).hexdigest()}
+
+
+    def save(self, station, fitted, y):
+        """
+        Stores a fitted model as a new version.
+
+        Args:
+            station (str): Station code.
+            fitted (dict): Model fitted by FlowModels.fit.
+            y (pandas.Series or pandas.DataFrame): Daily flow used to fit the model, indexed by date, with a column per station for a shared model.
+
+        Returns:
+            int: Version of the stored model.
+        """
+        model = fitted['model']
+        version = (self.get_versions(station, model) or [0])[-1] + 1
+        path = self.get_path(station, model, version)
+        os.makedirs(path, exist_ok = True)
+
+        artifact = self.ARTIFACTS[model]
+
+        if model == 'lgbm':
+            fitted['estimator'].booster_.save_model(os.path.join(path, artifact))
+        elif model == 'xgb':
+            fitted['estimator'].save_model(os.path.join(path, artifact))
+        elif model == 'sarimax':
+            fitted['estimator'].save(os.path.join(path, artifact))
+        elif model == 'prophet':
+            from prophet.serialize import model_to_json
+
+            with open(os.path.join(path, artifact), 'w') as file:
+                file.write(model_to_json(fitted['estimator']))
+
+        # Days of flow needed by the recursive forecast of the trees, only the last day for the other models
+        window = max(fitted.get('lags', [1]))
+        last_window = y.iloc[-window:]
+
+        if isinstance(last_window, pd.DataFrame):
+            stored_window = {'dates': list(last_window.index.strftime('%Y-%m-%d')), 'columns': [str(col) for col in last_window.columns],
+                             'values': last_window.to_numpy(dtype = 'float64').tolist()}
+        else:
+            stored_window = {'dates': list(last_window.index.strftime('%Y-%m-%d')), 'values': [float(value) for value in last_window]}
+
+        metadata = {'station': str(station),
+                    'model': model,
+                    'version': version,
+                    'created': pd.Timestamp.now(tz = 'Europe/Madrid').isoformat(),
+                    'artifact': artifact,
+                    'params': {key: list(value) if isinstance(value, tuple) else value for key, value in fitted['params'].items()},
+                    'params_source': self._get_params_source(model),
+                    'exog_names': fitted['exog_names'],
+                    'lags': fitted.get('lags'),
+                    'residual_bounds': fitted.get('residual_bounds'),
+                    'level': self.models.level,
+                    'train_start': y.index[0].strftime('%Y-%m-%d'),
+                    'train_end': y.index[-1].strftime('%Y-%m-%d'),
+                    'last_window': stored_window}
+
+        with open(os.path.join(path, 'metadata.json'), 'w') as file:
+            json.dump(metadata, file, indent = 4, default = lambda value: value.item() if isinstance(value, np.generic) else str(value))
+
+        print(f"Modelo {model} de la estación {station} registrado como versión {version}")
+
+        return version
+
+
+    def train(self, station, model, y, exog = None, params = None):
+        """
+        Fits a model with FlowModels and stores it as a new version.
+
+        Args:
+            station (str): Station code.
+            model (str): Name of the model.
+            y (pandas.Series): Daily flow indexed by date.
+            exog (pandas.DataFrame, optional): Exogenous variables indexed by date. Defaults to None.
+            params (dict, optional): Hyperparameters. Defaults to the best ones of the params_*.csv file.
+
+        Returns:
+            int: Version of the stored model.
+        """
+        return self.save(station, self.models.fit(model, y, exog, params), y)
+
+
+    def load(self, station, model = None, version = None):
+        """
+        Loads a stored model in the format of FlowModels.fit, reading the artifact only once.
+
+        Args:
+            station (str): Station code.
+            model (str, optional): Name of the model. Defaults to the config value.
+            version (int, optional): Version. Defaults to the latest one.
+
+        Returns:
+            tuple: Fitted model and the last days of flow stored with it, a frame with a column per station for a shared model.
+        """
+        metadata = self.get_metadata(station, model, version)
+        key = (metadata['station'], metadata['model'], metadata['version'])
+
+        if key not in self._cache:
+            model = metadata['model']
+            path = os.path.join(self.get_path(*key), metadata['artifact']) if metadata['artifact'] else None
+
+            # The libraries are imported only when one of their models is used
+            if model == 'lgbm':
+                from lightgbm import Booster
+                estimator = Booster(model_file = path)
+            elif model == 'xgb':
+                from xgboost import XGBRegressor
+                estimator = XGBRegressor()
+                estimator.load_model(path)
+            elif model == 'sarimax':
+                from statsmodels.tsa.statespace.sarimax import SARIMAXResults
+                estimator = SARIMAXResults.load(path)
+            elif model == 'prophet':
+                from prophet.serialize import model_from_json
+                with open(path, 'r') as file:
+                    estimator = model_from_json(file.read())
+            else:
+                estimator = None
+
+            fitted = {'model': model, 'params': metadata['params'], 'exog_names': metadata['exog_names'], 'estimator': estimator}
+            if metadata['lags'] is not None:
+                fitted['lags'] = metadata['lags']
+                fitted['residual_bounds'] = metadata['residual_bounds']
+
+            stored_window = metadata['last_window']
+            dates = pd.DatetimeIndex(stored_window['dates'])
+
+            # Shared models keep the last days of every station
+            if 'columns' in stored_window:
+                last_window = pd.DataFrame(stored_window['values'], index = dates, columns = stored_window['columns'])
+            else:
+                last_window = pd.Series(stored_window['values'], index = dates, name = 'flow')
+            self._cache[key] = (fitted, last_window)
+
+        return self._cache[key]
+
+
+    def predict(self, station, horizon = 7, model = None, version = None, exog = None, y = None, column = None):
+        """
+        Forecasts the flow of a station with a stored model, without refitting it.
+
+        Args:
+            station (str): Station code, or key of a model shared by several stations.
+            horizon (int, optional): Number of days. Defaults to 7.
+            model (str, optional): Name of the model. Defaults to the config value.
+            version (int, optional): Version. Defaults to the latest one.
+            exog (pandas.DataFrame, optional): Exogenous variables of the forecast days, required if the model uses them. Defaults to None.
+            y (pandas.Series, optional): Recent flow to forecast from, only used by the trees and the baseline. Defaults to the flow stored with the model.
+            column (str, optional): Station to forecast with a shared model, required for those models. Defaults to None.
+
+        Returns:
+            pandas.DataFrame: Forecast indexed by date.
+        """
+        fitted, last_window = self.load(station, model, version)
+
+        # Shared models store the last days of every station, forecast only the requested one
+        if isinstance(last_window, pd.DataFrame):
+            if column is None or str(column) not in last_window.columns:
+                raise ValueError(f"El modelo {station} es compartido, indique una de sus estaciones: {list(last_window.columns)}")
+
+            last_window = last_window[str(column)].rename('flow')
+
+        # SARIMAX and Prophet forecast from the end of their training data
+        if y is None or fitted['model'] in ('sarimax', 'prophet'):
+            y = last_window
+
+        return self.models.forecast(fitted, y, exog, steps = horizon)
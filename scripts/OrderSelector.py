@@ -0,0 +1,222 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import warnings
+import os
+
+import yaml
+
+
+# Differenced series shared by the fits of a worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(endog, exog, s, maxiter):
+    """
+    Stores in a worker process the differenced series used by all the fits.
+
+    Args:
+        endog (numpy.ndarray): Differenced flow.
+        exog (numpy.ndarray): Differenced exogenous variables, or None.
+        s (int): Seasonal period.
+        maxiter (int): Maximum iterations of the optimizer.
+    """
+    _WORKER.update({'endog': endog, 'exog': exog, 's': s, 'maxiter': maxiter})
+
+
+def _fit_order(candidate, start_params = None):
+    """
+    Fits a SARIMA model of the differenced series.
+
+    Args:
+        candidate (tuple): Orders (p, q, P, Q).
+        start_params (dict, optional): Parameters of a neighbouring order by name, used as starting point. Defaults to None.
+
+    Returns:
+        tuple: Orders, AIC, whether the optimizer converged and fitted parameters by name.
+    """
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    p, q, P, Q = candidate
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+
+            model = SARIMAX(_WORKER['endog'], exog = _WORKER['exog'], order = (p, 0, q), seasonal_order = (P, 0, Q, _WORKER['s']))
+
+            if start_params is not None:
+                # Parameters shared with the neighbour start at its values, the new lags start at zero
+                start_params = np.array([start_params.get(name, 0.0) for name in model.param_names])
+
+            result = model.fit(start_params = start_params, disp = False, maxiter = _WORKER['maxiter'])
+
+    except (np.linalg.LinAlgError, ValueError):
+        return candidate, np.nan, False, None
+
+    converged = bool(result.mle_retvals.get('converged', True)) if result.mle_retvals else True
+
+    return candidate, float(result.aic), converged, dict(zip(model.param_names, result.params))
+
+
+class OrderSelector:
+    """
+    Selection of the SARIMAX orders (p, q, P, Q) by AIC, fitting the candidates in a process pool.
+
+    The flow and exogenous variables are differenced once (d regular and D seasonal differences) and the
+    candidates are fitted as SARMA models of the differenced series. This is an approximation of fitting
+    every SARIMAX with d and D: the first d + D * s days are dropped and the likelihood is conditioned on
+    them instead of on the diffuse initial state, so the AIC and the best order can differ from a full
+    SARIMAX search. Candidates are fitted in waves of increasing p + q + P + Q, every fit starting from
+    the parameters of its best neighbour of the previous wave, and the fits that do not converge within
+    maxiter iterations are discarded.
+    """
+
+    def __init__(self, max_orders = None, workers = None, maxiter = None):
+        """
+        Initializes the selector and loads configuration parameters.
+
+        Args:
+            max_orders (list, optional): Largest p, q, P and Q. Defaults to the config value.
+            workers (int, optional): Number of processes. Defaults to the config value.
+            maxiter (int, optional): Maximum iterations of every fit. Defaults to the config value.
+        """
+        self.load_config()
+
+        selector_config = self.config["OrderSelector"]
+        sarimax_config = self.config["Models"]["sarimax"]
+        self.max_orders = max_orders or selector_config["max_orders"]
+        self.workers = workers or selector_config["workers"]
+        self.maxiter = maxiter or selector_config["maxiter"]
+        self.d = sarimax_config["d"]
+        self.D = sarimax_config["D"]
+        self.s = sarimax_config["s"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_candidates(self):
+        """
+        Returns all the candidate orders.
+
+        Returns:
+            list: Orders (p, q, P, Q) in the order of the params_sarimax.csv index.
+        """
+        return list(product(*[range(max_order + 1) for max_order in self.max_orders]))
+
+
+    def difference(self, values):
+        """
+        Applies the regular and seasonal differences of the model.
+
+        Args:
+            values (numpy.ndarray): Series of shape (dates,) or (dates, variables).
+
+        Returns:
+            numpy.ndarray: Differenced series.
+        """
+        for _ in range(self.d):
+            values = values[1:] - values[:-1]
+
+        for _ in range(self.D):
+            values = values[self.s:] - values[:-self.s]
+
+        return values
+
+
+    def get_start_params(self, candidate, results):
+        """
+        Returns the parameters of the best converged neighbour of a candidate.
+
+        Neighbours have one of the orders one lag lower than the candidate.
+
+        Args:
+            candidate (tuple): Orders (p, q, P, Q).
+            results (dict): Fitted candidates with their AIC, convergence and parameters.
+
+        Returns:
+            dict: Parameters by name, or None if no neighbour converged.
+        """
+        neighbours = []
+        for position in range(len(candidate)):
+            if candidate[position] == 0:
+                continue
+
+            neighbour = candidate[:position] + (candidate[position] - 1,) + candidate[position + 1:]
+            aic, converged, params = results.get(neighbour, (np.nan, False, None))
+
+            if converged == True:
+                neighbours.append((aic, params))
+
+        return min(neighbours, key = lambda item: item[0])[1] if neighbours else None
+
+
+    def select(self, y, exog = None, output_path = None):
+        """
+        Fits all the candidate orders and ranks them by the AIC of their SARMA model of the differenced series.
+
+        Args:
+            y (pandas.Series): Daily flow indexed by date.
+            exog (pandas.DataFrame, optional): Exogenous variables indexed by the same dates. Defaults to None.
+            output_path (str, optional): Path where the table is written as params_sarimax.csv. Defaults to None (not written).
+
+        Returns:
+            pandas.DataFrame: Converged orders with the columns '(p,q,P,Q)' and 'AIC', sorted by AIC.
+        """
+        # The differences are computed once for all the candidates
+        endog = self.difference(y.to_numpy(dtype = 'float64'))
+        exog_values = self.difference(exog.reindex(y.index).to_numpy(dtype = 'float64')) if exog is not None else None
+
+        candidates = self.get_candidates()
+        waves = {}
+        for candidate in candidates:
+            waves.setdefault(sum(candidate), []).append(candidate)
+
+        results = {}
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers = self.workers, initializer = _init_worker, initargs = (endog, exog_values, self.s, self.maxiter)) as executor:
+                for wave in sorted(waves):
+                    futures = [executor.submit(_fit_order, candidate, self.get_start_params(candidate, results)) for candidate in waves[wave]]
+
+                    for future in futures:
+                        candidate, aic, converged, params = future.result()
+                        results[candidate] = (aic, converged, params)
+        else:
+            # A single worker fits in this process, without the start-up of a pool
+            _init_worker(endog, exog_values, self.s, self.maxiter)
+
+            for wave in sorted(waves):
+                for candidate in waves[wave]:
+                    candidate, aic, converged, params = _fit_order(candidate, self.get_start_params(candidate, results))
+                    results[candidate] = (aic, converged, params)
+
+        discarded = sum(1 for aic, converged, _ in results.values() if converged == False or np.isnan(aic))
+        print(f"Órdenes ajustados: {len(results) - discarded}, descartados por no converger: {discarded}")
+
+        table = pd.DataFrame({'(p,q,P,Q)': [str(candidate) for candidate in candidates],
+                              'AIC': [results[candidate][0] if results[candidate][1] == True else np.nan for candidate in candidates]})
+        table = table.dropna(subset = ['AIC']).sort_values(by = 'AIC')
+
+        if output_path is not None:
+            table.to_csv(output_path)
+
+        return table
@@ -0,0 +1,124 @@
+# Libraries
+import asyncio
+import threading
+import time
+
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter usable from threads and from asyncio coroutines.
+    """
+
+    def __init__(self, rate, capacity = None):
+        """
+        Initializes the bucket.
+
+        Args:
+            rate (float): Number of tokens added per second.
+            capacity (float, optional): Maximum number of tokens (burst size). Defaults to max(1, rate).
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens = 1):
+        """
+        Takes tokens from the bucket, going into debt if needed.
+
+        Args:
+            tokens (float, optional): Number of tokens to take. Defaults to 1.
+
+        Returns:
+            float: Seconds the caller must wait before using the reserved tokens.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= tokens
+
+            if self.tokens >= 0:
+                return 0.0
+
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens = 1):
+        """
+        Blocks the current thread until the tokens are available.
+
+        Args:
+            tokens (float, optional): Number of tokens to take. Defaults to 1.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens = 1):
+        """
+        Waits without blocking the event loop until the tokens are available.
+
+        Args:
+            tokens (float, optional): Number of tokens to take. Defaults to 1.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    Keeps an independent token bucket for every host.
+    """
+
+    def __init__(self, rate, capacity = None):
+        """
+        Initializes the limiter.
+
+        Args:
+            rate (float): Requests per second allowed for each host.
+            capacity (float, optional): Burst size for each host. Defaults to max(1, rate).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, url):
+        """
+        Returns the bucket of the host of a URL, creating it if needed.
+
+        Args:
+            url (str): URL of the request.
+
+        Returns:
+            TokenBucket: Bucket associated with the host.
+        """
+        host = urlparse(url).netloc
+
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.capacity)
+
+            return self.buckets[host]
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the host of the URL is allowed.
+
+        Args:
+            url (str): URL of the request.
+        """
+        self.get_bucket(url).acquire()
+
+    async def acquire_async(self, url):
+        """
+        Waits without blocking the event loop until a request to the host of the URL is allowed.
+
+        Args:
+            url (str): URL of the request.
+        """
+        await self.get_bucket(url).acquire_async()
@@ -0,0 +1,192 @@
+# Libraries
+import pandas as pd
+
+import re
+import os
+
+import yaml
+
+
+class Resampler:
+    """
+    Resampling of weather frames (e.g. hourly to daily) with an aggregation rule per variable.
+
+    The rule of every numeric variable is the one of the first pattern of the rules that matches
+    its name, or the default rule if none matches. Text variables use the categorical rule.
+    """
+
+    def __init__(self, rules = None, default = None, categorical = None):
+        """
+        Initializes the resampler and loads configuration parameters.
+
+        Args:
+            rules (list, optional): Pairs of regular expression and aggregation (e.g. ['^rain', 'sum']). Defaults to the config value.
+            default (str, optional): Aggregation of the numeric variables without rule. Defaults to the config value.
+            categorical (str, optional): Aggregation of the text variables. Defaults to the config value.
+        """
+        self.load_config()
+
+        resample_config = self.config["Resample"]
+        self.rules = [(re.compile(pattern), agg) for pattern, agg in (rules or resample_config["rules"])]
+        self.default = default or resample_config["default"]
+        self.categorical = categorical or resample_config["categorical"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_aggregations(self, data, date_col = 'date'):
+        """
+        Assigns an aggregation to every variable of a frame.
+
+        Args:
+            data (pandas.DataFrame): Frame with the variables.
+            date_col (str, optional): Name of the date column, which is not aggregated. Defaults to 'date'.
+
+        Returns:
+            dict: Aggregation of every variable.
+        """
+        aggregations = {}
+
+        for col in data.columns:
+            if col == date_col:
+                continue
+
+            if not pd.api.types.is_numeric_dtype(data[col]) or pd.api.types.is_bool_dtype(data[col]):
+                aggregations[col] = self.categorical
+                continue
+
+            aggregations[col] = next((agg for pattern, agg in self.rules if pattern.search(str(col))), self.default)
+
+        return aggregations
+
+
+    def _aggregate(self, data, freq, aggregations):
+        """
+        Aggregates a frame indexed by date into buckets labelled by their first date.
+
+        Args:
+            data (pandas.DataFrame): Frame indexed by date.
+            freq (str): Frequency of the buckets.
+            aggregations (dict): Aggregation of every variable.
+
+        Returns:
+            pandas.DataFrame: One row per bucket with data.
+        """
+        buckets = data.resample(freq, label = 'left', closed = 'left')
+        result = buckets.agg(aggregations)
+
+        # Buckets without any observation are not created by the chunks either
+        return result[buckets.size().to_numpy() > 0]
+
+
+    def resample(self, data, freq = 'D', date_col = 'date'):
+        """
+        Resamples a frame in a single vectorized step.
+
+        Args:
+            data (pandas.DataFrame): Frame with a date column and the variables.
+            freq (str, optional): Frequency of the result. Defaults to 'D'.
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+
+        Returns:
+            pandas.DataFrame: Resampled frame with the date column first.
+        """
+        aggregations = self.get_aggregations(data, date_col)
+        data = data.set_index(pd.DatetimeIndex(pd.to_datetime(data[date_col]), name = date_col)).drop(columns = date_col)
+
+        return self._aggregate(data, freq, aggregations).reset_index()
+
+
+    def resample_stream(self, chunks, freq = 'D', date_col = 'date'):
+        """
+        Resamples a sequence of consecutive chunks, holding in memory only one chunk at a time.
+
+        The rows of the last bucket of a chunk may continue in the next one, so they are carried
+        over and aggregated with it.
+
+        Args:
+            chunks (iterable): Frames in chronological order, each with a date column and the same variables.
+            freq (str, optional): Frequency of the result. Defaults to 'D'.
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+
+        Yields:
+            pandas.DataFrame: Resampled rows of the complete buckets of every chunk.
+        """
+        carry = None
+        aggregations = None
+
+        for chunk in chunks:
+            if chunk is None or len(chunk) == 0:
+                continue
+
+            if aggregations is None:
+                aggregations = self.get_aggregations(chunk, date_col)
+
+            chunk = chunk.set_index(pd.DatetimeIndex(pd.to_datetime(chunk[date_col]), name = date_col)).drop(columns = date_col)
+
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+
+            result = self._aggregate(chunk, freq, aggregations)
+
+            # The last bucket is completed with the next chunk
+            last_bucket = result.index[-1]
+            carry = chunk[chunk.index >= last_bucket]
+
+            if len(result) > 1:
+                yield result.iloc[:-1].reset_index()
+
+        if carry is not None and len(carry) > 0:
+            yield self._aggregate(carry, freq, aggregations).reset_index()
+
+
+    def resample_store(self, store, station, source, freq = 'D', months_per_chunk = 12, write_source = None):
+        """
+        Resamples a series of the store reading it by chunks of months.
+
+        Args:
+            store (TimeSeriesStore): Store with the series.
+            station (str): Station code or location key.
+            source (str): Source of the data.
+            freq (str, optional): Frequency of the result. Defaults to 'D'.
+            months_per_chunk (int, optional): Months read at once. Defaults to 12.
+            write_source (str, optional): Source where the result is also written in the store. Defaults to None (not written).
+
+        Returns:
+            pandas.DataFrame: Resampled series.
+        """
+        first, last = store.get_date_range(station, source)
+
+        if first is None:
+            return pd.DataFrame()
+
+        def chunks():
+            start = first.normalize().replace(day = 1)
+
+            while start <= last:
+                end = start + pd.DateOffset(months = months_per_chunk)
+                # The end of the read is inclusive, stop just before the next chunk
+                yield store.read(station, source, start = start, end = end - pd.Timedelta(microseconds = 1))
+                start = end
+
+        results = []
+        for result in self.resample_stream(chunks(), freq = freq):
+            if write_source is not None:
+                store.write(result, station, write_source)
+            results.append(result)
+
+        return pd.concat(results, ignore_index = True) if results else pd.DataFrame()
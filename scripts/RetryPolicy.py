@@ -0,0 +1,287 @@
+# Libraries
+import asyncio
+import json
+import random
+import time
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+class _ErrorResponse:
+    """
+    Minimal response built from the status and headers of an aiohttp error.
+    """
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class RetryPolicy:
+    """
+    Retry policy with jittered exponential backoff, usable from threads and from asyncio coroutines.
+
+    Errors are classified before deciding whether to retry:
+    - 'rate_limit': HTTP 429 or a quota message, waits Retry-After or at least rate_limit_delay.
+    - 'server': HTTP 5xx, retried with backoff.
+    - 'network': connection errors and timeouts, retried with backoff.
+    - 'parse': malformed or truncated responses, retried at most parse_attempts times.
+    - 'client': any other error (e.g. HTTP 400), not retried.
+    """
+
+    RETRYABLE = ('rate_limit', 'server', 'network', 'parse')
+
+    # Names of the network errors of requests and aiohttp, which are not subclasses of the built-in ones
+    NETWORK_ERRORS = ('ConnectionError', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'ChunkedEncodingError',
+                      'ClientConnectorError', 'ClientOSError', 'ServerDisconnectedError', 'ClientPayloadError')
+
+    def __init__(self, max_attempts = 5, base_delay = 1.0, max_delay = 60.0, rate_limit_delay = 60.0, parse_attempts = 2):
+        """
+        Initializes the policy.
+
+        Args:
+            max_attempts (int, optional): Maximum number of attempts, including the first one. Defaults to 5.
+            base_delay (float, optional): Delay in seconds of the first backoff step. Defaults to 1.0.
+            max_delay (float, optional): Upper bound of the backoff delay in seconds. Defaults to 60.0.
+            rate_limit_delay (float, optional): Minimum wait after a rate limit error without Retry-After. Defaults to 60.0.
+            parse_attempts (int, optional): Maximum number of attempts for parse errors. Defaults to 2.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.parse_attempts = parse_attempts
+
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Creates a policy from a configuration section.
+
+        Args:
+            config (dict): Section with any of the arguments of the constructor.
+
+        Returns:
+            RetryPolicy: Configured policy.
+        """
+        keys = ['max_attempts', 'base_delay', 'max_delay', 'rate_limit_delay', 'parse_attempts']
+
+        return cls(**{key: config[key] for key in keys if key in config})
+
+
+    def _get_response(self, error):
+        """
+        Looks for an HTTP response attached to an error or to the errors that caused it.
+
+        Args:
+            error (Exception): Raised error.
+
+        Returns:
+            requests.Response or None: Response of the failed request if there is one.
+        """
+        while error is not None:
+            response = getattr(error, 'response', None)
+            if response is not None and hasattr(response, 'status_code'):
+                return response
+
+            # aiohttp errors carry the status and the headers themselves
+            if isinstance(getattr(error, 'status', None), int):
+                return _ErrorResponse(error.status, getattr(error, 'headers', None))
+
+            error = error.__cause__ or error.__context__
+
+        return None
+
+
+    def classify(self, error):
+        """
+        Classifies an error.
+
+        Args:
+            error (Exception): Raised error.
+
+        Returns:
+            str: 'rate_limit', 'server', 'network', 'parse' or 'client'.
+        """
+        response = self._get_response(error)
+
+        if response is not None:
+            if response.status_code == 429:
+                return 'rate_limit'
+            if response.status_code >= 500:
+                return 'server'
+            return 'client'
+
+        # Some clients only keep the error message of the API
+        message = str(error).lower()
+        if '429' in message or 'limit exceeded' in message or 'too many requests' in message:
+            return 'rate_limit'
+
+        current = error
+        while current is not None:
+            if isinstance(current, (ConnectionError, TimeoutError)) or type(current).__name__ in self.NETWORK_ERRORS:
+                return 'network'
+            if isinstance(current, (json.JSONDecodeError, ValueError, KeyError, IndexError)):
+                return 'parse'
+            current = current.__cause__ or current.__context__
+
+        return 'client'
+
+
+    def get_retry_after(self, error):
+        """
+        Reads the Retry-After header of a failed request.
+
+        Args:
+            error (Exception): Raised error.
+
+        Returns:
+            float or None: Seconds to wait or None if the header is missing or invalid.
+        """
+        response = self._get_response(error)
+
+        if response is None or getattr(response, 'headers', None) is None:
+            return None
+
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        # The header may also be an HTTP date
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+    def get_delay(self, attempt, error, kind = None):
+        """
+        Computes the wait before the next attempt.
+
+        Args:
+            attempt (int): Number of failed attempts so far (starting at 1).
+            error (Exception): Raised error.
+            kind (str, optional): Class of the error. Defaults to None (classified here).
+
+        Returns:
+            float: Seconds to wait.
+        """
+        kind = kind or self.classify(error)
+        retry_after = self.get_retry_after(error)
+
+        if retry_after is not None:
+            return retry_after
+
+        # Full jitter keeps concurrent callers from retrying at the same time
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+        if kind == 'rate_limit':
+            delay = max(delay, self.rate_limit_delay)
+
+        return delay
+
+
+    def should_retry(self, attempt, kind):
+        """
+        Decides whether a failed call must be retried.
+
+        Args:
+            attempt (int): Number of failed attempts so far (starting at 1).
+            kind (str): Class of the error.
+
+        Returns:
+            bool: True if there must be another attempt.
+        """
+        if kind not in self.RETRYABLE:
+            return False
+
+        if kind == 'parse':
+            return attempt < min(self.parse_attempts, self.max_attempts)
+
+        return attempt < self.max_attempts
+
+
+    def _on_error(self, attempt, error):
+        """
+        Handles a failed attempt.
+
+        Args:
+            attempt (int): Number of failed attempts so far (starting at 1).
+            error (Exception): Raised error.
+
+        Returns:
+            float or None: Seconds to wait before retrying or None if the error must be raised.
+        """
+        kind = self.classify(error)
+
+        if not self.should_retry(attempt, kind):
+            print(f"Ocurrió un error ({kind}): {error}. No se reintenta tras {attempt} intentos.")
+            return None
+
+        delay = self.get_delay(attempt, error, kind)
+        print(f"Ocurrió un error ({kind}): {error}. Intento {attempt} de {self.max_attempts}, reintentando en {delay:.1f} segundos...")
+
+        return delay
+
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls a function, retrying it according to the policy.
+
+        Args:
+            func (callable): Function to call.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            Any: Result of the function.
+        """
+        attempt = 0
+
+        while True:
+            try:
+                return func(*args, **kwargs)
+
+            except Exception as e:
+                attempt += 1
+                delay = self._on_error(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+
+    async def call_async(self, func, *args, **kwargs):
+        """
+        Calls a function from a coroutine, retrying it according to the policy without blocking the event loop.
+
+        Blocking functions run in a worker thread, so other calls keep running while one is backing off.
+
+        Args:
+            func (callable): Coroutine function or blocking function to call.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            Any: Result of the function.
+        """
+        attempt = 0
+
+        while True:
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    return await func(*args, **kwargs)
+
+                return await asyncio.to_thread(func, *args, **kwargs)
+
+            except Exception as e:
+                attempt += 1
+                delay = self._on_error(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
@@ -0,0 +1,216 @@
+# Libraries
+import pandas as pd
+
+import asyncio
+import aiohttp
+from concurrent.futures import ProcessPoolExecutor
+
+import json
+import os
+
+import yaml
+
+from UrlDefinition import UrlDefinition
+
+from RateLimiter import HostRateLimiter
+
+from Utils import Utils
+
+
+class StationCrawler:
+    """
+    Asynchronous crawler for the gauges and reservoirs pages of the SAIH Duero.
+    """
+
+    def __init__(self, max_concurrency = None, rate_per_host = None, workers = None):
+        """
+        Initializes the crawler and loads configuration parameters.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of simultaneous requests. Defaults to the config value.
+            rate_per_host (float, optional): Maximum requests per second to each host. Defaults to the config value.
+            workers (int, optional): Number of processes used to parse the pages. Defaults to the config value.
+        """
+        self.load_config()
+        self.obj_url = UrlDefinition()
+        self.func = Utils()
+
+        crawler_config = self.config["Crawler"]
+        self.max_concurrency = max_concurrency or crawler_config["max_concurrency"]
+        self.rate_per_host = rate_per_host or crawler_config["rate_per_host"]
+        self.workers = workers or crawler_config["workers"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def load_empty_index(self):
+        """
+        Loads the persisted index of codes that returned no station in previous crawls.
+
+        Returns:
+            dict: Mapping between station type ('aforos' or 'embalses') and the set of empty codes.
+        """
+        path = self.config["DirResources"]["empty_codes"]
+
+        if not os.path.exists(path):
+            return {}
+
+        with open(path, "r") as file:
+            index = json.load(file)
+
+        return {type_st: set(codes) for type_st, codes in index.items()}
+
+
+    def save_empty_index(self, index):
+        """
+        Persists the index of codes that returned no station.
+
+        Args:
+            index (dict): Mapping between station type and the set of empty codes.
+        """
+        path = self.config["DirResources"]["empty_codes"]
+
+        with open(path, "w") as file:
+            json.dump({type_st: sorted(codes) for type_st, codes in index.items()}, file)
+
+
+    def get_url(self, station_code, type_st):
+        """
+        Generates the URL of a station page.
+
+        Args:
+            station_code (int): Code of the station.
+            type_st (str): Type of station ('aforos' for gauges, 'embalses' for reservoirs).
+
+        Returns:
+            str: URL of the station page.
+        """
+        if type_st == 'aforos':
+            return self.obj_url.get_url_gauges_reservoirs(station_code, 'EA')
+        elif type_st == 'embalses':
+            return self.obj_url.get_url_gauges_reservoirs(station_code, 'EM')
+        else:
+            raise ValueError("Tipo de estación no válido")
+
+
+    async def _fetch(self, session, semaphore, limiter, pool, station_code, type_st):
+        """
+        Downloads and parses the page of one station.
+
+        Args:
+            session (aiohttp.ClientSession): Shared session.
+            semaphore (asyncio.Semaphore): Limit of simultaneous requests.
+            limiter (HostRateLimiter): Rate limiter per host.
+            pool (ProcessPoolExecutor): Pool used to parse the pages.
+            station_code (int): Code of the station.
+            type_st (str): Type of station.
+
+        Returns:
+            tuple: Station code and parsed DataFrame, None if the code has no station or False if the download or the parsing failed.
+        """
+        url = self.get_url(station_code, type_st)
+
+        async with semaphore:
+            await limiter.acquire_async(url)
+
+            try:
+                async with session.get(url) as response:
+                    if response.status != 200:
+                        print("Error descargando la estación", station_code, ":", response.status)
+                        return station_code, False
+
+                    html = await response.read()
+
+            except Exception as e:
+                print("Error descargando la estación", station_code, ":", e)
+                return station_code, False
+
+        # Parse outside the semaphore so the next downloads can start
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(pool, Utils.parse_gauges_reservoirs, html, station_code)
+
+        return station_code, data
+
+
+    async def _crawl(self, codes, type_st):
+        """
+        Crawls a list of station codes concurrently.
+
+        Args:
+            codes (list): Station codes to crawl.
+            type_st (str): Type of station.
+
+        Returns:
+            list: Tuples with the station code and the result of each download.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = HostRateLimiter(self.rate_per_host)
+        connector = aiohttp.TCPConnector(limit = self.max_concurrency)
+
+        with ProcessPoolExecutor(max_workers = self.workers) as pool:
+            async with aiohttp.ClientSession(connector = connector) as session:
+                tasks = [self._fetch(session, semaphore, limiter, pool, code, type_st) for code in codes]
+                return await asyncio.gather(*tasks)
+
+
+    def crawl(self, type_st, codes = None, skip_empty = True):
+        """
+        Retrieves information about all gauges or reservoirs using concurrent requests.
+
+        Args:
+            type_st (str): Type of station ('aforos' for gauges, 'embalses' for reservoirs).
+            codes (list, optional): Station codes to crawl. Defaults to all codes between 1 and 999.
+            skip_empty (bool, optional): Whether to skip the codes that returned no station last time. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing information about all stations.
+        """
+        if codes is None:
+            codes = range(1, 1000)
+
+        index = self.load_empty_index()
+        empty_codes = index.get(type_st, set())
+
+        if skip_empty == True:
+            codes = [code for code in codes if code not in empty_codes]
+        else:
+            codes = list(codes)
+
+        results = self.func.run_coroutine(self._crawl(codes, type_st))
+
+        # Update the index of empty codes, failed downloads and unparseable pages are left as they were
+        df_list = []
+        for code, data in results:
+            if data is None:
+                empty_codes.add(code)
+            elif data is not False:
+                empty_codes.discard(code)
+                df_list.append(data)
+
+        index[type_st] = empty_codes
+        self.save_empty_index(index)
+
+        if not df_list:
+            print("No se encontraron estaciones")
+            return pd.DataFrame()
+
+        # Consolidate the information
+        df = pd.concat(df_list, axis = 0, ignore_index = True).reset_index(drop = True)
+
+        df = self.func.reproject_dataframe(df)
+
+        return df
@@ -0,0 +1,211 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from sklearn.neighbors import BallTree
+
+import yaml
+
+import os
+
+
+class StationLocator:
+    """
+    Nearest station lookups between power plants and the weather stations, gauges and reservoirs catalogs.
+    """
+
+    # Mean Earth radius in kilometres
+    EARTH_RADIUS_KM = 6371.0088
+
+    # Catalogs and indexes shared by all the instances, loaded only once per file
+    _catalogs = {}
+    _trees = {}
+
+    def __init__(self):
+        """
+        Initializes StationLocator object and loads configuration parameters.
+        """
+        self.load_config()
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def load_catalog(self, catalog):
+        """
+        Loads a catalog of locations, reading the file only the first time.
+
+        Args:
+            catalog (str): Name of the catalog ('estaciones', 'aforos', 'embalses' or 'centrales').
+
+        Returns:
+            pandas.DataFrame: Catalog with latitude in column 'X' and longitude in column 'Y'.
+        """
+        path = self.config["DirResources"][catalog]
+
+        if path not in StationLocator._catalogs:
+            if catalog == 'centrales':
+                data = pd.read_csv(path, encoding = 'utf-8-sig', sep = ';', decimal = ',')
+            else:
+                data = pd.read_csv(path, encoding = 'ISO-8859-1', sep = ',')
+
+            data = data.dropna(subset = ['X', 'Y']).reset_index(drop = True)
+            StationLocator._catalogs[path] = data
+
+        return StationLocator._catalogs[path]
+
+
+    def get_index(self, catalog):
+        """
+        Returns the haversine BallTree of a catalog, building it only the first time.
+
+        Args:
+            catalog (str): Name of the catalog.
+
+        Returns:
+            sklearn.neighbors.BallTree: Index over the catalog coordinates in radians.
+        """
+        path = self.config["DirResources"][catalog]
+
+        if path not in StationLocator._trees:
+            data = self.load_catalog(catalog)
+            coords = np.radians(data[['X', 'Y']].to_numpy(dtype = 'float64'))
+            StationLocator._trees[path] = BallTree(coords, metric = 'haversine')
+
+        return StationLocator._trees[path]
+
+
+    def _to_radians(self, lat, lon):
+        """
+        Builds the array of query points in radians.
+
+        Args:
+            lat (float or array-like): Latitudes of the query points.
+            lon (float or array-like): Longitudes of the query points.
+
+        Returns:
+            numpy.ndarray: Array of shape (n, 2) with latitude and longitude in radians.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype = 'float64'))
+        lon = np.atleast_1d(np.asarray(lon, dtype = 'float64'))
+
+        return np.radians(np.column_stack([lat, lon]))
+
+
+    def _build_result(self, catalog, query_idx, station_idx, distances):
+        """
+        Builds the result table of a query.
+
+        Args:
+            catalog (str): Name of the queried catalog.
+            query_idx (numpy.ndarray): Position of the query point of each match.
+            station_idx (numpy.ndarray): Position in the catalog of each match.
+            distances (numpy.ndarray): Distance in radians of each match.
+
+        Returns:
+            pandas.DataFrame: One row per match with the query position, the rank, the catalog row and the distance in km.
+        """
+        data = self.load_catalog(catalog)
+
+        result = data.iloc[station_idx].reset_index(drop = True)
+        result.insert(0, 'query', query_idx)
+        result['distancia_km'] = distances * self.EARTH_RADIUS_KM
+
+        result = result.sort_values(by = ['query', 'distancia_km'], kind = 'stable').reset_index(drop = True)
+        result.insert(1, 'rank', result.groupby('query').cumcount() + 1)
+
+        return result
+
+
+    def query_nearest(self, lat, lon, catalog = 'estaciones', k = 1):
+        """
+        Finds the k nearest locations of a catalog for a batch of points.
+
+        Args:
+            lat (float or array-like): Latitudes of the query points.
+            lon (float or array-like): Longitudes of the query points.
+            catalog (str, optional): Name of the catalog. Defaults to 'estaciones'.
+            k (int, optional): Number of neighbours per point. Defaults to 1.
+
+        Returns:
+            pandas.DataFrame: One row per match with the query position, the rank, the catalog row and the distance in km.
+        """
+        points = self._to_radians(lat, lon)
+        k = min(k, len(self.load_catalog(catalog)))
+
+        # The tree does not accept an empty batch
+        if len(points) == 0:
+            return self._build_result(catalog, np.array([], dtype = int), np.array([], dtype = int), np.array([]))
+
+        distances, indices = self.get_index(catalog).query(points, k = k)
+
+        query_idx = np.repeat(np.arange(len(points)), k)
+
+        return self._build_result(catalog, query_idx, indices.ravel(), distances.ravel())
+
+
+    def query_radius(self, lat, lon, radius_km, catalog = 'estaciones'):
+        """
+        Finds all the locations of a catalog within a radius of a batch of points.
+
+        Args:
+            lat (float or array-like): Latitudes of the query points.
+            lon (float or array-like): Longitudes of the query points.
+            radius_km (float): Search radius in kilometres.
+            catalog (str, optional): Name of the catalog. Defaults to 'estaciones'.
+
+        Returns:
+            pandas.DataFrame: One row per match with the query position, the rank, the catalog row and the distance in km.
+        """
+        points = self._to_radians(lat, lon)
+
+        # The tree does not accept an empty batch
+        if len(points) == 0:
+            return self._build_result(catalog, np.array([], dtype = int), np.array([], dtype = int), np.array([]))
+
+        indices, distances = self.get_index(catalog).query_radius(points, r = radius_km / self.EARTH_RADIUS_KM, return_distance = True)
+
+        query_idx = np.repeat(np.arange(len(points)), [len(idx) for idx in indices])
+
+        return self._build_result(catalog, query_idx, np.concatenate(indices).astype(int), np.concatenate(distances))
+
+
+    def nearest_to_plants(self, catalog = 'estaciones', k = 1, radius_km = None, plants = None):
+        """
+        Matches every power plant with its nearest locations of a catalog.
+
+        Args:
+            catalog (str, optional): Name of the catalog. Defaults to 'estaciones'.
+            k (int, optional): Number of neighbours per plant, ignored if radius_km is given. Defaults to 1.
+            radius_km (float, optional): Search radius in kilometres. Defaults to None (k nearest search).
+            plants (pandas.DataFrame, optional): Plants with 'titulo', 'X' (latitude) and 'Y' (longitude). Defaults to the centrales catalog.
+
+        Returns:
+            pandas.DataFrame: One row per match with the plant name, the rank, the catalog row and the distance in km.
+        """
+        if plants is None:
+            plants = self.load_catalog('centrales')
+
+        plants = plants.reset_index(drop = True)
+
+        if radius_km is None:
+            result = self.query_nearest(plants['X'], plants['Y'], catalog = catalog, k = k)
+        else:
+            result = self.query_radius(plants['X'], plants['Y'], radius_km, catalog = catalog)
+
+        result.insert(0, 'central', plants['titulo'].to_numpy()[result['query'].to_numpy()])
+
+        return result.drop(columns = 'query')
@@ -0,0 +1,271 @@
+# Libraries
+import pandas as pd
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import yaml
+
+import os
+import json
+
+
+class TimeSeriesStore:
+    """
+    Local Parquet store for flow and weather time series, partitioned by station, source and month.
+
+    Files are laid out as '{root}/station={station}/source={source}/month={YYYY-MM}/data.parquet'
+    and every file holds a 'date' column plus the variables of the series.
+    """
+
+    def __init__(self, root = None):
+        """
+        Initializes TimeSeriesStore object and loads configuration parameters.
+
+        Args:
+            root (str, optional): Root directory of the store. Defaults to the config value.
+        """
+        self.load_config()
+        self.root = root or self.config["DirResources"]["store"]
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_series_dir(self, station, source):
+        """
+        Generates the directory of a series.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data (e.g. 'flow', 'ometeo', 'aemet').
+
+        Returns:
+            str: Directory holding the monthly partitions of the series.
+        """
+        return os.path.join(self.root, f"station={station}", f"source={source}")
+
+
+    def _write_month(self, path, data):
+        """
+        Writes one monthly partition, replacing the stored rows of the same dates.
+
+        Args:
+            path (str): Path of the partition file.
+            data (pandas.DataFrame): Rows of the month with a 'date' column.
+        """
+        if os.path.exists(path):
+            stored = pq.read_table(path).to_pandas()
+            stored = stored[~stored['date'].isin(data['date'])]
+            data = pd.concat([stored, data], ignore_index = True)
+
+        data = data.sort_values(by = 'date', kind = 'stable').reset_index(drop = True)
+
+        # Write to a temporary file first so readers never see a partial partition
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+        pq.write_table(pa.Table.from_pandas(data, preserve_index = False), tmp_path)
+        os.replace(tmp_path, path)
+
+
+    def write(self, data, station, source):
+        """
+        Writes a series into the store, merging it with the rows already stored.
+
+        Args:
+            data (pandas.DataFrame): DataFrame with a 'date' column.
+            station (str): Station code or location key.
+            source (str): Source of the data.
+        """
+        if data is None or len(data) == 0:
+            return
+
+        data = data.copy()
+        data['date'] = pd.to_datetime(data['date'])
+        data = data.drop_duplicates(subset = 'date', keep = 'last')
+
+        series_dir = self.get_series_dir(station, source)
+        months = data['date'].dt.strftime('%Y-%m')
+
+        for month, month_data in data.groupby(months.to_numpy(), sort = True):
+            path = os.path.join(series_dir, f"month={month}", "data.parquet")
+            self._write_month(path, month_data)
+
+
+    def _get_dataset(self, station, source):
+        """
+        Opens the dataset of a series.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+
+        Returns:
+            pyarrow.dataset.Dataset or None: Dataset of the series or None if nothing is stored.
+        """
+        series_dir = self.get_series_dir(station, source)
+
+        if not os.path.isdir(series_dir):
+            return None
+
+        partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor = 'hive')
+        dataset = ds.dataset(series_dir, format = 'parquet', partitioning = partitioning)
+
+        if not dataset.files:
+            return None
+
+        # Months may hold different variables, so read with the union of all the schemas
+        schema = pa.unify_schemas([pq.read_schema(file) for file in dataset.files], promote_options = 'permissive')
+        schema = schema.append(pa.field('month', pa.string()))
+
+        return ds.dataset(series_dir, format = 'parquet', partitioning = partitioning, schema = schema)
+
+
+    def _to_scalar(self, value, date_type):
+        """
+        Converts a date into a pyarrow scalar comparable with the stored dates.
+
+        Args:
+            value (str or datetime): Date to convert.
+            date_type (pyarrow.DataType): Type of the stored 'date' column.
+
+        Returns:
+            pyarrow.Scalar: Date as a scalar of the stored type.
+        """
+        value = pd.Timestamp(value)
+
+        if date_type.tz is not None and value.tz is None:
+            value = value.tz_localize(date_type.tz)
+        elif date_type.tz is None and value.tz is not None:
+            value = value.tz_localize(None)
+
+        return pa.scalar(value, type = date_type)
+
+
+    def read(self, station, source, start = None, end = None, columns = None):
+        """
+        Reads a series from the store, pushing the date range and the variable subset down to the files.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+            start (str, optional): First date to read. Defaults to None (no lower bound).
+            end (str, optional): Last date to read. Defaults to None (no upper bound).
+            columns (list, optional): Variables to read. Defaults to None (all variables).
+
+        Returns:
+            pandas.DataFrame: DataFrame with a 'date' column and the variables, empty if nothing is stored.
+        """
+        dataset = self._get_dataset(station, source)
+
+        if dataset is None:
+            return pd.DataFrame()
+
+        date_type = dataset.schema.field('date').type
+        expression = None
+
+        # Filters on the month partition prune whole files before the row filters are applied
+        if start is not None:
+            expression = (ds.field('month') >= pd.Timestamp(start).strftime('%Y-%m')) & (ds.field('date') >= self._to_scalar(start, date_type))
+
+        if end is not None:
+            end_expression = (ds.field('month') <= pd.Timestamp(end).strftime('%Y-%m')) & (ds.field('date') <= self._to_scalar(end, date_type))
+            expression = end_expression if expression is None else expression & end_expression
+
+        if columns is None:
+            columns = [name for name in dataset.schema.names if name != 'month']
+        else:
+            columns = ['date'] + [col for col in columns if col != 'date']
+
+        data = dataset.to_table(columns = columns, filter = expression).to_pandas()
+
+        return data.sort_values(by = 'date', kind = 'stable').reset_index(drop = True)
+
+
+    def get_date_range(self, station, source):
+        """
+        Returns the first and last stored dates of a series.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+
+        Returns:
+            tuple: First and last dates or (None, None) if nothing is stored.
+        """
+        dataset = self._get_dataset(station, source)
+
+        if dataset is None:
+            return None, None
+
+        # Only the first and last monthly partitions need to be read
+        months = sorted(os.path.basename(os.path.dirname(file)).split('=', 1)[1] for file in dataset.files)
+
+        first = dataset.to_table(columns = ['date'], filter = ds.field('month') == months[0]).column('date')
+        last = dataset.to_table(columns = ['date'], filter = ds.field('month') == months[-1]).column('date')
+
+        return pd.Timestamp(pc.min(first).as_py()), pd.Timestamp(pc.max(last).as_py())
+
+
+    def get_watermark(self, station, source):
+        """
+        Returns the high-water mark of a series, the date of its last downloaded observation.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+
+        Returns:
+            pandas.Timestamp or None: High-water mark or None if it was never recorded.
+        """
+        path = os.path.join(self.root, "_watermarks.json")
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r") as file:
+            watermarks = json.load(file)
+
+        value = watermarks.get(f"{station}/{source}")
+
+        return pd.Timestamp(value) if value is not None else None
+
+
+    def set_watermark(self, station, source, date):
+        """
+        Records the high-water mark of a series.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+            date (datetime): Date of the last downloaded observation.
+        """
+        path = os.path.join(self.root, "_watermarks.json")
+        watermarks = {}
+
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                watermarks = json.load(file)
+
+        watermarks[f"{station}/{source}"] = pd.Timestamp(date).isoformat()
+
+        os.makedirs(self.root, exist_ok = True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, "w") as file:
+            json.dump(watermarks, file, indent = 2)
+        os.replace(tmp_path, path)
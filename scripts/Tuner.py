@@ -0,0 +1,374 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+import ast
+import os
+
+import yaml
+
+from FlowModels import FlowModels
+from Backtester import Backtester
+
+
+def _optimize(model, study_name, n_trials, y, exog, storage):
+    """
+    Runs trials of a study in a worker process, sharing the study with the other workers through the storage.
+
+    Args:
+        model (str): Name of the model.
+        study_name (str): Name of the study.
+        n_trials (int): Number of trials of this worker.
+        y (pandas.Series): Daily flow indexed by date.
+        exog (pandas.DataFrame): Exogenous variables indexed by date, or None.
+        storage (str): URL of the storage of the studies.
+
+    Returns:
+        int: Number of trials run.
+    """
+    tuner = Tuner(storage = storage)
+    study = tuner.get_study(model, study_name, warm_start = False)
+    study.optimize(lambda trial: tuner.objective(trial, model, y, exog), n_trials = n_trials)
+
+    return n_trials
+
+
+class Tuner:
+    """
+    Resumable hyperparameter search of the flow models with Optuna.
+
+    The trials are kept in a SQLite storage, so a search can be stopped and continued, and several
+    processes work on the same study. New studies are warm-started by queueing the best parameters of the
+    params_*.csv files, which are scored again with the same objective as the new trials. The queued
+    trials run in the calling process before the workers start, so that no two processes take the same
+    one. The trees and Prophet are evaluated with walk-forward folds, pruning the trials whose error after
+    a fold is worse than the median of the previous trials. SARIMAX orders are ranked by AIC.
+    """
+
+    # Column with the score of the trials in every params_*.csv file
+    SCORES = {'lgbm': 'custom_metric', 'xgb': 'custom_metric', 'sarimax': 'AIC', 'prophet': 'rmse'}
+
+    def __init__(self, storage = None, workers = None):
+        """
+        Initializes the tuner and loads configuration parameters.
+
+        Args:
+            storage (str, optional): URL of the storage of the studies. Defaults to the config value.
+            workers (int, optional): Number of processes. Defaults to the config value.
+        """
+        self.load_config()
+        self.models = FlowModels()
+
+        tuning_config = self.config["Tuning"]
+        self.storage = storage or tuning_config["storage"]
+        self.workers = workers or tuning_config["workers"]
+        self.n_trials = tuning_config["n_trials"]
+        self.warm_start_trials = tuning_config["warm_start_trials"]
+        self.metric = tuning_config["metric"]
+        self.pruner = tuning_config["pruner"]
+        self.spaces = tuning_config["spaces"]
+        self.backtester = Backtester(n_folds = tuning_config["n_folds"], steps = tuning_config["steps"], workers = 1)
+
+
+    def load_config(self, config_path = "config.yml"):
+        """
+        Loads external configuration parameters from a YAML file.
+
+        Args:
+            config_path (str, optional): Path to the configuration YAML file. Defaults to "config.yml".
+        """
+        if not os.path.exists(config_path):
+            config_path = os.path.join("../scripts", config_path)
+
+        with open(config_path, "r") as file:
+            config = yaml.load(file, Loader = yaml.FullLoader)
+
+        self.config = config
+
+
+    def get_distributions(self, model):
+        """
+        Builds the search space of a model from the configuration.
+
+        Args:
+            model (str): Name of the model ('lgbm', 'xgb', 'sarimax' or 'prophet').
+
+        Returns:
+            dict: Optuna distribution of every hyperparameter.
+        """
+        from optuna.distributions import IntDistribution, FloatDistribution, CategoricalDistribution
+
+        distributions = {}
+        for name, space in self.spaces[model].items():
+            if space['type'] == 'int':
+                distributions[name] = IntDistribution(space['low'], space['high'], step = space.get('step', 1))
+            elif space['type'] == 'float':
+                distributions[name] = FloatDistribution(space['low'], space['high'], step = space.get('step'), log = space.get('log', False))
+            else:
+                distributions[name] = CategoricalDistribution(space['choices'])
+
+        return distributions
+
+
+    def get_study(self, model, study_name = None, warm_start = True):
+        """
+        Creates a study or loads it from the storage if it already exists.
+
+        Args:
+            model (str): Name of the model.
+            study_name (str, optional): Name of the study. Defaults to 'flow_{model}'.
+            warm_start (bool, optional): Whether to queue the parameters of the params_*.csv file in a new study. Defaults to True.
+
+        Returns:
+            optuna.Study: Study of the model.
+        """
+        import optuna
+        from optuna.pruners import MedianPruner
+
+        # Several processes write in the same SQLite file, wait for the locks instead of failing
+        storage = optuna.storages.RDBStorage(self.storage, engine_kwargs = {'connect_args': {'timeout': 60}}) if self.storage.startswith('sqlite') else self.storage
+
+        study = optuna.create_study(study_name = study_name or f"flow_{model}", storage = storage, direction = 'minimize',
+                                    pruner = MedianPruner(**self.pruner), load_if_exists = True)
+
+        if warm_start == True and len(study.trials) == 0:
+            self.warm_start(study, model)
+
+        return study
+
+
+    def read_trials(self, model, params_dir = None):
+        """
+        Reads the trials of a params_*.csv file as hyperparameters of the search space.
+
+        Args:
+            model (str): Name of the model.
+            params_dir (str, optional): Directory with the params_*.csv files. Defaults to the FlowModels one.
+
+        Returns:
+            list: Pairs of hyperparameters and score.
+        """
+        path = os.path.join(params_dir or self.models.params_dir, f"params_{model}.csv")
+
+        if not os.path.exists(path):
+            return []
+
+        data = pd.read_csv(path, index_col = 0)
+        trials = []
+
+        for _, row in data.iterrows():
+            if model in ('lgbm', 'xgb'):
+                params = {'lags': max(int(lag) for lag in str(row['lags']).strip('[]').split()), **ast.literal_eval(row['params'])}
+            elif model == 'sarimax':
+                params = dict(zip(['p', 'q', 'P', 'Q'], ast.literal_eval(row['(p,q,P,Q)'])))
+            else:
+                params = {'changepoint_prior_scale': float(row['changepoint_prior_scale']), 'seasonality_prior_scale': float(row['seasonality_prior_scale'])}
+
+            trials.append((params, float(row[self.SCORES[model]])))
+
+        return trials
+
+
+    def warm_start(self, study, model, params_dir = None):
+        """
+        Queues the best parameters of a params_*.csv file as the first trials of a study.
+
+        The scores of the file come from other data and, for the trees and Prophet, from another metric, so
+        the parameters are queued to be scored again by the objective instead of being added with their score.
+
+        Args:
+            study (optuna.Study): Study of the model.
+            model (str): Name of the model.
+            params_dir (str, optional): Directory with the params_*.csv files. Defaults to the FlowModels one.
+
+        Returns:
+            int: Number of trials queued.
+        """
+        import optuna
+
+        distributions = self.get_distributions(model)
+        queued = []
+
+        for params, score in sorted(self.read_trials(model, params_dir), key = lambda trial: trial[1]):
+            params = {name: value for name, value in params.items() if name in distributions}
+
+            # Parameters out of the current search space or already queued are left out
+            try:
+                optuna.trial.create_trial(params = params, distributions = distributions, value = score)
+            except ValueError:
+                continue
+
+            if params in queued:
+                continue
+
+            queued.append(params)
+            if len(queued) == self.warm_start_trials:
+                break
+
+        for params in queued:
+            study.enqueue_trial(params, user_attrs = {'source': 'csv'})
+
+        print(f"Estudio {study.study_name}: {len(queued)} pruebas encoladas desde params_{model}.csv")
+
+        return len(queued)
+
+
+    def to_model_params(self, model, params):
+        """
+        Converts the hyperparameters of a trial to the parameters of FlowModels.
+
+        Args:
+            model (str): Name of the model.
+            params (dict): Hyperparameters of the trial.
+
+        Returns:
+            dict: Parameters of the model.
+        """
+        if model == 'sarimax':
+            sarimax_config = self.config["Models"]["sarimax"]
+            return {'order': (params['p'], sarimax_config["d"], params['q']),
+                    'seasonal_order': (params['P'], sarimax_config["D"], params['Q'], sarimax_config["s"])}
+
+        return dict(params)
+
+
+    def objective(self, trial, model, y, exog = None):
+        """
+        Evaluates the hyperparameters suggested by a trial.
+
+        Args:
+            trial (optuna.Trial): Trial of the study.
+            model (str): Name of the model.
+            y (pandas.Series): Daily flow indexed by date.
+            exog (pandas.DataFrame, optional): Exogenous variables indexed by date. Defaults to None.
+
+        Returns:
+            float: AIC for SARIMAX, walk-forward error for the other models.
+        """
+        import optuna
+        from optuna.distributions import IntDistribution, FloatDistribution
+
+        params = {}
+        for name, distribution in self.get_distributions(model).items():
+            if isinstance(distribution, IntDistribution):
+                params[name] = trial.suggest_int(name, distribution.low, distribution.high, step = distribution.step)
+            elif isinstance(distribution, FloatDistribution):
+                params[name] = trial.suggest_float(name, distribution.low, distribution.high, step = distribution.step, log = distribution.log)
+            else:
+                params[name] = trial.suggest_categorical(name, distribution.choices)
+
+        params = self.to_model_params(model, params)
+
+        if model == 'sarimax':
+            return float(self.models.fit(model, y, exog, params)['estimator'].aic)
+
+        steps = self.backtester.steps
+        first_fold = len(y) - self.backtester.n_folds * steps
+        actual, pred = [], []
+
+        for fold in range(self.backtester.n_folds):
+            train_end = first_fold + fold * steps
+            train_y = y.iloc[:train_end]
+            train_exog = exog.iloc[:train_end] if exog is not None else None
+            future_exog = exog.iloc[train_end:train_end + steps] if exog is not None else None
+
+            fitted = self.models.fit(model, train_y, train_exog, params)
+            forecast = self.models.forecast(fitted, train_y, future_exog, steps = steps)
+
+            actual.append(y.reindex(forecast.index))
+            pred.append(forecast['pred'])
+
+            # Error of the folds evaluated so far, compared with the other trials at the same fold
+            value = self.backtester.get_metrics(pd.concat(actual), pd.concat(pred))[self.metric]
+            trial.report(value, fold)
+
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+
+        return value
+
+
+    def get_results(self, study, model):
+        """
+        Ranks the completed trials of a study in the schema of its params_*.csv file.
+
+        Args:
+            study (optuna.Study): Study of the model.
+            model (str): Name of the model.
+
+        Returns:
+            pandas.DataFrame: Trials sorted by score, indexed by trial number.
+        """
+        import optuna
+
+        rows = {}
+        for trial in study.get_trials(deepcopy = False, states = (optuna.trial.TrialState.COMPLETE,)):
+            params = dict(trial.params)
+
+            if model in ('lgbm', 'xgb'):
+                lags = params.pop('lags')
+                row = {'lags': str(np.arange(1, lags + 1)), 'params': str(params), 'custom_metric': trial.value,
+                       **{name: float(value) for name, value in params.items()}}
+            elif model == 'sarimax':
+                row = {'(p,q,P,Q)': str((params['p'], params['q'], params['P'], params['Q'])), 'AIC': trial.value}
+            else:
+                row = {**params, 'rmse': trial.value}
+
+            rows[trial.number] = row
+
+        results = pd.DataFrame.from_dict(rows, orient = 'index')
+
+        return results.sort_values(by = self.SCORES[model]) if len(results) > 0 else results
+
+
+    def tune(self, model, y, exog = None, n_trials = None, study_name = None, output_dir = None):
+        """
+        Runs or resumes the search of a model until the study has the requested number of new trials.
+
+        Args:
+            model (str): Name of the model ('lgbm', 'xgb', 'sarimax' or 'prophet').
+            y (pandas.Series): Daily flow indexed by date.
+            exog (pandas.DataFrame, optional): Exogenous variables indexed by date. Defaults to None.
+            n_trials (int, optional): Number of trials, including the queued ones of the params_*.csv file. Defaults to the config value.
+            study_name (str, optional): Name of the study. Defaults to 'flow_{model}'.
+            output_dir (str, optional): Directory where the params_{model}.csv file is written. Defaults to None (not written).
+
+        Returns:
+            pandas.DataFrame: Ranked trials of the study.
+        """
+        import optuna
+
+        n_trials = n_trials or self.n_trials
+        study = self.get_study(model, study_name)
+
+        # Trials of a previous run count towards the total, so an interrupted search continues where it stopped
+        done = study.get_trials(deepcopy = False, states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED))
+        remaining = max(n_trials - len(done), 0)
+        print(f"Estudio {study.study_name}: {len(done)} pruebas hechas, {remaining} pendientes")
+
+        # The queued trials run in this process, workers sharing a SQLite study could take the same one
+        waiting = study.get_trials(deepcopy = False, states = (optuna.trial.TrialState.WAITING,))
+        queued = min(len(waiting), remaining)
+
+        if queued > 0:
+            study.optimize(lambda trial: self.objective(trial, model, y, exog), n_trials = queued)
+            remaining -= queued
+
+        if remaining > 0:
+            workers = min(self.workers, remaining)
+            shares = [remaining // workers + (1 if worker < remaining % workers else 0) for worker in range(workers)]
+
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                futures = [executor.submit(_optimize, model, study.study_name, share, y, exog, self.storage) for share in shares]
+
+                for future in futures:
+                    future.result()
+
+        results = self.get_results(study, model)
+
+        if output_dir is not None:
+            results.to_csv(os.path.join(output_dir, f"params_{model}.csv"))
+
+        return results
@@ -3,11 +3,10 @@ import pandas as pd
 import numpy as np
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
-from pyproj import Proj, transform
-
-import warnings
+from pyproj import CRS, Transformer
 
 from UrlDefinition import UrlDefinition
 
@@ -15,9 +14,10 @@ import yaml
 
 import folium
 
-from scipy.spatial.distance import cdist
-
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 
 class Utils:
@@ -47,6 +47,76 @@ class Utils:
 
         self.config = config
 
+    def get_http_session(self, pool_size = 10, verify = True):
+        """
+        Creates a requests session with a connection pool sized for concurrent downloads.
+
+        Args:
+            pool_size (int, optional): Maximum number of pooled connections per host. Defaults to 10.
+            verify (bool, optional): Whether to verify SSL certificates. Defaults to True.
+
+        Returns:
+            requests.Session: Session that reuses connections across requests.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.verify = verify
+
+        return session
+
+    @staticmethod
+    @lru_cache(maxsize = None)
+    def read_api_key(path):
+        """
+        Reads an API key file only the first time it is requested.
+
+        Args:
+            path (str): Path to the file with the key.
+
+        Returns:
+            str: API key.
+        """
+        with open(path, "r") as file:
+            return file.read().strip()
+
+    @staticmethod
+    @lru_cache(maxsize = None)
+    def get_utm_transformer(utm_zone = 30):
+        """
+        Returns a cached transformer from UTM coordinates to latitude-longitude.
+
+        Args:
+            utm_zone (int, optional): UTM zone of the source coordinates. Defaults to 30.
+
+        Returns:
+            pyproj.Transformer: Transformer from UTM (WGS84 ellipsoid) to WGS84 latitude-longitude.
+        """
+        utm_origen = CRS(proj = 'utm', zone = utm_zone, ellps = 'WGS84')
+        wgs84 = CRS(proj = 'latlong', datum = 'WGS84')
+
+        return Transformer.from_crs(utm_origen, wgs84, always_xy = True)
+
+    def transform_coordinates_batch(self, x, y, utm_zone = 30):
+        """
+        Transforms arrays of UTM coordinates to latitude-longitude in a single call.
+
+        Args:
+            x (array-like): UTM x-coordinates.
+            y (array-like): UTM y-coordinates.
+            utm_zone (int, optional): UTM zone of the coordinates. Defaults to 30.
+
+        Returns:
+            tuple: NumPy arrays with the latitudes and the longitudes.
+        """
+        x = np.asarray(x, dtype = 'float64')
+        y = np.asarray(y, dtype = 'float64')
+
+        lon, lat = self.get_utm_transformer(utm_zone).transform(x, y)
+
+        return lat, lon
+
     def transform_coordinates(self, x, y):
         """
         Transforms UTM coordinates to latitude-longitude.
@@ -58,13 +128,27 @@ class Utils:
         Returns:
             pandas.Series: Series containing latitude and longitude.
         """
-        utm_zone_origen = 30
-        utm_origen = Proj(proj = 'utm', zone = utm_zone_origen, ellps = 'WGS84')
-        wgs84 = Proj(proj = 'latlong', datum = 'WGS84')
+        lat, lon = self.transform_coordinates_batch(x, y)
 
-        lon, lat = transform(utm_origen, wgs84, x, y)
+        return pd.Series([float(lat), float(lon)], index = ['latitud', 'longitud'])
 
-        return pd.Series([lat, lon], index = ['latitud', 'longitud'])
+    def reproject_dataframe(self, data, x_col = 'X', y_col = 'Y', utm_zone = 30):
+        """
+        Replaces the UTM coordinates of a DataFrame with latitude (x_col) and longitude (y_col).
+
+        Args:
+            data (pandas.DataFrame): DataFrame with UTM coordinates.
+            x_col (str, optional): Column with the UTM x-coordinate. Defaults to 'X'.
+            y_col (str, optional): Column with the UTM y-coordinate. Defaults to 'Y'.
+            utm_zone (int, optional): UTM zone of the coordinates. Defaults to 30.
+
+        Returns:
+            pandas.DataFrame: Copy of the DataFrame with the coordinates in latitude-longitude.
+        """
+        data = data.copy()
+        data[x_col], data[y_col] = self.transform_coordinates_batch(data[x_col].to_numpy(), data[y_col].to_numpy(), utm_zone)
+
+        return data
 
 
     def reformat_coords(self, coordinate):
@@ -91,31 +175,55 @@ class Utils:
             raise ValueError("Formato de coordenadas no válido")
 
 
-    def gauges_reservoirs_information(self, station_code, type_st):
+    def reformat_coords_batch(self, coordinates):
         """
-        Retrieves information about gauges or reservoirs based on station code and type.
+        Reformat a series of coordinates from a string format to a float format.
+
+        Vectorized equivalent of reformat_coords.
 
         Args:
+            coordinates (pandas.Series): String representations of coordinates.
+
+        Returns:
+            pandas.Series: Reformatted coordinate values.
+        """
+        coordinates = coordinates.astype(str)
+
+        degrees = coordinates.str[:2].astype(int)
+        minutes = coordinates.str[2:4].astype(int)
+        seconds_fraction = coordinates.str[4:6].astype(float) / 60
+
+        hemisphere = coordinates.str[-1]
+        if not hemisphere.isin(['N', 'E', 'S', 'W']).all():
+            raise ValueError("Formato de coordenadas no válido")
+
+        sign = np.where(hemisphere.isin(['S', 'W']), -1, 1)
+
+        return sign * (degrees + minutes / 60 + seconds_fraction)
+
+
+    @staticmethod
+    def parse_gauges_reservoirs(html, station_code):
+        """
+        Parses the information page of a gauge or reservoir.
+
+        The coordinates are returned in UTM, they are not transformed to latitude-longitude.
+
+        Args:
+            html (bytes or str): Content of the station page.
             station_code (int): Code of the station.
-            type_st (str): Type of station ('aforos' for gauges, 'embalses' for reservoirs).
 
         Returns:
-            pandas.DataFrame: DataFrame containing information about the station.
+            pandas.DataFrame: DataFrame with one row of station information, None if the page has no station or False if it could not be parsed.
         """
         try:
-            if type_st == 'aforos':
-                url = self.obj_url.get_url_gauges_reservoirs(station_code, 'EA')
-            elif type_st == 'embalses':
-                url = self.obj_url.get_url_gauges_reservoirs(station_code, 'EM')
-            else:
-                pass
-
-            # Initialization of the data extraction process
-            response = requests.get(url)
-            html = response.content
             soup = BeautifulSoup(html, 'html.parser')
             div_elements = soup.find_all('div', class_ = ['col-md-3 col-xs-6 b-r', 'text-themecolor m-b-0 m-t-0'])
 
+            # Pages of codes without station have no information fields
+            if not div_elements:
+                return None
+
             # Complete the station code
             cod_modified = f"2{station_code:03}"
 
@@ -136,11 +244,42 @@ class Utils:
             data['titulo'] = soup.find('h3').text.strip()
 
             data[['X', 'Y', 'Z', 'id']] = data[['X', 'Y', 'Z', 'id']].astype(str).replace('\.', '', regex = True).astype(int)
+            data = data.rename_axis(None, axis = 1)
 
-            warnings.filterwarnings("ignore")
+            return(data)
 
-            data[['X', 'Y']] = data.apply(lambda row: self.transform_coordinates(row['X'], row['Y']), axis = 1)
-            data = data.rename_axis(None, axis = 1)
+        except Exception as e:
+            print("Error leyendo la página de la estación", station_code, ":", e)
+            return False
+
+
+    def gauges_reservoirs_information(self, station_code, type_st):
+        """
+        Retrieves information about gauges or reservoirs based on station code and type.
+
+        Args:
+            station_code (int): Code of the station.
+            type_st (str): Type of station ('aforos' for gauges, 'embalses' for reservoirs).
+
+        Returns:
+            pandas.DataFrame: DataFrame containing information about the station.
+        """
+        try:
+            if type_st == 'aforos':
+                url = self.obj_url.get_url_gauges_reservoirs(station_code, 'EA')
+            elif type_st == 'embalses':
+                url = self.obj_url.get_url_gauges_reservoirs(station_code, 'EM')
+            else:
+                pass
+
+            # Initialization of the data extraction process
+            response = requests.get(url)
+            data = self.parse_gauges_reservoirs(response.content, station_code)
+
+            if data is None or data is False:
+                return None
+
+            data = self.reproject_dataframe(data)
 
             return(data)
 
@@ -148,30 +287,37 @@ class Utils:
             pass
 
 
-    def get_all_gauges_reservoirs(self, type_st, write = False):
+    def get_all_gauges_reservoirs(self, type_st, write = False, parallel = False):
         """
         Retrieves information about all gauges or reservoirs.
 
         Args:
             type_st (str): Type of station ('aforos' for gauges, 'embalses' for reservoirs).
             write (bool, optional): Whether to write the data to a CSV file (default is False).
+            parallel (bool, optional): Whether to use the asynchronous crawler (default is False).
 
         Returns:
             pandas.DataFrame: DataFrame containing information about all stations.
         """
-        df_list = []
+        if parallel == True:
+            from StationCrawler import StationCrawler
 
-        # Iterate over all posible codes
-        for i in range(1, 1000):
-            if type_st == 'aforos':
-                    df_list.append(self.gauges_reservoirs_information(station_code = i, type_st = 'aforos'))
-            elif type_st == 'embalses':
-                    df_list.append(self.gauges_reservoirs_information(station_code = i, type_st = 'embalses'))
-            else:
-                pass
+            df = StationCrawler().crawl(type_st)
+
+        else:
+            df_list = []
+
+            # Iterate over all posible codes
+            for i in range(1, 1000):
+                if type_st == 'aforos':
+                        df_list.append(self.gauges_reservoirs_information(station_code = i, type_st = 'aforos'))
+                elif type_st == 'embalses':
+                        df_list.append(self.gauges_reservoirs_information(station_code = i, type_st = 'embalses'))
+                else:
+                    pass
 
-        # Consolidate the information
-        df = pd.concat(df_list, axis = 0, ignore_index = True).reset_index(drop = True)
+            # Consolidate the information
+            df = pd.concat(df_list, axis = 0, ignore_index = True).reset_index(drop = True)
 
 
         # Export the data
@@ -186,42 +332,115 @@ class Utils:
         return(df)
 
 
-    def basic_clean(self, data, freq = 'H'):
+    @staticmethod
+    def run_coroutine(coro):
+        """
+        Runs a coroutine to completion from synchronous code.
+
+        If an event loop is already running in this thread (e.g. inside a notebook), the coroutine
+        is executed in a separate thread with its own event loop.
+
+        Args:
+            coro (coroutine): Coroutine to execute.
+
+        Returns:
+            Any: Result of the coroutine.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+
+        with ThreadPoolExecutor(max_workers = 1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+
+    def parse_dates_values(self, data, date_format, date_col = 'date', value_col = 'flow'):
+        """
+        Converts a date column and a decimal-comma value column in a single columnar step.
+
+        Rows with a date that does not match the format are dropped and the number of invalid
+        rows is reported once.
+
+        Args:
+            data (pandas.DataFrame): DataFrame with the date and value columns as strings.
+            date_format (str): Format of the dates (e.g. '%d/%m/%Y %H:%M').
+            date_col (str, optional): Name of the date column. Defaults to 'date'.
+            value_col (str, optional): Name of the value column. Defaults to 'flow'.
+
+        Returns:
+            pandas.DataFrame: DataFrame with the parsed date and value columns.
+        """
+        dates = pd.to_datetime(data[date_col], format = date_format, errors = 'coerce')
+        values = pd.to_numeric(data[value_col].astype('string').str.strip().str.replace(',', '.', regex = False), errors = 'coerce')
+
+        bad_dates = dates.isnull()
+        bad_values = values.isnull() & ~bad_dates
+
+        if bad_dates.any() or bad_values.any():
+            print(f"Filas con fecha no válida (descartadas): {bad_dates.sum()}. Filas con valor no válido: {bad_values.sum()}")
+
+        return pd.DataFrame({date_col: dates[~bad_dates], value_col: values[~bad_dates].astype('float64')}).reset_index(drop = True)
+
+
+    def is_clean(self, data, freq = 'H'):
+        """
+        Checks whether a DataFrame was already cleaned by basic_clean and is still clean.
+
+        Args:
+            data (pandas.DataFrame): Input DataFrame.
+            freq (str): Frequency, 'H' for hour data and 'D' for daily data
+
+        Returns:
+            bool: True if the frame is flagged as clean, its dates are sorted, unique and regular and it has no missing values.
+        """
+        if data.attrs.get('clean_freq') != freq or 'date' not in data.columns or len(data) == 0:
+            return False
+
+        if not pd.api.types.is_datetime64_any_dtype(data['date']):
+            return False
+
+        step = pd.Timedelta(pd.tseries.frequencies.to_offset(freq))
+
+        return bool((data['date'].diff().iloc[1:] == step).all()) and not data.isnull().values.any()
+
+
+    def basic_clean(self, data, freq = 'H', skip_clean = True):
         """
         Performs basic cleaning operations on the input DataFrame.
 
         Args:
             data (pandas.DataFrame): Input DataFrame.
             freq (str): Frequency, 'H' for hour data and 'D' for daily data
+            skip_clean (bool, optional): Whether to return frames already cleaned by this function unchanged. Defaults to True.
 
         Returns:
             pandas.DataFrame: Cleaned DataFrame.
         """
-        # Order data
-        data = data.sort_values(by = 'date', ascending = True).reset_index(drop = True)
-        
-        # Remove missing values just if 70% of columns are NA
+        if skip_clean == True and self.is_clean(data, freq):
+            return data
+
+        # Minimum of non missing values per row, the date counts as a non missing value
         threshold = 0.7
         min_non_nulls = int(data.shape[1] * (1 - threshold))
-        data = data.dropna(thresh = min_non_nulls)
 
-        # Drop duplicates
-        data = data.drop_duplicates(subset = 'date', keep = 'first').reset_index(drop = True)
+        # Set the date index once and order data
+        dates = pd.DatetimeIndex(pd.to_datetime(data['date']), name = 'date')
+        data = data.drop(columns = 'date').set_axis(dates, axis = 0)
+        data = data.sort_index(kind = 'stable')
 
-        # Complete missing data
-        start_date = data.loc[0, 'date']
-        end_date = data.loc[len(data) - 1, 'date']
+        # Remove missing values just if 70% of columns are NA and drop duplicates
+        data = data[data.notnull().sum(axis = 1).to_numpy() + 1 >= min_non_nulls]
+        data = data[~data.index.duplicated(keep = 'first')]
 
-        data_range = pd.DataFrame({'date': pd.date_range(start = start_date, end = end_date, freq = freq)})
+        # Complete missing data
+        data = data.reindex(pd.date_range(start = data.index[0], end = data.index[-1], freq = freq, name = 'date'))
 
-        data['date'] = pd.to_datetime(data['date'])
-        data = pd.merge(data_range, data, on = 'date', how = 'left')
-        
         # Print alert
-        missing_data = data.isnull().sum()
-        missing_percentage = (missing_data / len(data)) * 100
+        missing_mask = data.isnull()
+        missing_percentage = missing_mask.mean() * 100
         columns_with_missing_data = missing_percentage[missing_percentage > 1]
-        
+
         if len(columns_with_missing_data) > 0:
             print('Las siguietes columnas presentan un porcentaje de valores nulos mayor al 5%:')
             print(columns_with_missing_data)
@@ -229,8 +448,11 @@ class Utils:
             pass
 
         # Fill missing values
-        data = data.fillna(method = 'ffill')
-        data = data.reset_index(drop = True)
+        if missing_mask.values.any():
+            data = data.ffill()
+
+        data = data.reset_index()
+        data.attrs['clean_freq'] = freq
 
         return data
     
@@ -245,7 +467,7 @@ class Utils:
         Returns:
             pandas.DataFrame or None: DataFrame containing station information or None if retrieval fails.
         """
-        api_key = open(self.config["DirResources"]["api_AEMET"]).read().strip()
+        api_key = self.read_api_key(self.config["DirResources"]["api_AEMET"])
         querystring = {"api_key": api_key}
 
         url = self.obj_url.get_url_AEMET_stations()
@@ -262,8 +484,8 @@ class Utils:
                 df = pd.DataFrame(df.copy())
 
                 # Reformat coordinates
-                df['X'] = df['latitud'].apply(self.reformat_coords)
-                df['Y'] = df['longitud'].apply(self.reformat_coords)
+                df['X'] = self.reformat_coords_batch(df['latitud'])
+                df['Y'] = self.reformat_coords_batch(df['longitud'])
 
                 # Select relevant columns
                 df = df[['indicativo', 'provincia', 'nombre', 'X', 'Y', 'altitud']]
@@ -9,26 +9,98 @@ import yaml
 from UrlDefinition import UrlDefinition
 
 from Utils import Utils
+from RateLimiter import TokenBucket
+from RetryPolicy import RetryPolicy
+from Resampler import Resampler
 
 from tqdm import tqdm
+import asyncio
 import time
 import os
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import openmeteo_requests
 import requests_cache
 from openmeteo_requests import Client as OpenMeteoClient
-from retry_requests import retry
+
+
+class InstrumentedCachedSession(requests_cache.CachedSession):
+    """
+    Cached session that records the cache hits and the latency of every endpoint.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the session, all the arguments are passed to requests_cache.CachedSession.
+        """
+        super().__init__(*args, **kwargs)
+        self.endpoint_stats = {}
+        self._stats_lock = threading.Lock()
+
+
+    def request(self, method, url, *args, **kwargs):
+        """
+        Send a request and record whether it was served from the cache and how long it took.
+        """
+        start = time.perf_counter()
+        response = super().request(method, url, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        parsed = urlparse(url)
+        endpoint = parsed.netloc + parsed.path
+
+        with self._stats_lock:
+            stats = self.endpoint_stats.setdefault(endpoint, {'requests': 0, 'cache_hits': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['requests'] += 1
+            stats['cache_hits'] += int(getattr(response, 'from_cache', False))
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+        return response
+
+
+    def get_stats(self):
+        """
+        Summarize the recorded requests per endpoint.
+
+        Returns:
+            pandas.DataFrame: Requests, cache hits, hit ratio and latency per endpoint.
+        """
+        with self._stats_lock:
+            stats = pd.DataFrame.from_dict(self.endpoint_stats, orient = 'index')
+
+        if stats.empty:
+            return stats
+
+        stats['hit_ratio'] = stats['cache_hits'] / stats['requests']
+        stats['mean_seconds'] = stats['total_seconds'] / stats['requests']
+
+        return stats.rename_axis('endpoint').reset_index()
 
 
 class WeatherAPI:
-    def __init__(self):
+    def __init__(self, store = None):
         """
         Initialize WeatherAPI object.
+
+        Args:
+            store (TimeSeriesStore, optional): Local store used to save and reuse historical data. Defaults to None.
         """
+        self.store = store
+        self._openmeteo = None
+        self._openmeteo_session = None
+        self._client_lock = threading.Lock()
         self.load_config()
+        self.retry_policy = RetryPolicy.from_config(self.config["Retry"])
+        self._owm_retry_policy = RetryPolicy.from_config({**self.config["Retry"], "max_attempts": self.config["IntervalOWM"]["max_retries"] + 1})
+        # The OWM quota applies to the API key, so all the downloads of this object share one bucket
+        self._owm_bucket = TokenBucket(self.config["IntervalOWM"]["calls_per_minute"] / 60, capacity = self.config["IntervalOWM"]["max_workers"])
         self.obj_url = UrlDefinition()
         self.api_key = open(self.config["DirResources"]["api_OWM"]).read().strip()
         self.func = Utils()
+        self.resampler = Resampler()
 
 
     # Load external parameters
@@ -53,6 +125,64 @@ class WeatherAPI:
         self.config = config
 
 
+    def get_location_key(self, lat, lon):
+        """
+        Generates the key used to save the data of a location in the local store.
+
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+
+        Returns:
+            str: Key of the location.
+        """
+        return f"{float(lat):.4f}_{float(lon):.4f}"
+
+
+    def read_stored(self, station, source, start, end, freq = 'H'):
+        """
+        Reads historical data from the local store if it covers the whole requested period.
+
+        Args:
+            station (str): Station code or location key.
+            source (str): Source of the data.
+            start (str): Start date of the period.
+            end (str): End date of the period, a date without time covers the whole day.
+            freq (str): Frequency of the data ('H' for hourly, 'D' for daily).
+
+        Returns:
+            pandas.DataFrame or None: Stored data or None if there is no store or the period is not complete.
+        """
+        if self.store is None:
+            return None
+
+        start = pd.Timestamp(start)
+        end_ts = pd.Timestamp(end)
+        if freq == 'H' and len(str(end)) <= 10:
+            end_ts = end_ts + pd.Timedelta(hours = 23)
+
+        data = self.store.read(station, source, start = start, end = end_ts)
+        expected_rows = len(pd.date_range(start = start, end = end_ts, freq = freq))
+
+        if len(data) < expected_rows:
+            return None
+
+        return data
+
+
+    def write_stored(self, data, station, source):
+        """
+        Saves data in the local store if there is one.
+
+        Args:
+            data (pandas.DataFrame): Data with a 'date' column.
+            station (str): Station code or location key.
+            source (str): Source of the data.
+        """
+        if self.store is not None and data is not None:
+            self.store.write(data, station, source)
+
+
     def get_history_owm(self, lat, lon, start, end, freq = 'H'):
         """
         Retrieve historical weather data from OpenWeatherMap API.
@@ -70,38 +200,33 @@ class WeatherAPI:
         start_date = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
         end_date = datetime.strptime(end, '%Y-%m-%d %H:%M:%S')
 
-        all_data_frames = []
-
-        # Split time range into 1 day intervals
+        # Split time range into windows of the configured number of days
         interval = timedelta(days = self.config["IntervalOWM"]["interval"])
+        windows = []
         current_start = start_date
 
-        # Progress bar
-        total_iterations = int((end_date - start_date).total_seconds() / interval.total_seconds())
-
-        time.sleep(1)
-
-        progress_bar = tqdm(total = total_iterations, desc = 'Downloading Data', unit = ' interval')
-
         while current_start < end_date:
-            # Calculate the end date of the current interval
             current_end = min(current_start + interval, end_date)
-
-            start_unix = int(current_start.timestamp())
-            end_unix = int(current_end.timestamp())
-
-            data_frame = self._fetch_weather_data_single_owm(lat, lon, start_unix, end_unix)
-
-            all_data_frames.append(data_frame)
-
-            # Update start date for next interval
+            windows.append((int(current_start.timestamp()), int(current_end.timestamp())))
             current_start += interval
 
-            progress_bar.update(1)
+        # Download the windows concurrently, keeping the rows of each window in its own slot
+        slots = [None] * len(windows)
+        max_workers = self.config["IntervalOWM"]["max_workers"]
 
-        progress_bar.close()
+        # The session and the progress bar are closed even if a window fails
+        with self.func.get_http_session(pool_size = max_workers) as session, \
+             tqdm(total = len(windows), desc = 'Downloading Data', unit = ' interval') as progress_bar, \
+             ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = {executor.submit(self._fetch_window_owm, lat, lon, window_start, window_end, session): idx
+                       for idx, (window_start, window_end) in enumerate(windows)}
 
-        result = pd.concat(all_data_frames, ignore_index = True)
+            for future in as_completed(futures):
+                slots[futures[future]] = future.result()
+                progress_bar.update(1)
+
+        # Build a single frame from the rows of all the windows in chronological order
+        result = pd.DataFrame([row for rows in slots for row in rows])
 
         # Clean data
         result = self.func.basic_clean(result)
@@ -113,21 +238,7 @@ class WeatherAPI:
         result = result.dropna(axis = 1, how = 'all')
 
         if freq == 'D':
-            # Create dictionaries for aggregate columns
-            cat_dict = {}
-            number_dict = {}
-
-            for col in result.columns:
-                if result[col].dtype == 'object' or result[col].dtype == 'string':
-                    cat_dict[col] = 'last'
-                elif result[col].dtype == 'float64' or result[col].dtype == 'int64':
-                    number_dict[col] = 'median'
-
-            # Combine results
-            transform_variables = {**number_dict, **cat_dict}
-
-            # Group information
-            result = result.groupby(pd.Grouper(key = 'Fecha', freq = 'D')).agg(transform_variables).reset_index()
+            result = self.resampler.resample(result, freq = 'D')
 
         return result
 
@@ -156,46 +267,55 @@ class WeatherAPI:
         result = result.dropna(axis = 1, how = 'all')
 
         if freq == 'D':
-            # Create dictionaries for aggregate columns
-            cat_dict = {}
-            number_dict = {}
+            result = self.resampler.resample(result, freq = 'D')
 
-            for col in result.columns:
-                if result[col].dtype == 'object' or result[col].dtype == 'string':
-                    cat_dict[col] = 'last'
-                elif result[col].dtype == 'float64' or result[col].dtype == 'int64':
-                    number_dict[col] = 'median'
 
-            # Combine results
-            transform_variables = {**number_dict, **cat_dict}
+        return result
 
-            # Group information
-            result = result.groupby(pd.Grouper(key = 'Fecha', freq = 'D')).agg(transform_variables).reset_index()
 
+    def _fetch_window_owm(self, lat, lon, start, end, session):
+        """
+        Fetch one window of historical data from OpenWeatherMap, retrying the window if it fails.
 
-        return result
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+            start (int): Start timestamp of the window.
+            end (int): End timestamp of the window.
+            session (requests.Session): Session shared by the downloads.
 
+        Returns:
+            list: Rows of the window.
+        """
+        def fetch():
+            # Every attempt consumes one call of the plan quota
+            self._owm_bucket.acquire()
+            return self._fetch_rows_owm(lat, lon, start, end, session)
 
-    def _fetch_weather_data_single_owm(self, lat, lon, start = None, end = None):
+        return self._owm_retry_policy.call(fetch)
+
+
+    def _fetch_rows_owm(self, lat, lon, start = None, end = None, session = None):
         """
-        Fetch weather data from OpenWeatherMap API for a single location.
+        Fetch weather data from OpenWeatherMap API for a single location as a list of rows.
 
         Args:
             lat (float): Latitude of the location.
             lon (float): Longitude of the location.
             start (int): Start timestamp for historical data retrieval.
             end (int): End timestamp for historical data retrieval.
+            session (requests.Session, optional): Session used for the request. Defaults to None.
 
         Returns:
-            pandas.DataFrame: DataFrame containing weather data.
+            list: One dictionary per timestamp with all the variables.
         """
 
         if start and end:
-            url = self.obj_url.get_url_owm_history_hourly(lat, lon, start, end, self.api_key)
+            url = self.obj_url.get_url_OWM_history_hourly(lat, lon, start, end, self.api_key)
         else:
-            url = self.obj_url.get_url_owm_forecast_hourly(lat, lon, self.api_key)
+            url = self.obj_url.get_url_OWM_forecast_hourly(lat, lon, self.api_key)
 
-        response = requests.get(url)
+        response = (session or requests).get(url)
 
         if response.status_code == 200:
             data = response.json()
@@ -221,16 +341,77 @@ class WeatherAPI:
 
                 data_rows.append(row)
 
-                df_consolidated = pd.DataFrame(data_rows)
-
-
-            return df_consolidated
+            return data_rows
 
         else:
 
+            # Raise HTTP errors with the response so the retry policy can classify them
+            response.raise_for_status()
             raise Exception("Error:", response.status_code)
 
 
+    def _fetch_weather_data_single_owm(self, lat, lon, start = None, end = None):
+        """
+        Fetch weather data from OpenWeatherMap API for a single location.
+
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+            start (int): Start timestamp for historical data retrieval.
+            end (int): End timestamp for historical data retrieval.
+
+        Returns:
+            pandas.DataFrame: DataFrame containing weather data.
+        """
+        return pd.DataFrame(self._fetch_rows_owm(lat, lon, start, end))
+
+
+    @staticmethod
+    def process_aemet(data):
+        """
+        Decode the raw records of the AEMET daily climatological values in a columnar way.
+
+        The frame may hold several stations and years. Times 'HH:MM' become fractional hours, with
+        '24:00' and 'Varias' (several times) mapped to 0, and decimal-comma values become floats,
+        with 'Ip' (inappreciable precipitation) mapped to 0.
+
+        Args:
+            data (pandas.DataFrame): Records as returned by the API.
+
+        Returns:
+            pandas.DataFrame: Decoded data with a 'date' column.
+        """
+        data = data.rename(columns = {'fecha': 'date'})
+        data['date'] = pd.to_datetime(data['date'], format = '%Y-%m-%d')
+
+        # Identify numerical columns and in time format, stations do not report all of them
+        cols_numericas = [col for col in ['altitud', 'tmed', 'prec', 'tmin', 'tmax', 'velmedia', 'racha', 'sol', 'presMax', 'presMin', 'hrMedia', 'hrMax', 'hrMin'] if col in data.columns]
+        cols_horas = [col for col in ['horatmin', 'horatmax', 'horaracha', 'horaPresMax', 'horaPresMin', 'horaHrMax', 'horaHrMin'] if col in data.columns]
+        cols_texto = [col for col in ['indicativo', 'nombre', 'provincia', 'dir'] if col in data.columns]
+
+        # Parse all the numerical columns in a single pass over their flattened values
+        if cols_numericas:
+            values = pd.Series(data[cols_numericas].to_numpy().ravel()).astype(str)
+            values = values.str.replace(',', '.', regex = False).replace('Ip', '0')
+            data[cols_numericas] = pd.to_numeric(values, errors = 'coerce').to_numpy(dtype = 'float64').reshape(len(data), -1)
+
+        # Convert all the times to fractional hours in a single pass, 'HH:MM' is parsed as the number HH.MM
+        if cols_horas:
+            values = pd.Series(data[cols_horas].to_numpy().ravel()).astype(str)
+            clock = pd.to_numeric(values.str.replace(':', '.', regex = False), errors = 'coerce').to_numpy(dtype = 'float64')
+            hours = np.floor(clock) + np.round((clock - np.floor(clock)) * 100) / 60
+
+            sentinels = values.isin(['24:00', 'Varias']).to_numpy()
+            hours[sentinels] = 0
+
+            data[cols_horas] = hours.reshape(len(data), -1)
+
+        for col in cols_texto:
+            data[col] = data[col].str.strip()
+
+        return data
+
+
     def get_history_aemet(self, start_date, end_date, st):
         """
         Retrieve historical weather data from AEMET API.
@@ -243,8 +424,13 @@ class WeatherAPI:
         Returns:
             pandas.DataFrame: DataFrame containing historical weather data.
         """
+        # Reuse the stored data if available
+        stored = self.read_stored(st, 'aemet', start_date, end_date, freq = 'D')
+        if stored is not None:
+            return stored
+
         # Set query parameters
-        api_key = open(self.config["DirResources"]["api_AEMET"]).read().strip()
+        api_key = self.func.read_api_key(self.config["DirResources"]["api_AEMET"])
 
         querystring = {"api_key": api_key}
         
@@ -265,28 +451,13 @@ class WeatherAPI:
             
             if data_response.status_code == 200:
                 
-                aemet_data = pd.DataFrame(data_response.json())
-            
-                aemet_data['fecha'] = pd.to_datetime(aemet_data['fecha'])
-                aemet_data = aemet_data.rename(columns = {'fecha': 'Fecha'})
-                
-                # Identify numerical columns and in time format
-                cols_numericas = ['altitud', 'tmed', 'prec', 'tmin', 'tmax', 'velmedia', 'racha', 'hrMedia', 'hrMax', 'hrMin']
-                for col in cols_numericas:
-                    aemet_data[col] = aemet_data[col].str.replace(',', '.').astype(float)
-                
-                cols_horas = ['horatmin', 'horatmax', 'horaracha', 'horaHrMax', 'horaHrMin']
-                for col in cols_horas:
-                    aemet_data[col] = aemet_data[col].apply(lambda x: 0 if x == '24:00' or x == 'Varias' else pd.to_datetime(x, format = '%H:%M').hour + pd.to_datetime(x, format = '%H:%M').minute / 60)
-                
-                cols_texto = ['indicativo', 'nombre', 'provincia', 'dir']
-                for col in cols_texto:
-                    aemet_data[col] = aemet_data[col].str.strip()
-                    
+                aemet_data = self.process_aemet(pd.DataFrame(data_response.json()))
                 
                 # Make a basic clean over the data    
                 aemet_data = self.func.basic_clean(aemet_data, 'D')
 
+                self.write_stored(aemet_data, st, 'aemet')
+
                 return aemet_data
             
             else:
@@ -299,59 +470,234 @@ class WeatherAPI:
         
     def get_openmeteo_client(self):
         """
-        Function to create and return an OpenMeteoClient instance with a retry-enabled session.
+        Function to return the shared OpenMeteoClient instance with a cached session.
 
-        This function initializes a CachedSession to cache requests and wraps it with retry logic 
-        to handle transient errors gracefully.
+        The client is created on the first call and reused afterwards. Its session caches the
+        requests with the configured backend, with a long expiration for archive data and a short
+        one for forecasts. Transient errors are retried only by the retry policy of the requests.
 
         Returns:
-        - OpenMeteoClient: Instance of OpenMeteoClient configured with retry-enabled session.
+        - OpenMeteoClient: Instance of OpenMeteoClient configured with the cached session.
         """
-        cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-        retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-        
-        return OpenMeteoClient(session = retry_session)
+        with self._client_lock:
+            if self._openmeteo is None:
+                ometeo_config = self.config["OpenMeteo"]
+
+                # Expiration per endpoint, patterns are matched against the URL without scheme
+                urls_expire_after = {}
+                for url, expire_after in [(self.obj_url.get_url_history_ometeo(), ometeo_config["expire_archive"]),
+                                          (self.obj_url.get_url_forecast_ometeo(), ometeo_config["expire_forecast"]),
+                                          (self.obj_url.get_url_forecast_ometeo_alt(), ometeo_config["expire_forecast"])]:
+                    parsed = urlparse(url)
+                    urls_expire_after[parsed.netloc + parsed.path] = expire_after
+
+                cache_session = InstrumentedCachedSession(ometeo_config["cache_name"],
+                                                          backend = ometeo_config["cache_backend"],
+                                                          expire_after = ometeo_config["expire_forecast"],
+                                                          urls_expire_after = urls_expire_after)
+                self._openmeteo_session = cache_session
+                self._openmeteo = OpenMeteoClient(session = cache_session)
+
+        return self._openmeteo
+
+
+    def get_openmeteo_stats(self):
+        """
+        Report the cache hit ratio and the latency per endpoint of the Open-Meteo requests.
+
+        Returns:
+        - DataFrame: Requests, cache hits, hit ratio and latency per endpoint.
+        """
+        if self._openmeteo_session is None:
+            return pd.DataFrame()
+
+        return self._openmeteo_session.get_stats()
     
 
-    def process_response(self, response, variables):
+    def process_response(self, response, variables, dtype = 'float32', as_index = False, clean = True):
         """
         Process the response received from OpenMeteoClient into a DataFrame.
 
+        The variables are copied once from the SDK arrays into a single column-major block and
+        the timestamps are kept as timezone-aware datetimes in Europe/Madrid.
+
         Args:
         - response: The response object from OpenMeteoClient.
         - variables: List of variables to be processed.
+        - dtype: Data type of the variables. Defaults to 'float32', the precision of the API.
+        - as_index: Whether to return the dates as the index instead of a 'date' column. Defaults to False.
+        - clean: Whether to clean the data with basic_clean. Defaults to True.
 
         Returns:
-        - DataFrame: Processed data with variables as columns and timestamps as index.
+        - DataFrame: Processed data with variables as columns and a timezone-aware 'date' column (or index).
         """
+        hourly = response.Hourly()
         
-        # Extract hourly data for each variable from the response and store it in a dictionary
-        hourly_data = {var: response.Hourly().Variables(idx).ValuesAsNumpy() for idx, var in enumerate(variables)}
-                
-        # Convert start and end times to datetime objects in UTC timezone
-        start_time = pd.to_datetime(response.Hourly().Time(), unit = "s", utc = True)
-        end_time = pd.to_datetime(response.Hourly().TimeEnd(), unit = "s", utc = True)
-        interval = pd.Timedelta(seconds = response.Hourly().Interval())
-        
-        # Generate a date range using start and end times with the calculated interval.
-        hourly_data["date"] = pd.date_range(start = start_time, end = end_time, freq = interval, inclusive = 'left')
+        # Extract hourly data for each variable into the columns of a single block
+        first = hourly.Variables(0).ValuesAsNumpy()
+        values = np.empty((len(first), len(variables)), dtype = dtype, order = 'F')
+        values[:, 0] = first
+
+        for idx in range(1, len(variables)):
+            values[:, idx] = hourly.Variables(idx).ValuesAsNumpy()
         
-        df = pd.DataFrame(hourly_data)
+        # Generate the dates from the start time and the interval, then correct the time zone
+        dates = pd.date_range(start = pd.Timestamp(hourly.Time(), unit = 's', tz = 'UTC'), periods = len(first),
+                              freq = pd.Timedelta(seconds = hourly.Interval()), name = 'date').tz_convert('Europe/Madrid')
         
-        # Correct the time zone
-        df["date"] = pd.to_datetime(df['date']).dt.tz_convert('Europe/Madrid').dt.strftime('%Y-%m-%d %H:%M:%S')
+        # The transposed column-major block is C-contiguous, so pandas keeps it without copying
+        df = pd.DataFrame(values, columns = variables, copy = False)
+        df.insert(0, 'date', dates)
 
-        
-        # Reorder columns with 'date' as the first column.
-        columnas = df.columns.tolist()
-        columnas = ['date'] + [col for col in columnas if col != 'date']
-        df = df[columnas]
+        # The dates are regular by construction, so without missing values there is nothing to clean
+        if not np.isnan(values).any():
+            df.attrs['clean_freq'] = 'H'
         
         # Clean data
-        df = self.func.basic_clean(df, freq = 'H')
+        if clean == True:
+            df = self.func.basic_clean(df, freq = 'H')
+
+        if as_index == True:
+            df = df.set_index('date')
         
         return df
-        
+
+
+    def get_ometeo_request(self, kind, start_date = None, end_date = None):
+        """
+        Build the URL, parameters and variables of an Open-Meteo request, without the coordinates.
+
+        Args:
+        - kind: 'history' for archive data, 'forecast' for the permanent forecast or 'forecast_alt'
+          for the ECMWF soil temperature and moisture forecast.
+        - start_date: Start date of the data period (format: "YYYY-MM-DD"), only for 'history'.
+        - end_date: End date of the data period (format: "YYYY-MM-DD"), only for 'history'.
+
+        Returns:
+        - tuple: URL, dictionary of parameters and list of variables.
+        """
+        if kind == 'history':
+            variables = [
+                'temperature_2m', 'relative_humidity_2m', 'dew_point_2m', 'apparent_temperature', 'rain', 
+                'snowfall', 'snow_depth', 'pressure_msl', 'surface_pressure', 'cloud_cover',
+                'cloud_cover_low', 'cloud_cover_mid', 'cloud_cover_high', 'et0_fao_evapotranspiration', 
+                'vapour_pressure_deficit', 'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m', 
+                'sunshine_duration', 'shortwave_radiation', 'direct_radiation', 'diffuse_radiation', 
+                'direct_normal_irradiance', 'global_tilted_irradiance', 'terrestrial_radiation', 'shortwave_radiation_instant', 
+                'direct_radiation_instant', 'diffuse_radiation_instant', 'direct_normal_irradiance_instant', 
+                'global_tilted_irradiance_instant', 'terrestrial_radiation_instant', 'soil_temperature_0_to_7cm', 
+                'soil_moisture_7_to_28cm'
+                ]
+
+            url = self.obj_url.get_url_history_ometeo()
+
+            params = {
+                "start_date": start_date,
+                "end_date": end_date,
+                "hourly": variables,
+                "timezone": "auto",
+                "models": "best_match"
+            }
+
+        elif kind == 'forecast':
+            variables = [
+                "temperature_2m", "relative_humidity_2m", "dew_point_2m", "apparent_temperature",
+                "rain", "snowfall", "snow_depth", "pressure_msl", "surface_pressure",
+                "cloud_cover", "cloud_cover_low", "cloud_cover_mid", "cloud_cover_high", "et0_fao_evapotranspiration", 
+                "vapour_pressure_deficit", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m", 
+                "sunshine_duration", "shortwave_radiation", "direct_radiation", "diffuse_radiation", "direct_normal_irradiance",
+                "global_tilted_irradiance", "terrestrial_radiation", "shortwave_radiation_instant",
+                "direct_radiation_instant", "diffuse_radiation_instant", "direct_normal_irradiance_instant",
+                "global_tilted_irradiance_instant", "terrestrial_radiation_instant"
+            ]
+
+            url = self.obj_url.get_url_forecast_ometeo()
+
+            params = {
+                "hourly": variables,
+                "timezone": "auto",
+                "past_days": 2,
+                "models": "best_match",
+                "forecast_days": 14
+            }
+
+        elif kind == 'forecast_alt':
+            variables = [
+                "soil_temperature_0_to_7cm", "soil_moisture_7_to_28cm"
+            ]
+
+            url = self.obj_url.get_url_forecast_ometeo_alt()
+
+            params = {
+                "hourly": variables,
+                "timezone": "auto",
+                "past_days": 2,
+                "models": "best_match",
+                "forecast_days": 14
+            }
+
+        else:
+            raise ValueError(f"Tipo de petición no válido: {kind}")
+
+        return url, params, variables
+
+
+    def _weather_api(self, url, params):
+        """
+        Send a single request to the Open-Meteo API with the shared client.
+
+        Args:
+        - url: URL of the endpoint.
+        - params: Parameters of the request, including the coordinates.
+
+        Returns:
+        - list: One response per requested location.
+        """
+        return self.get_openmeteo_client().weather_api(url, params = params)
+
+
+    def request_ometeo(self, url, params):
+        """
+        Send a request to the Open-Meteo API, retrying transient errors with the retry policy.
+
+        Args:
+        - url: URL of the endpoint.
+        - params: Parameters of the request, including the coordinates.
+
+        Returns:
+        - list: One response per requested location.
+        """
+        responses = self.retry_policy.call(self._weather_api, url, params)
+
+        # Print metadata information
+        print(f"Coordinates {responses[0].Latitude()}°N {responses[0].Longitude()}°E")
+        print(f"Elevation {responses[0].Elevation()} m asl")
+        print(f"Timezone {responses[0].Timezone()} {responses[0].TimezoneAbbreviation()}")
+        print(f"Timezone difference to GMT+0 {responses[0].UtcOffsetSeconds()} s")
+
+        return responses
+
+
+    async def _gather_ometeo(self, requests_params):
+        """
+        Send several requests to the Open-Meteo API concurrently.
+
+        A request that is backing off does not hold back the others.
+
+        Args:
+        - requests_params: URL and parameters of every request.
+
+        Returns:
+        - list: Responses of every request, in the same order as the requests.
+        """
+        semaphore = asyncio.Semaphore(self.config["OpenMeteo"]["max_concurrency"])
+
+        async def fetch(url, params):
+            async with semaphore:
+                return await self.retry_policy.call_async(self._weather_api, url, params)
+
+        return await asyncio.gather(*[fetch(url, params) for url, params in requests_params])
+
 
     def get_hourly_history_ometeo(self, lat, lon, start_date, end_date):
         """
@@ -366,61 +712,22 @@ class WeatherAPI:
         Returns:
         - DataFrame: Hourly historical weather data for the specified location and time period.
         """
-        # Get an OpenMeteoClient instance
-        openmeteo = self.get_openmeteo_client()
-        
-        # Define variables
-        variables = [
-            'temperature_2m', 'relative_humidity_2m', 'dew_point_2m', 'apparent_temperature', 'rain', 
-            'snowfall', 'snow_depth', 'pressure_msl', 'surface_pressure', 'cloud_cover',
-            'cloud_cover_low', 'cloud_cover_mid', 'cloud_cover_high', 'et0_fao_evapotranspiration', 
-            'vapour_pressure_deficit', 'wind_speed_10m', 'wind_direction_10m', 'wind_gusts_10m', 
-            'sunshine_duration', 'shortwave_radiation', 'direct_radiation', 'diffuse_radiation', 
-            'direct_normal_irradiance', 'global_tilted_irradiance', 'terrestrial_radiation', 'shortwave_radiation_instant', 
-            'direct_radiation_instant', 'diffuse_radiation_instant', 'direct_normal_irradiance_instant', 
-            'global_tilted_irradiance_instant', 'terrestrial_radiation_instant', 'soil_temperature_0_to_7cm', 
-            'soil_moisture_7_to_28cm'
-            ]
-        
-        url = self.obj_url.get_url_history_ometeo()
-        
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": start_date,
-            "end_date": end_date,
-            "hourly": variables,
-            "timezone": "auto",
-            "models": "best_match"
-        }
-        
+        # Reuse the stored data if available
+        location_key = self.get_location_key(lat, lon)
+        stored = self.read_stored(location_key, 'ometeo', start_date, end_date, freq = 'H')
+        if stored is not None:
+            return stored
+
+        url, params, variables = self.get_ometeo_request('history', start_date, end_date)
+        params = {"latitude": lat, "longitude": lon, **params}
+
         # Retrieve responses from OpenMeteo API
-        
-        # Iterate to avoid error due to excessive API calls
-        max_attempts = 5
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                responses = openmeteo.weather_api(url, params = params)
-                
-                # Print metadata information
-                print(f"Coordinates {responses[0].Latitude()}°N {responses[0].Longitude()}°E")
-                print(f"Elevation {responses[0].Elevation()} m asl")
-                print(f"Timezone {responses[0].Timezone()} {responses[0].TimezoneAbbreviation()}")
-                print(f"Timezone difference to GMT+0 {responses[0].UtcOffsetSeconds()} s")
-                
-                return self.process_response(responses[0], variables)
-            
-            except Exception as e:
-                attempts += 1
-                print(f"Ocurrió un error: {e}. Intento {attempts} de {max_attempts}")
-                if attempts < max_attempts:
-                    print("Esperando 70 segundos antes de reintentar...")
-                    time.sleep(70)
-                else:
-                    print("Se alcanzó el máximo de intentos permitidos.")
-                    raise
+        responses = self.request_ometeo(url, params)
+
+        data = self.process_response(responses[0], variables)
+        self.write_stored(data, location_key, 'ometeo')
+
+        return data
             
 
     def get_perm_hourly_forecast_ometeo(self, lat, lon):
@@ -434,61 +741,13 @@ class WeatherAPI:
         Returns:
         - DataFrame: Permanent hourly forecast data for the specified location.
         """
-        
-        # Get an OpenMeteoClient instance
-        openmeteo = self.get_openmeteo_client()
-        
-        # Define variables
-        variables = [
-            "temperature_2m", "relative_humidity_2m", "dew_point_2m", "apparent_temperature",
-            "rain", "snowfall", "snow_depth", "pressure_msl", "surface_pressure",
-            "cloud_cover", "cloud_cover_low", "cloud_cover_mid", "cloud_cover_high", "et0_fao_evapotranspiration", 
-            "vapour_pressure_deficit", "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m", 
-            "sunshine_duration", "shortwave_radiation", "direct_radiation", "diffuse_radiation", "direct_normal_irradiance",
-            "global_tilted_irradiance", "terrestrial_radiation", "shortwave_radiation_instant",
-            "direct_radiation_instant", "diffuse_radiation_instant", "direct_normal_irradiance_instant",
-            "global_tilted_irradiance_instant", "terrestrial_radiation_instant"
-        ]
-        
-        url = self.obj_url.get_url_forecast_ometeo()
-        
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "hourly": variables,
-            "timezone": "auto",
-            "past_days": 2,
-            "models": "best_match",
-            "forecast_days": 14
-        }
-        
+        url, params, variables = self.get_ometeo_request('forecast')
+        params = {"latitude": lat, "longitude": lon, **params}
+
         # Retrieve responses from OpenMeteo API
-        
-        # Iterate to avoid error due to excessive API calls
-        max_attempts = 5
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                responses = openmeteo.weather_api(url, params = params)
-        
-                # Print metadata information
-                print(f"Coordinates {responses[0].Latitude()}°N {responses[0].Longitude()}°E")
-                print(f"Elevation {responses[0].Elevation()} m asl")
-                print(f"Timezone {responses[0].Timezone()} {responses[0].TimezoneAbbreviation()}")
-                print(f"Timezone difference to GMT+0 {responses[0].UtcOffsetSeconds()} s")
-                
-                return self.process_response(responses[0], variables)
-            
-            except Exception as e:
-                attempts += 1
-                print(f"Ocurrió un error: {e}. Intento {attempts} de {max_attempts}")
-                if attempts < max_attempts:
-                    print("Esperando 70 segundos antes de reintentar...")
-                    time.sleep(70)
-                else:
-                    print("Se alcanzó el máximo de intentos permitidos.")
-                    raise
+        responses = self.request_ometeo(url, params)
+
+        return self.process_response(responses[0], variables)
 
 
     def get_alt_hourly_forecast_ometeo(self, lat, lon):
@@ -505,78 +764,142 @@ class WeatherAPI:
         Returns:
         - DataFrame: Hourly forecast data for soil temperature and soil moisture for the specified location.
         """
-        
-        # Get an OpenMeteoClient instance
-        openmeteo = self.get_openmeteo_client()
-        
-        # Define variables to be retrieved
-        variables = [
-            "soil_temperature_0_to_7cm", "soil_moisture_7_to_28cm"
-        ]
-        
-        url = self.obj_url.get_url_forecast_ometeo_alt()
-        
-        
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "hourly": variables,
-            "timezone": "auto",
-            "past_days": 2,
-            "models": "best_match",
-            "forecast_days": 14
-        }
-        
+        url, params, variables = self.get_ometeo_request('forecast_alt')
+        params = {"latitude": lat, "longitude": lon, **params}
+
         # Retrieve responses from OpenMeteo API
-        
-        # Iterate to avoid error due to excessive API calls
-        max_attempts = 5
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                responses = openmeteo.weather_api(url, params = params)
-                
-                # Print metadata information
-                print(f"Coordinates {responses[0].Latitude()}°N {responses[0].Longitude()}°E")
-                print(f"Elevation {responses[0].Elevation()} m asl")
-                print(f"Timezone {responses[0].Timezone()} {responses[0].TimezoneAbbreviation()}")
-                print(f"Timezone difference to GMT+0 {responses[0].UtcOffsetSeconds()} s")
-                
-                return self.process_response(responses[0], variables)
-            
-            except Exception as e:
-                attempts += 1
-                print(f"Ocurrió un error: {e}. Intento {attempts} de {max_attempts}")
-                if attempts < max_attempts:
-                    print("Esperando 70 segundos antes de reintentar...")
-                    time.sleep(70)
-                else:
-                    print("Se alcanzó el máximo de intentos permitidos.")
-                    raise
+        responses = self.request_ometeo(url, params)
 
+        return self.process_response(responses[0], variables)
 
-    def get_hourly_forecast_ometeo(self, lat, lon):
+
+    def get_hourly_batch_ometeo(self, lats, lons, kind = 'history', start_date = None, end_date = None, names = None, stacked = True):
+        """
+        Retrieve hourly Open-Meteo data for many locations with as few requests as possible.
+
+        The locations are sent in groups of at most 'max_locations' (OpenMeteo config) per request,
+        and the API returns one response per location.
+
+        Args:
+        - lats: Latitudes of the locations.
+        - lons: Longitudes of the locations.
+        - kind: 'history', 'forecast' or 'forecast_alt' (see get_ometeo_request).
+        - start_date: Start date of the data period (format: "YYYY-MM-DD"), only for 'history'.
+        - end_date: End date of the data period (format: "YYYY-MM-DD"), only for 'history'.
+        - names: Names of the locations. Defaults to the location keys of the coordinates.
+        - stacked: Whether to return a single frame indexed by (location, date) or a dictionary of frames.
+
+        Returns:
+        - DataFrame or dict: Hourly data of every location.
+        """
+        lats = [float(lat) for lat in lats]
+        lons = [float(lon) for lon in lons]
+
+        if len(lats) != len(lons):
+            raise ValueError("Las listas de latitudes y longitudes deben tener la misma longitud")
+
+        if names is None:
+            names = [self.get_location_key(lat, lon) for lat, lon in zip(lats, lons)]
+
+        url, params, variables = self.get_ometeo_request(kind, start_date, end_date)
+        max_locations = self.config["OpenMeteo"]["max_locations"]
+
+        results = {}
+        pending = []
+
+        # Reuse the stored history and only request the missing locations
+        for pos, (lat, lon) in enumerate(zip(lats, lons)):
+            stored = None
+            if kind == 'history':
+                stored = self.read_stored(self.get_location_key(lat, lon), 'ometeo', start_date, end_date, freq = 'H')
+
+            if stored is not None:
+                results[pos] = stored
+            else:
+                pending.append(pos)
+
+        # Split the locations into requests of a bounded size and send them concurrently
+        chunks = [pending[i:i + max_locations] for i in range(0, len(pending), max_locations)]
+        chunk_params = [{"latitude": [lats[pos] for pos in chunk], "longitude": [lons[pos] for pos in chunk], **params} for chunk in chunks]
+        chunk_responses = self.func.run_coroutine(self._gather_ometeo([(url, params) for params in chunk_params]))
+
+        for chunk, responses in zip(chunks, chunk_responses):
+            # The API returns the responses in the same order as the coordinates
+            for pos, response in zip(chunk, responses):
+                results[pos] = self.process_response(response, variables)
+
+                if kind == 'history':
+                    self.write_stored(results[pos], self.get_location_key(lats[pos], lons[pos]), 'ometeo')
+
+        results = {names[pos]: results[pos] for pos in range(len(lats))}
+
+        if stacked == False:
+            return results
+
+        return pd.concat({name: df.set_index('date') for name, df in results.items()}, names = ['location', 'date'])
+
+
+    def get_forecast_sources(self, extra_models = None):
+        """
+        List the forecast requests combined by get_hourly_forecast_ometeo.
+
+        The permanent forecast and the ECMWF soil forecast are always included. Every extra model
+        is a dictionary with a 'name', the 'variables' to request and optionally the 'url'
+        (defaults to the forecast endpoint) and the Open-Meteo 'models' parameter (defaults to the name).
+
+        Args:
+        - extra_models: Extra models to request. Defaults to the 'extra_models' of the OpenMeteo config.
+
+        Returns:
+        - list: Tuples of suffix of the columns, URL, parameters and variables of every source.
+        """
+        if extra_models is None:
+            extra_models = self.config["OpenMeteo"].get("extra_models") or []
+
+        sources = [('', *self.get_ometeo_request('forecast')),
+                   ('', *self.get_ometeo_request('forecast_alt'))]
+
+        for model in extra_models:
+            url, params, _ = self.get_ometeo_request('forecast')
+            variables = list(model["variables"])
+            params = {**params, "hourly": variables, "models": model.get("models", model["name"])}
+
+            # The columns of the extra models are suffixed with their name to tell them apart
+            sources.append((f"_{model['name']}", model.get("url", url), params, variables))
+
+        return sources
+
+
+    def get_hourly_forecast_ometeo(self, lat, lon, extra_models = None):
         """
         Retrieve hourly forecast data from both permanent and alternative sources and merge them.
 
         This function combines hourly forecast data obtained from two different sources:
-        1. Permanent forecast data retrieved using the 'get_perm_hourly_forecast_ometeo()' function.
-        2. Alternative forecast data retrieved using the 'get_alt_hourly_forecast_ometeo()' function.
+        1. Permanent forecast data (see 'get_perm_hourly_forecast_ometeo()').
+        2. Alternative forecast data (see 'get_alt_hourly_forecast_ometeo()').
+        Extra models are added as more columns. All the sources are requested concurrently and
+        joined on their dates.
 
         Args:
         - lat: Latitude of the location.
         - lon: Longitude of the location.
+        - extra_models: Extra models to request (see 'get_forecast_sources()'). Defaults to the config.
 
         Returns:
-        - DataFrame: Merged hourly forecast data from both sources.
+        - DataFrame: Merged hourly forecast data from all the sources.
         """
-        df1 = self.get_perm_hourly_forecast_ometeo(lat, lon)
-        df2 = self.get_alt_hourly_forecast_ometeo(lat, lon)
-        
-        df = pd.merge(df1, df2, on = 'date', how = 'left')
+        sources = self.get_forecast_sources(extra_models)
+
+        requests_params = [(url, {"latitude": lat, "longitude": lon, **params}) for _, url, params, _ in sources]
+        responses = self.func.run_coroutine(self._gather_ometeo(requests_params))
+
+        frames = [self.process_response(response[0], variables, as_index = True, clean = False).add_suffix(suffix)
+                  for (suffix, _, _, variables), response in zip(sources, responses)]
+
+        # The permanent forecast sets the dates, the other sources are aligned to them
+        df = frames[0].join(frames[1:], how = 'left').reset_index()
         
         # Clean data
         df = self.func.basic_clean(df)
         
-        return(df)
\ No newline at end of file
+        return(df)
@@ -0,0 +1,19 @@
+# Libraries
+import os
+import sys
+
+import pytest
+
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+# The scripts import each other by module name
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture(autouse = True)
+def scripts_dir(monkeypatch):
+    """
+    Runs every test from the scripts folder, where config.yml and the relative paths of the config are resolved.
+    """
+    monkeypatch.chdir(SCRIPTS_DIR)
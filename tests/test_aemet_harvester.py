@@ -0,0 +1,40 @@
+# Libraries
+import pandas as pd
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('pyarrow')
+
+from AemetHarvester import AemetHarvester
+from TimeSeriesStore import TimeSeriesStore
+from Utils import Utils
+
+
+def test_harvest_watermark_stops_at_last_received_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(Utils, 'read_api_key', staticmethod(lambda path: 'key'))
+
+    store = TimeSeriesStore(root = str(tmp_path))
+    harvester = AemetHarvester(store = store, window_days = 10)
+
+    # AEMET has only published the values until 2024-01-15, the last window comes back partly empty
+    published = pd.Timestamp('2024-01-15')
+    requested = []
+
+    async def fetch_window(session, semaphore, limiter, station, start_date, end_date):
+        requested.append((start_date, end_date))
+        dates = pd.date_range(start_date, min(pd.Timestamp(end_date), published), freq = 'D')
+
+        return [{'fecha': date.strftime('%Y-%m-%d'), 'indicativo': station, 'tmed': '10,5', 'prec': 'Ip'} for date in dates]
+
+    monkeypatch.setattr(harvester, '_fetch_window', fetch_window)
+
+    harvester.harvest(['3195'], '2024-01-01', '2024-01-20')
+
+    assert store.get_watermark('3195', 'aemet') == published
+
+    # The next run requests again the days that were not published
+    requested.clear()
+    harvester.harvest(['3195'], '2024-01-01', '2024-01-20')
+
+    assert requested == [('2024-01-16', '2024-01-20')]
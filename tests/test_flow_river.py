@@ -0,0 +1,55 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from FlowRiver import FlowData
+from TimeSeriesStore import TimeSeriesStore
+
+
+def get_flow(start, end):
+    """
+    Hourly flow that changes every hour, so a forward fill and the values of the previous year differ.
+    """
+    dates = pd.date_range(start, end, freq = 'H')
+    return pd.DataFrame({'date': dates, 'flow': 100 + (np.arange(len(dates)) * 37 + dates.dayofyear.to_numpy() * 11) % 89})
+
+
+def get_flow_data(store, csv_end, rtime_start, rtime_end):
+    """
+    FlowData whose CSV files and real-time table are served from the synthetic flow.
+    """
+    flow = FlowData('9001', store = store)
+
+    csv_data = get_flow('2023-01-01', csv_end)
+    rtime_data = get_flow(rtime_start, rtime_end)
+
+    flow.complete_csv_data = lambda concurrent = False: flow.func.basic_clean(csv_data.copy())
+    flow.read_csv_years = lambda years, concurrent = False: [csv_data.loc[csv_data['date'].dt.year == year] for year in years if (csv_data['date'].dt.year == year).any()]
+    flow.real_time_data = lambda mode = 'http': rtime_data.copy()
+
+    return flow
+
+
+def test_incremental_data_matches_rebuild(tmp_path):
+    store = TimeSeriesStore(root = str(tmp_path / 'incremental'))
+    get_flow_data(store, '2024-03-10 23:00', '2024-03-11', '2024-03-20 23:00').unified_data()
+    watermark = store.get_watermark('9001', 'flow')
+
+    # The CSV now covers the old real-time days and the real-time table starts after a gap of two days
+    sources = ('2024-03-20 23:00', '2024-03-23', '2024-03-28 23:00')
+
+    tail = get_flow_data(store, *sources).incremental_data()
+
+    rebuild_store = TimeSeriesStore(root = str(tmp_path / 'rebuild'))
+    get_flow_data(rebuild_store, *sources).unified_data()
+
+    tail_start = watermark - pd.Timedelta(days = 2)
+    expected = rebuild_store.read('9001', 'flow', start = tail_start)
+
+    assert tail['date'].iloc[0] == tail_start
+    assert store.get_watermark('9001', 'flow') == pd.Timestamp('2024-03-28 23:00')
+    pd.testing.assert_frame_equal(store.read('9001', 'flow', start = tail_start), expected)
@@ -0,0 +1,27 @@
+# Libraries
+import pandas as pd
+import numpy as np
+
+import pytest
+
+optuna = pytest.importorskip('optuna')
+pytest.importorskip('lightgbm')
+
+from Tuner import Tuner
+
+
+def test_tune_with_workers_runs_queued_trials_once(tmp_path):
+    dates = pd.date_range('2023-01-01', periods = 200, freq = 'D')
+    y = pd.Series(50 + 10 * np.sin(np.arange(200) / 7) + np.random.default_rng(0).normal(0, 1, 200), index = dates, name = 'flow')
+
+    tuner = Tuner(storage = f"sqlite:///{tmp_path / 'tuning.db'}", workers = 4)
+    tuner.warm_start_trials = 4
+
+    tuner.tune('lgbm', y, n_trials = 6)
+
+    study = tuner.get_study('lgbm', warm_start = False)
+    states = [trial.state for trial in study.trials]
+
+    assert len(states) == 6
+    assert all(state in (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED) for state in states)
+    assert sum(1 for trial in study.trials if trial.user_attrs.get('source') == 'csv') == 4